@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import config.config as config
+from benchmark.synthetic_dataset import generate_synthetic_dataset
+
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_commit_hash():
+    """
+    Get the short hash of the current commit of the repository.
+
+    Returns:
+        str: The commit hash, or "unknown" if it cannot be read.
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY_PATH, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(items, function, *args):
+    """
+    Time a function processing a number of items.
+
+    Args:
+        items (int): Number of items processed by the function (images, steps, operations...).
+        function (callable): Function to time.
+        *args: Arguments of the function.
+
+    Returns:
+        dict: Number of items, elapsed seconds and items per second.
+    """
+    start_time = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start_time
+    return {
+        "items": items,
+        "seconds": round(elapsed, 4),
+        "items_per_sec": round(items / elapsed, 2) if elapsed > 0 else None,
+    }
+
+
+def benchmark_evaluation(num_prediction_images):
+    """
+    Benchmark image decoding, the per-image prediction and the full evaluation.
+
+    Args:
+        num_prediction_images (int): Number of images of the per-image prediction benchmark.
+
+    Returns:
+        dict: Results of each benchmark, in images per second.
+    """
+    from evaluate.evaluate_model import list_evaluation_images, load_image_tensor, prediction_image, predictions_all_entities
+    from model.model import build_model
+    from utils.file_utils import get_entity_list
+
+    img_paths = [img_path for files in list_evaluation_images(config.EVALUATION_IMAGES_PATH).values() for _, img_path in files]
+    classes = get_entity_list()
+    model = build_model()
+
+    def decode():
+        for img_path in img_paths:
+            load_image_tensor(img_path)
+
+    def predict_per_image():
+        for img_path in img_paths[:num_prediction_images]:
+            prediction_image(img_path, model, classes, top_k=config.NUM_ENTITIES)
+
+    # Warm up the model so graph tracing is not timed
+    prediction_image(img_paths[0], model, classes)
+
+    return {
+        "decode": measure(len(img_paths), decode),
+        "prediction_image": measure(min(num_prediction_images, len(img_paths)), predict_per_image),
+        "predictions_all_entities": measure(len(img_paths), predictions_all_entities, model, config.EVALUATION_BATCH_SIZE, False),
+        # The first cached run fills the tensor cache, the second one reads it
+        "predictions_all_entities_cache_fill": measure(len(img_paths), predictions_all_entities, model, config.EVALUATION_BATCH_SIZE, True),
+        "predictions_all_entities_cached": measure(len(img_paths), predictions_all_entities, model, config.EVALUATION_BATCH_SIZE, True),
+    }
+
+
+def benchmark_training(training_steps):
+    """
+    Benchmark the training steps of model/model.py with the native tf.data pipeline
+    and with the former ImageDataGenerator pipeline.
+
+    Args:
+        training_steps (int): Number of timed training steps.
+
+    Returns:
+        dict: Results in training steps per second, and the equivalent images per second.
+    """
+    from model.data_pipeline import build_training_datasets
+    from model.model import build_datasets, build_generators, build_model
+
+    def benchmark_dataset(train_ds, warmup_steps):
+        model = build_model()
+
+        # Warm up so graph tracing (and the tf.data cache fill) is not timed
+        model.fit(train_ds, steps_per_epoch=warmup_steps, epochs=1, verbose=0)
+
+        def fit():
+            model.fit(train_ds, steps_per_epoch=training_steps, epochs=1, verbose=0)
+
+        steps = measure(training_steps, fit)
+        images = dict(steps, items=steps["items"] * config.BATCH_SIZE)
+        images["items_per_sec"] = round(steps["items_per_sec"] * config.BATCH_SIZE, 2) if steps["items_per_sec"] else None
+        return steps, images
+
+    train_ds, _, num_train, _ = build_training_datasets()
+    steps, images = benchmark_dataset(train_ds, num_train // config.BATCH_SIZE + 1)
+    generator_steps, generator_images = benchmark_dataset(build_datasets(*build_generators())[0], 1)
+
+    return {
+        "training_steps": steps,
+        "training_images": images,
+        "training_steps_image_data_generator": generator_steps,
+        "training_images_image_data_generator": generator_images,
+    }
+
+
+def benchmark_file_utils(entities, images_per_entity):
+    """
+    Benchmark the directory operations of utils/file_utils.py on the training split.
+
+    Args:
+        entities (list): Names of the entities.
+        images_per_entity (int): Number of images per entity.
+
+    Returns:
+        dict: Results of each operation, in operations per second.
+    """
+    from utils.file_utils import check_folders_image_quota, count_files_in_directory, get_next_filename, move_files
+
+    entity_dirs = [os.path.join(config.TRAIN_IMAGES_PATH, entity) for entity in entities]
+    moved_dir = os.path.join(config.ENTITIES_DB_PATH, "moved")
+
+    def count_files():
+        for entity_dir in entity_dirs:
+            count_files_in_directory(entity_dir)
+
+    def next_filenames():
+        for entity, entity_dir in zip(entities, entity_dirs):
+            get_next_filename(entity_dir, entity, "jpeg")
+
+    def move_and_restore():
+        for entity, entity_dir in zip(entities, entity_dirs):
+            move_files(entity_dir, os.path.join(moved_dir, entity), 0.20)
+            move_files(os.path.join(moved_dir, entity), entity_dir, 1.0)
+
+    results = {
+        "count_files_in_directory": measure(len(entities), count_files),
+        "check_folders_image_quota": measure(len(entities), check_folders_image_quota, config.TRAIN_IMAGES_PATH, images_per_entity),
+        "get_next_filename": measure(len(entities), next_filenames),
+        "move_files": measure(2 * len(entities), move_and_restore),
+    }
+    shutil.rmtree(moved_dir, ignore_errors=True)
+    return results
+
+
+def run_benchmark_suite(root_dir, num_entities, entities, images_per_entity, training_steps, num_prediction_images):
+    """
+    Run every benchmark on a synthetic dataset, in a spawned process.
+
+    The paths of config/config.py are relative and the number of entities is read from the config,
+    so the process runs from `root_dir` with its own NUM_ENTITIES and the caller is left untouched.
+
+    Args:
+        root_dir (str): Directory of the synthetic dataset.
+        num_entities (int): Number of synthetic entities.
+        entities (list): Names of the synthetic entities.
+        images_per_entity (int): Number of images per entity and split.
+        training_steps (int): Number of timed training steps.
+        num_prediction_images (int): Number of images of the per-image prediction benchmark.
+
+    Returns:
+        dict: Results of each benchmark.
+    """
+    os.chdir(root_dir)
+    config.NUM_ENTITIES = num_entities
+
+    benchmarks = {}
+    benchmarks.update(benchmark_evaluation(num_prediction_images))
+    benchmarks.update(benchmark_training(training_steps))
+    benchmarks.update(benchmark_file_utils(entities, images_per_entity))
+    return benchmarks
+
+
+def run_benchmarks(num_entities, images_per_entity, training_steps=20, num_prediction_images=100, root_dir=None, output_path=None):
+    """
+    Generate a synthetic dataset and run every benchmark on it.
+
+    Args:
+        num_entities (int): Number of synthetic entities.
+        images_per_entity (int): Number of images per entity and split.
+        training_steps (int, optional): Number of timed training steps. Defaults to 20.
+        num_prediction_images (int, optional): Number of images of the per-image prediction benchmark. Defaults to 100.
+        root_dir (str, optional): New directory of the synthetic dataset, kept after the run. Defaults to None (temporary directory).
+        output_path (str, optional): Path of the JSON results. Defaults to None (config.BENCHMARK_RESULTS_PATH/<date>-<commit>.json).
+
+    Returns:
+        dict: Benchmark results with the commit, the date and the dataset parameters.
+    """
+    commit = get_commit_hash()
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    output_path = os.path.abspath(output_path or os.path.join(REPOSITORY_PATH, config.BENCHMARK_RESULTS_PATH, f"{timestamp}-{commit}.json"))
+
+    temporary_dir = None
+    if root_dir is None:
+        temporary_dir = root_dir = tempfile.mkdtemp(prefix="synthetic_entities_")
+
+    try:
+        entities = generate_synthetic_dataset(root_dir, num_entities, images_per_entity)
+
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            benchmarks = executor.submit(run_benchmark_suite, os.path.abspath(root_dir), num_entities, entities,
+                                         images_per_entity, training_steps, num_prediction_images).result()
+    finally:
+        if temporary_dir:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+
+    results = {
+        "commit": commit,
+        "timestamp": timestamp,
+        "dataset": {"num_entities": num_entities, "images_per_entity": images_per_entity},
+        "benchmarks": benchmarks,
+    }
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w') as file:
+        json.dump(results, file, indent=4)
+    print(f"Benchmark results saved to {output_path}")
+
+    return results
+
+
+def compare_benchmark_results(baseline_path, candidate_path):
+    """
+    Compare two benchmark result files.
+
+    Args:
+        baseline_path (str): Path of the baseline results.
+        candidate_path (str): Path of the candidate results.
+
+    Returns:
+        dict: Speedup (candidate items/sec over baseline items/sec) of each benchmark present in both files.
+    """
+    with open(baseline_path, 'r') as file:
+        baseline = json.load(file)["benchmarks"]
+    with open(candidate_path, 'r') as file:
+        candidate = json.load(file)["benchmarks"]
+
+    speedups = {}
+    for name in baseline:
+        if name in candidate and baseline[name]["items_per_sec"] and candidate[name]["items_per_sec"]:
+            speedups[name] = round(candidate[name]["items_per_sec"] / baseline[name]["items_per_sec"], 2)
+    return speedups
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the offline benchmarks on a synthetic image dataset.")
+    parser.add_argument("--entities", type=int, default=10)
+    parser.add_argument("--images", type=int, default=8, help="Images per entity and split.")
+    parser.add_argument("--training-steps", type=int, default=20)
+    parser.add_argument("--prediction-images", type=int, default=100)
+    parser.add_argument("--root-dir", help="Keep the synthetic dataset in this new directory instead of a temporary one.")
+    parser.add_argument("--output", help="Path of the JSON results.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="Compare two result files instead of running.")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(json.dumps(compare_benchmark_results(*args.compare), indent=4))
+    else:
+        results = run_benchmarks(args.entities, args.images, args.training_steps, args.prediction_images, args.root_dir, args.output)
+        print(json.dumps(results, indent=4))
@@ -0,0 +1,94 @@
+import os
+import argparse
+import numpy as np
+from PIL import Image
+
+import config.config as config
+
+
+SPLITS = ("train", "validation", "evaluation")
+
+
+def get_synthetic_entity_names(num_entities):
+    """
+    Get the names of the synthetic entities.
+
+    Args:
+        num_entities (int): Number of entities.
+
+    Returns:
+        list: Entity names, e.g. "entity_000".
+    """
+    return [f"entity_{i:03d}" for i in range(num_entities)]
+
+
+def make_synthetic_image(rng, entity_index, size):
+    """
+    Draw a synthetic image whose colors depend on its entity, with noise on top.
+
+    Args:
+        rng (np.random.Generator): Random generator.
+        entity_index (int): Index of the entity of the image.
+        size (tuple): Width and height of the image.
+
+    Returns:
+        PIL.Image.Image: The generated RGB image.
+    """
+    width, height = size
+    base_color = np.array([(entity_index * 53) % 256, (entity_index * 97) % 256, (entity_index * 151) % 256])
+
+    # Horizontal gradient of the entity color plus random noise
+    gradient = np.linspace(0.5, 1.0, width)[None, :, None]
+    pixels = base_color[None, None, :] * gradient + rng.normal(0, 25, (height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def generate_synthetic_dataset(root_dir, num_entities, images_per_entity, image_size=(320, 240), seed=0):
+    """
+    Write a synthetic image dataset in the layout expected by config/config.py.
+
+    The dataset is written relative to `root_dir`: the entity list goes to
+    config.ENTITIES_NAMES_PATH and the JPEGs to config.ENTITIES_DB_PATH/<split>/<entity>/,
+    so running from `root_dir` makes every module read it instead of the scraped images.
+    A `root_dir` that already has an entity list, such as the repository, is refused.
+
+    Args:
+        root_dir (str): Root directory of the synthetic dataset.
+        num_entities (int): Number of entities (N).
+        images_per_entity (int): Number of JPEGs per entity and split (M).
+        image_size (tuple, optional): Width and height of the images. Defaults to (320, 240).
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        list: Names of the generated entities.
+    """
+    rng = np.random.default_rng(seed)
+    entities = get_synthetic_entity_names(num_entities)
+
+    entities_file = os.path.join(root_dir, config.ENTITIES_NAMES_PATH)
+    if os.path.exists(entities_file):
+        raise FileExistsError(f"{entities_file} already exists, generate the synthetic dataset in a new directory")
+    os.makedirs(os.path.dirname(entities_file), exist_ok=True)
+    with open(entities_file, 'w') as file:
+        file.write("\n".join(entities))
+
+    for split in SPLITS:
+        for entity_index, entity in enumerate(entities):
+            entity_dir = os.path.join(root_dir, config.ENTITIES_DB_PATH, split, entity)
+            os.makedirs(entity_dir, exist_ok=True)
+            for i in range(images_per_entity):
+                make_synthetic_image(rng, entity_index, image_size).save(os.path.join(entity_dir, f"{entity}_{i}.jpeg"), quality=90)
+
+    print(f"Generated {num_entities} entities x {images_per_entity} images x {len(SPLITS)} splits in {root_dir}")
+    return entities
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic train/validation/evaluation image dataset.")
+    parser.add_argument("root_dir")
+    parser.add_argument("--entities", type=int, default=config.NUM_ENTITIES)
+    parser.add_argument("--images", type=int, default=10, help="Images per entity and split.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate_synthetic_dataset(args.root_dir, args.entities, args.images, seed=args.seed)
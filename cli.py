@@ -0,0 +1,402 @@
+import os
+import sys
+import json
+import time
+import argparse
+import functools
+import importlib
+
+import config.config as config
+import utils.profiling as profiling
+
+
+# Import time of each heavy module, filled by lazy_import
+IMPORT_TIMES = {}
+
+
+def lazy_import(module_name):
+    """
+    Import a module when a subcommand needs it and record how long the import took.
+
+    Args:
+        module_name (str): Dotted name of the module.
+
+    Returns:
+        module: The imported module.
+    """
+    already_loaded = module_name in sys.modules
+    start_time = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if not already_loaded:
+        IMPORT_TIMES[module_name] = time.perf_counter() - start_time
+    return module
+
+
+def print_import_report(startup_time):
+    """
+    Print the time spent importing the heavy modules of the subcommand.
+
+    Args:
+        startup_time (float): Time spent before the subcommand started, in seconds.
+    """
+    print("\n--- Import profile ---")
+    print(f"{'startup (cli + config, cpu)':<40} {startup_time * 1000:>10.1f} ms")
+    # Nested modules are included in the time of the module that imported them first
+    for module_name, elapsed in sorted(IMPORT_TIMES.items(), key=lambda item: item[1], reverse=True):
+        print(f"{module_name:<40} {elapsed * 1000:>10.1f} ms")
+    print(f"{'total imports':<40} {sum(IMPORT_TIMES.values()) * 1000:>10.1f} ms")
+
+
+def load_model_version(version, backend=config.INFERENCE_BACKEND):
+    """
+    Load a model version from the versions directory.
+
+    Args:
+        version (str): Version of the model (e.g. "v0.3").
+        backend (str, optional): Inference backend. Defaults to config.INFERENCE_BACKEND.
+
+    Returns:
+        tf.keras.Model or TFLiteModel: The loaded model.
+    """
+    backends = lazy_import("evaluate.backends")
+    return backends.load_inference_model(version, backend)
+
+
+def get_store_key(version, backend):
+    """
+    Get the key of the predictions of a model version and backend in the result store.
+
+    Args:
+        version (str): Version of the model (e.g. "v0.3").
+        backend (str): Inference backend.
+
+    Returns:
+        str: The version for the Keras backend, the version and the backend otherwise.
+    """
+    return version if backend == "keras" else f"{version}-{backend}"
+
+
+def command_scrape(args):
+    """Scrape images for every entity, or for the given ones, into a split directory."""
+    image_scraper = lazy_import("scraper.image_scraper")
+    file_utils = lazy_import("utils.file_utils")
+
+    entities = args.entities or file_utils.get_entity_list()
+    results = image_scraper.scrape_entities(entities, args.max_images, args.save_dir, args.browsers, dedup=not args.no_dedup)
+
+    failed = {entity: result["error"] for entity, result in results.items() if result["status"] == "failed"}
+    print(f"\nScraped {sum(result['images'] for result in results.values())} images for {len(entities) - len(failed)}/{len(entities)} entities")
+    for entity, error in failed.items():
+        print(f"Failed - {entity}: {error}")
+
+
+def command_split(args):
+    """Move a percentage of the images of each entity from one split to another."""
+    file_utils = lazy_import("utils.file_utils")
+
+    for entity in file_utils.get_entity_list():
+        src_dir = os.path.join(args.src_dir, entity)
+        if not os.path.isdir(src_dir):
+            print(f"Exception: There may not be a record for the entity '{entity}'")
+            continue
+        file_utils.move_files(src_dir, os.path.join(args.dest_dir, entity), args.percentage)
+        print(f"Moved {args.percentage:.0%} of '{entity}'")
+
+
+def command_dedup(args):
+    """Index the stored images and report the duplicates within a split and the leaks across splits."""
+    dedup_index = lazy_import("utils.dedup_index")
+
+    connection = dedup_index.open_dedup_index()
+    try:
+        stats = dedup_index.sync_dedup_index(connection, args.splits)
+        groups = dedup_index.find_duplicate_groups(connection, args.max_distance)
+    finally:
+        connection.close()
+
+    print(f"Indexed: {stats['indexed']}, Unchanged: {stats['unchanged']}, Removed: {stats['removed']}")
+    for pair in groups["leaks"]:
+        print(f"Leak ({pair['splits'][0]}/{pair['splits'][1]}, {'exact' if pair['exact'] else 'distance ' + str(pair['distance'])}) - {pair['paths'][0]} | {pair['paths'][1]}")
+    print(f"{len(groups['leaks'])} leaks across splits, {len(groups['duplicates'])} duplicates within a split")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(groups, file, indent=4)
+
+
+def command_train(args):
+    """Train a model version, resuming from its last checkpoint unless --no-resume is given."""
+    model = lazy_import("model.model")
+    build_fn = functools.partial(model.build_model, architecture=args.architecture)
+    _, history = model.train(args.version, args.epochs, args.batch_size, args.patience, args.checkpoint_every,
+                             not args.no_resume, build_fn, args.shards)
+    print(f"Trained {args.version} for {len(history.get('loss', []))} epochs, best validation loss: {min(history.get('val_loss', [float('nan')])):.4f}")
+
+
+def command_train_distributed(args):
+    """Train a model version with several worker processes, or benchmark the scaling efficiency."""
+    distributed = lazy_import("model.distributed")
+    options = {"architecture": args.architecture, "use_shards": args.shards}
+    if args.scaling is not None:
+        distributed.benchmark_scaling(args.scaling or config.DISTRIBUTED_SCALING_WORKERS, threads_per_worker=args.threads, **options)
+    elif args.hosts:
+        distributed.init_worker(args.threads, {})
+        distributed.train_worker(args.hosts, args.task_index, args.version, args.epochs, patience=args.patience, **options)
+    else:
+        distributed.launch_local(args.workers, args.threads, version=args.version, epochs=args.epochs, patience=args.patience, **options)
+
+
+def command_train_head(args):
+    """Retrain only the dense head of a model version on cached convolutional features."""
+    head_training = lazy_import("model.head_training")
+    _, history = head_training.train_head(args.base_version, args.version, args.epochs, warm_start=not args.cold_start)
+    print(f"Trained the head of {args.version} for {len(history.get('loss', []))} epochs, best validation loss: {min(history.get('val_loss', [float('nan')])):.4f}")
+
+
+def command_distill(args):
+    """Distill a model version into a compact student and compare them."""
+    distillation = lazy_import("model.distillation")
+    _, history = distillation.distill(args.teacher, args.student, args.architecture, args.epochs, cache_teacher=not args.online_teacher)
+    print(f"Distilled {args.teacher} into {args.student} for {len(history.get('loss', []))} epochs")
+    report = distillation.evaluate_distillation(args.teacher, args.student)
+    print(json.dumps({version: {key: value for key, value in result.items() if key != "entities"} for version, result in report.items()}, indent=4))
+
+
+def command_sweep(args):
+    """Run a parallel hyperparameter sweep and print its results table."""
+    sweep = lazy_import("model.sweep")
+    results = sweep.run_sweep(epochs=args.epochs, max_workers=args.workers, threads_per_trial=args.threads,
+                              max_trials=args.max_trials, output_path=args.output)
+    sweep.print_results(results)
+
+
+def command_architectures(args):
+    """Report the params, FLOPs, size and CPU latency of the architecture variants."""
+    architectures = lazy_import("model.architectures")
+    report = architectures.report_architectures(args.architectures or tuple(architectures.ARCHITECTURES), tuple(args.batch_sizes))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
+
+
+def command_compile_shards(args):
+    """Compile the image splits into shards of pre-resized images."""
+    dataset_shards = lazy_import("model.dataset_shards")
+    for split_dir in args.splits:
+        _, stats = dataset_shards.compile_split(split_dir, args.encoding, args.force)
+        print(f"{split_dir} - Built: {stats['built']}, Skipped: {stats['skipped']}, Removed: {stats['removed']}")
+
+
+def command_evaluate(args):
+    """Evaluate one or several model versions on the evaluation images."""
+    evaluate_model = lazy_import("evaluate.evaluate_model")
+
+    if args.stream:
+        streaming = lazy_import("evaluate.streaming")
+        model = load_model_version(args.versions[0], args.backend)
+        records = streaming.iter_prediction_records(model, args.batch_size)
+        count = streaming.write_records_jsonl(records, args.stream)
+        print(f"Wrote {count} records to {args.stream}")
+    elif len(args.versions) > 1:
+        comparison = evaluate_model.compare_model_versions(args.versions, args.batch_size, not args.no_cache)
+        print(json.dumps(comparison["overall"], indent=4))
+        if args.metrics:
+            print(json.dumps(comparison["metrics"], indent=4))
+    else:
+        model = load_model_version(args.versions[0], args.backend)
+        model_version = get_store_key(args.versions[0], args.backend)
+        predictions = evaluate_model.predictions_all_entities(model, args.batch_size, not args.no_cache, model_version=model_version)
+        print(json.dumps(predictions, indent=4))
+
+
+def command_plot(args):
+    """Plot the evaluation statistics of a model version."""
+    pd = lazy_import("pandas")
+    graphics = lazy_import("evaluate.graphics")
+
+    if args.records:
+        streaming = lazy_import("evaluate.streaming")
+        global_data, individual_data = graphics.transform_format_records(streaming.read_records_jsonl(args.records))
+    else:
+        evaluate_model = lazy_import("evaluate.evaluate_model")
+        model = load_model_version(args.version)
+        global_data, individual_data = graphics.transform_format_data(evaluate_model.predictions_all_entities(model, model_version=args.version))
+
+    global_df = pd.DataFrame(global_data)
+    individual_df = pd.DataFrame(individual_data)
+
+    graphics.make_bar_plot_avg_scores(global_df)
+    graphics.make_bar_plot_avg_difference_best_scores(global_df)
+    graphics.make_box_plot_avg_score_percentage(individual_df)
+    graphics.make_box_plot_avg_rankings(individual_df)
+
+
+def command_predict(args):
+    """Print the top entities predicted for each image."""
+    evaluate_model = lazy_import("evaluate.evaluate_model")
+    file_utils = lazy_import("utils.file_utils")
+
+    model = load_model_version(args.version, args.backend)
+    classes = file_utils.get_entity_list()
+    for img_path in args.images:
+        prediction = evaluate_model.prediction_image(img_path, model, classes, top_k=args.top_k)
+        print(f"\n{img_path}")
+        for entity, score in prediction:
+            print(f"  {entity:<20} {float(score) * 100:6.2f}%")
+
+
+def command_export_tflite(args):
+    """Export quantized TFLite models of a version and compare them with the Keras model."""
+    tflite_export = lazy_import("model.tflite_export")
+
+    for quantization in args.quantizations:
+        tflite_export.export_tflite(args.version, quantization, args.calibration_images)
+    report = tflite_export.report_tflite_export(args.version, tuple(f"tflite-{quantization}" for quantization in args.quantizations))
+    print(json.dumps(report, indent=4))
+
+
+def build_parser():
+    """
+    Build the command-line parser with one subcommand per pipeline stage.
+
+    Returns:
+        argparse.ArgumentParser: The configured parser.
+    """
+    parser = argparse.ArgumentParser(description="Scrape, split, train, evaluate and plot the entity recognition model.")
+    parser.add_argument("--profile-imports", action="store_true", help="Report the time spent importing heavy modules.")
+    parser.add_argument("--profile", action="store_true", default=config.PROFILING_ENABLED, help="Report the time spent in each stage.")
+    parser.add_argument("--cprofile", metavar="PROF_PATH", default=config.PROFILING_CPROFILE_PATH, help="Dump cProfile statistics of the run.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scrape = subparsers.add_parser("scrape", help="Scrape images for the entities.")
+    scrape.add_argument("--max-images", type=int, default=15)
+    scrape.add_argument("--save-dir", default=config.TRAIN_IMAGES_PATH)
+    scrape.add_argument("--entities", nargs="*", help="Entities to scrape. Defaults to every entity.")
+    scrape.add_argument("--browsers", type=int, default=config.SCRAPER_NUM_BROWSERS, help="Browsers scraping entities concurrently.")
+    scrape.add_argument("--no-dedup", action="store_true", help="Save the images without checking them against the stored ones.")
+    scrape.set_defaults(handler=command_scrape)
+
+    split = subparsers.add_parser("split", help="Move a percentage of each entity's images to another split.")
+    split.add_argument("--percentage", type=float, default=0.20)
+    split.add_argument("--src-dir", default=config.TRAIN_IMAGES_PATH)
+    split.add_argument("--dest-dir", default=config.VALIDATION_IMAGES_PATH)
+    split.set_defaults(handler=command_split)
+
+    dedup = subparsers.add_parser("dedup", help="Report the duplicate images within a split and the leaks across splits.")
+    dedup.add_argument("--splits", nargs="+", default=[config.TRAIN_IMAGES_PATH, config.VALIDATION_IMAGES_PATH, config.EVALUATION_IMAGES_PATH])
+    dedup.add_argument("--max-distance", type=int, default=config.DEDUP_MAX_DISTANCE, help="Maximum Hamming distance between near duplicates, at most 3.")
+    dedup.add_argument("--output", help="Path of the JSON report.")
+    dedup.set_defaults(handler=command_dedup)
+
+    train = subparsers.add_parser("train", help="Train a model version.")
+    train.add_argument("--version", default=config.MODEL_LAST_VERSION)
+    train.add_argument("--epochs", type=int, default=config.TRAINING_EPOCHS)
+    train.add_argument("--batch-size", type=int, default=config.BATCH_SIZE)
+    train.add_argument("--patience", type=int, default=config.TRAINING_EARLY_STOPPING_PATIENCE, help="Epochs without validation loss improvement before stopping.")
+    train.add_argument("--checkpoint-every", type=int, default=config.TRAINING_CHECKPOINT_EVERY, help="Epochs between checkpoints.")
+    train.add_argument("--no-resume", action="store_true", help="Start from scratch instead of the last checkpoint.")
+    train.add_argument("--architecture", default=config.MODEL_ARCHITECTURE, help="Variant of model/architectures.py.")
+    train.add_argument("--shards", action="store_true", default=config.DATASET_SHARDS_ENABLED, help="Read the compiled dataset shards.")
+    train.set_defaults(handler=command_train)
+
+    train_distributed = subparsers.add_parser("train-distributed", help="Train a model version with several data-parallel worker processes.")
+    train_distributed.add_argument("--version", help="Version saved by the chief.")
+    train_distributed.add_argument("--workers", type=int, default=config.DISTRIBUTED_NUM_WORKERS, help="Worker processes launched on this machine.")
+    train_distributed.add_argument("--hosts", nargs="+", help="Addresses (host:port) of the workers of a multi-host cluster, the first one being the chief.")
+    train_distributed.add_argument("--task-index", type=int, default=0, help="Index in --hosts of the worker run by this process.")
+    train_distributed.add_argument("--epochs", type=int, default=config.TRAINING_EPOCHS)
+    train_distributed.add_argument("--patience", type=int, help="Epochs without improvement before stopping.")
+    train_distributed.add_argument("--threads", type=int, default=config.DISTRIBUTED_THREADS_PER_WORKER, help="CPU threads per worker.")
+    train_distributed.add_argument("--architecture", default=config.MODEL_ARCHITECTURE, help="Variant of model/architectures.py.")
+    train_distributed.add_argument("--shards", action="store_true", default=config.DATASET_SHARDS_ENABLED, help="Read the compiled dataset shards.")
+    train_distributed.add_argument("--scaling", nargs="*", type=int, help="Benchmark the scaling efficiency for these worker counts.")
+    train_distributed.set_defaults(handler=command_train_distributed)
+
+    train_head = subparsers.add_parser("train-head", help="Retrain only the dense head of a version on cached features.")
+    train_head.add_argument("--base-version", default=config.MODEL_LAST_VERSION)
+    train_head.add_argument("--version", required=True)
+    train_head.add_argument("--epochs", type=int, default=config.HEAD_TRAINING_EPOCHS)
+    train_head.add_argument("--cold-start", action="store_true", help="Reinitialize the head instead of starting from the base weights.")
+    train_head.set_defaults(handler=command_train_head)
+
+    distill = subparsers.add_parser("distill", help="Distill a model version into a compact student.")
+    distill.add_argument("--teacher", default=config.MODEL_LAST_VERSION)
+    distill.add_argument("--student", required=True)
+    distill.add_argument("--architecture", default=config.DISTILLATION_STUDENT_ARCHITECTURE, help="Variant of model/architectures.py.")
+    distill.add_argument("--epochs", type=int, default=config.TRAINING_EPOCHS)
+    distill.add_argument("--online-teacher", action="store_true", help="Run the teacher on every augmented batch instead of caching its logits.")
+    distill.set_defaults(handler=command_distill)
+
+    sweep = subparsers.add_parser("sweep", help="Run a parallel hyperparameter sweep.")
+    sweep.add_argument("--epochs", type=int, default=config.SWEEP_EPOCHS)
+    sweep.add_argument("--workers", type=int, default=config.SWEEP_MAX_WORKERS)
+    sweep.add_argument("--threads", type=int, default=config.SWEEP_THREADS_PER_TRIAL, help="CPU threads per trial.")
+    sweep.add_argument("--max-trials", type=int, help="Number of combinations sampled from the grid.")
+    sweep.add_argument("--output", help="Path of the CSV results.")
+    sweep.set_defaults(handler=command_sweep)
+
+    architectures = subparsers.add_parser("architectures", help="Report the params, FLOPs, size and CPU latency of the architecture variants.")
+    architectures.add_argument("--architectures", nargs="+", help="Variants of model/architectures.py. Defaults to all of them.")
+    architectures.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    architectures.add_argument("--output", help="Path of the JSON report.")
+    architectures.set_defaults(handler=command_architectures)
+
+    compile_shards = subparsers.add_parser("compile-shards", help="Compile the image splits into shards of pre-resized images.")
+    compile_shards.add_argument("--splits", nargs="+", default=[config.TRAIN_IMAGES_PATH, config.VALIDATION_IMAGES_PATH, config.EVALUATION_IMAGES_PATH])
+    compile_shards.add_argument("--encoding", choices=("jpeg", "raw"), help="Re-encode the shards. Defaults to their current encoding.")
+    compile_shards.add_argument("--force", action="store_true", help="Rebuild every shard.")
+    compile_shards.set_defaults(handler=command_compile_shards)
+
+    evaluate = subparsers.add_parser("evaluate", help="Evaluate model versions on the evaluation images.")
+    evaluate.add_argument("--versions", nargs="+", default=[config.MODEL_LAST_VERSION])
+    evaluate.add_argument("--backend", default=config.INFERENCE_BACKEND, help="Inference backend of a single version: keras, tflite-dynamic or tflite-int8.")
+    evaluate.add_argument("--batch-size", type=int, default=config.EVALUATION_BATCH_SIZE)
+    evaluate.add_argument("--no-cache", action="store_true", help="Decode images instead of using the tensor cache. Streamed evaluations always decode them.")
+    evaluate.add_argument("--stream", metavar="JSONL_PATH", help="Stream the results of the first version to a JSON Lines file.")
+    evaluate.add_argument("--metrics", action="store_true", help="Also print top-k accuracies and confusion matrices.")
+    evaluate.set_defaults(handler=command_evaluate)
+
+    plot = subparsers.add_parser("plot", help="Plot the evaluation statistics.")
+    plot.add_argument("--version", default=config.MODEL_LAST_VERSION)
+    plot.add_argument("--records", metavar="JSONL_PATH", help="Plot from streamed records instead of evaluating.")
+    plot.set_defaults(handler=command_plot)
+
+    predict = subparsers.add_parser("predict", help="Predict the top entities of images.")
+    predict.add_argument("images", nargs="+")
+    predict.add_argument("--version", default=config.MODEL_LAST_VERSION)
+    predict.add_argument("--top-k", type=int, default=5)
+    predict.add_argument("--backend", default=config.INFERENCE_BACKEND, help="Inference backend: keras, tflite-dynamic or tflite-int8.")
+    predict.set_defaults(handler=command_predict)
+
+    export_tflite = subparsers.add_parser("export-tflite", help="Export quantized TFLite models of a version.")
+    export_tflite.add_argument("--version", default=config.MODEL_LAST_VERSION)
+    export_tflite.add_argument("--quantizations", nargs="+", default=["dynamic", "int8"], choices=["dynamic", "int8"])
+    export_tflite.add_argument("--calibration-images", type=int, default=config.TFLITE_CALIBRATION_IMAGES)
+    export_tflite.set_defaults(handler=command_export_tflite)
+
+    return parser
+
+
+def main(argv=None, startup_time=0.0):
+    """
+    Run the subcommand given on the command line.
+
+    Args:
+        argv (list, optional): Command-line arguments. Defaults to None (sys.argv).
+        startup_time (float, optional): Time spent before the subcommand started, in seconds. Defaults to 0.0.
+    """
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        profiling.enable_profiling()
+
+    try:
+        with profiling.profile_run(args.cprofile):
+            args.handler(args)
+    finally:
+        if args.profile_imports:
+            print_import_report(startup_time)
+        if args.profile:
+            profiling.print_profiling_summary()
+
+
+if __name__ == '__main__':
+    main(startup_time=time.process_time())
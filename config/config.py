@@ -22,3 +22,93 @@ VALIDATION_IMAGES_PER_ENTITIES = 50
 
 # Scraper
 MIN_IMAGE_SIZE_THRESHOLD = 5000 # Bytes
+SCRAPER_MAX_IN_FLIGHT = 8 # Concurrent image downloads, also the size of the connection pool
+SCRAPER_CONNECT_TIMEOUT = 5 # Seconds to connect to an image host
+SCRAPER_READ_TIMEOUT = 15 # Seconds without data before a download is abandoned
+SCRAPER_NUM_BROWSERS = 4 # Browsers reused to scrape entities concurrently
+SCRAPER_SCROLL_TIMEOUT = 4 # Maximum seconds waited for new images after a scroll
+SCRAPER_POLL_INTERVAL = 0.1 # Seconds between two checks of the page while waiting
+SCRAPER_MAX_SCROLL_ATTEMPTS = 3 # Scrolls without new content before the collection stops
+
+# Evaluation
+EVALUATION_BATCH_SIZE = 32 # Images per forward pass
+EVALUATION_NUM_WORKERS = 4 # Decode/resize threads
+EVALUATION_PREFETCH_BATCHES = 2 # Batches decoded ahead of inference
+EVALUATION_CACHE_ENABLED = True # Memory-mapped cache of the preprocessed evaluation images
+EVALUATION_CACHE_PATH = f"{IMAGES_PATH}cache/evaluation/"
+EVALUATION_RESULTS_STORE_ENABLED = True # Only predict new or changed images of already evaluated versions
+EVALUATION_RESULTS_DB_PATH = f"{IMAGES_PATH}cache/evaluation_results.sqlite3"
+EVALUATION_RESULTS_PATH = "evaluate/results/" # JSON Lines evaluation results
+
+# Serving
+SERVING_HOST = "127.0.0.1"
+SERVING_PORT = 8000
+SERVING_MAX_BATCH_SIZE = 32 # Images per micro-batch
+SERVING_MAX_WAIT_MS = 10 # Maximum wait for a micro-batch to fill
+SERVING_TOP_K = 5
+SERVING_LATENCY_WINDOW = 10000 # Requests kept for the latency percentiles
+SERVING_MAX_BODY_BYTES = 10 * 1024 * 1024 # Larger uploads are rejected with a 413
+
+# Inference
+INFERENCE_BACKEND = "keras" # "keras", "tflite-dynamic" or "tflite-int8"
+TFLITE_NUM_THREADS = None # None lets the interpreter decide
+TFLITE_CALIBRATION_IMAGES = 200 # Validation images used to calibrate the int8 quantization
+
+# Benchmark
+BENCHMARK_RESULTS_PATH = "benchmark/results/"
+
+# Profiling
+PROFILING_ENABLED = False # Stage timers and counters, near-zero overhead when disabled
+PROFILING_CPROFILE_PATH = None # Path of a cProfile dump of the whole run, e.g. "run.prof"
+
+# Training
+TRAINING_CACHE_ENABLED = True # Keep the decoded and resized images in memory after the first epoch, or a file path
+MODEL_ARCHITECTURE = "baseline" # Variant of model/architectures.py, e.g. "separable-gap" or "mobile"
+TRAINING_EPOCHS = 30 # Maximum number of epochs
+TRAINING_EARLY_STOPPING_PATIENCE = 5 # Epochs without validation loss improvement before stopping
+TRAINING_CHECKPOINT_EVERY = 1 # Epochs between checkpoints
+TRAINING_CHECKPOINTS_PATH = "model/checkpoints/"
+
+# Dataset shards
+DATASET_SHARDS_ENABLED = False # Train and evaluate from the compiled shards instead of the scraped images
+DATASET_SHARDS_PATH = f"{IMAGES_PATH}shards/"
+DATASET_SHARDS_ENCODING = "jpeg" # "jpeg" (re-encoded, small) or "raw" (uint8, no decoding, same pixels as the tensor cache)
+DATASET_SHARDS_JPEG_QUALITY = 95
+
+# Head training
+FEATURE_CACHE_PATH = f"{IMAGES_PATH}cache/features/" # Flattened convolutional features of each base version
+HEAD_TRAINING_EPOCHS = 50 # Maximum number of epochs, epochs on cached features take seconds
+HEAD_TRAINING_BATCH_SIZE = 64
+
+# Sweep
+SWEEP_SEARCH_SPACE = {
+    "batch_size": [16, 32],
+    "learning_rate": [0.001, 0.0003],
+    "augmentation_strength": [0.5, 1.0], # Factor of the rotation/shift/shear/zoom ranges
+    "width_multiplier": [0.5, 1.0], # Factor of the filters and units of the CNN
+}
+SWEEP_EPOCHS = 10 # Maximum number of epochs per trial
+SWEEP_MAX_WORKERS = 4 # Trials run in parallel
+SWEEP_THREADS_PER_TRIAL = 2 # CPU threads of each trial, workers x threads should not exceed the cores
+SWEEP_PRUNING_WARMUP_EPOCHS = 2 # Epochs run before a trial can be pruned
+SWEEP_PRUNING_MIN_TRIALS = 3 # Other trials reported at an epoch before pruning against their median
+SWEEP_RESULTS_PATH = "model/sweeps/"
+
+# Distillation
+DISTILLATION_STUDENT_ARCHITECTURE = "mobile" # Variant of model/architectures.py
+DISTILLATION_TEMPERATURE = 4.0 # Softening of the teacher and student distributions
+DISTILLATION_ALPHA = 0.1 # Weight of the true labels, the rest goes to the teacher outputs
+DISTILLATION_CACHE_TEACHER = True # Run the teacher once over the original images instead of on every augmented batch
+DISTILLATION_AUGMENT = True # Augment the training images of the student
+
+# Distributed training
+DISTRIBUTED_NUM_WORKERS = 2 # Worker processes launched on this machine
+DISTRIBUTED_THREADS_PER_WORKER = 8 # CPU threads of each worker, workers x threads should not exceed the cores
+DISTRIBUTED_BATCH_SIZE_PER_WORKER = 16 # The global batch grows with the number of workers
+DISTRIBUTED_SCALING_WORKERS = [1, 2, 4, 8] # Worker counts of the scaling benchmark
+DISTRIBUTED_SCALING_EPOCHS = 3 # Epochs per worker count, the first one is not timed
+
+# Dedup index
+DEDUP_ENABLED = True # Check the scraped images against the stored ones before writing them
+DEDUP_INDEX_DB_PATH = f"{IMAGES_PATH}cache/dedup_index.sqlite3"
+DEDUP_MAX_DISTANCE = 3 # Maximum Hamming distance between the dHash of near duplicates, at most 3 to be found by the 4 bands
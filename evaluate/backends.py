@@ -0,0 +1,112 @@
+import numpy as np
+import tensorflow as tf
+
+import config.config as config
+
+# The standalone LiteRT interpreter replaces tf.lite.Interpreter in recent TensorFlow versions
+try:
+    from ai_edge_litert.interpreter import Interpreter
+except ImportError:
+    Interpreter = tf.lite.Interpreter
+
+INFERENCE_BACKENDS = ("keras", "tflite-dynamic", "tflite-int8")
+
+
+class TFLiteModel:
+    """
+    TFLite interpreter exposing the prediction methods of a Keras model.
+
+    The evaluation functions, the prediction service and any batch predictor only call
+    `predict` and `predict_on_batch`, so they can run on the interpreter unchanged.
+    """
+
+    def __init__(self, model_path, num_threads=config.TFLITE_NUM_THREADS):
+        self.model_path = model_path
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+
+    def predict_on_batch(self, img_batch):
+        """
+        Run a single forward pass of the interpreter over a batch of image tensors.
+
+        Args:
+            img_batch (np.ndarray): Preprocessed image tensors of shape (batch_size, 150, 150, 3).
+
+        Returns:
+            np.ndarray: Prediction scores of shape (batch_size, num_classes).
+        """
+        img_batch = np.asarray(img_batch, dtype=np.float32)
+
+        # Resize the input only when the batch size changes
+        if img_batch.shape[0] != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_details["index"], img_batch.shape)
+            self.interpreter.allocate_tensors()
+            self.input_details = self.interpreter.get_input_details()[0]
+            self.output_details = self.interpreter.get_output_details()[0]
+            self.batch_size = img_batch.shape[0]
+
+        # Quantize the input if the model takes integer tensors
+        input_scale, input_zero_point = self.input_details["quantization"]
+        if self.input_details["dtype"] != np.float32:
+            img_batch = np.round(img_batch / input_scale + input_zero_point).astype(self.input_details["dtype"])
+
+        self.interpreter.set_tensor(self.input_details["index"], img_batch)
+        self.interpreter.invoke()
+        scores = self.interpreter.get_tensor(self.output_details["index"])
+
+        # Dequantize the output if the model returns integer tensors
+        output_scale, output_zero_point = self.output_details["quantization"]
+        if self.output_details["dtype"] != np.float32:
+            scores = (scores.astype(np.float32) - output_zero_point) * output_scale
+
+        return scores
+
+    def predict(self, img_batch, verbose=0):
+        """
+        Predict the scores of a batch of image tensors, like tf.keras.Model.predict.
+
+        Args:
+            img_batch (np.ndarray): Preprocessed image tensors of shape (batch_size, 150, 150, 3).
+            verbose (int, optional): Unused, kept for compatibility with Keras. Defaults to 0.
+
+        Returns:
+            np.ndarray: Prediction scores of shape (batch_size, num_classes).
+        """
+        return self.predict_on_batch(img_batch)
+
+
+def get_model_path(version, backend=config.INFERENCE_BACKEND):
+    """
+    Get the path of the file of a model version for an inference backend.
+
+    Args:
+        version (str): Version of the model (e.g. "v0.3").
+        backend (str, optional): One of INFERENCE_BACKENDS. Defaults to config.INFERENCE_BACKEND.
+
+    Returns:
+        str: Path of the .keras or .tflite file.
+    """
+    if backend == "keras":
+        return f"{config.MODEL_VERSIONS_PATH}{version}.keras"
+    if backend in INFERENCE_BACKENDS:
+        return f"{config.MODEL_VERSIONS_PATH}{version}-{backend.split('-')[1]}.tflite"
+    raise ValueError(f"Unknown inference backend '{backend}', expected one of {INFERENCE_BACKENDS}")
+
+
+def load_inference_model(version, backend=config.INFERENCE_BACKEND):
+    """
+    Load a model version on an inference backend.
+
+    Args:
+        version (str): Version of the model (e.g. "v0.3").
+        backend (str, optional): One of INFERENCE_BACKENDS. Defaults to config.INFERENCE_BACKEND.
+
+    Returns:
+        tf.keras.Model or TFLiteModel: Model exposing `predict` and `predict_on_batch`.
+    """
+    model_path = get_model_path(version, backend)
+    if backend == "keras":
+        return tf.keras.models.load_model(model_path)
+    return TFLiteModel(model_path)
@@ -1,10 +1,17 @@
 import os
+import time
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.preprocessing import image # type: ignore
 
 import config.config as config
+from evaluate.input_pipeline import iter_image_batches
+from evaluate.result_store import get_content_hashes, invalidate_changed_model, load_stored_scores, open_result_store, save_scores
+from model.dataset_shards import get_shard_batches, get_shards_dir, load_shard_index
+from evaluate.metrics import build_label_vector, calculate_statistics_vectorized, summarize_metrics, true_class_ranks, true_class_scores
+from evaluate.tensor_cache import get_cached_image_arrays, iter_cached_batches
 from utils.file_utils import get_entity_list
+from utils.profiling import timed, timer
 
 
 def get_entity_score_and_ranking(prediction, chosen_entity):
@@ -73,6 +80,54 @@ def calculate_statistics(scores, ranks, differences):
     }
 
 
+@timed("evaluate.decode")
+def load_image_tensor(img_path):
+    """
+    Load an image from disk and preprocess it for the model.
+
+    Args:
+        img_path (str): Path to the image file.
+
+    Returns:
+        np.ndarray: Image tensor of shape (150, 150, 3) scaled to [0, 1].
+    """
+    img = image.load_img(img_path, target_size=(150, 150))
+    img_tensor = image.img_to_array(img)
+    img_tensor /= 255.0
+    return img_tensor
+
+
+def rank_prediction(scores, classes, top_k=10):
+    """
+    Rank the class scores of a single prediction.
+
+    Args:
+        scores (np.ndarray): Prediction scores, one per class.
+        classes (list): List of class names.
+        top_k (int, optional): Number of top predictions to return. Defaults to 10.
+
+    Returns:
+        list: List of tuples containing class names and their respective prediction scores.
+    """
+    top_indices = np.argsort(scores)[::-1][:top_k]
+    return [(classes[i], scores[i]) for i in top_indices]
+
+
+@timed("evaluate.predict")
+def predict_batch(model, img_batch):
+    """
+    Run a single forward pass of the model over a batch of image tensors.
+
+    Args:
+        model (tf.keras.Model): Trained model for prediction.
+        img_batch (np.ndarray): Preprocessed image tensors of shape (batch_size, 150, 150, 3).
+
+    Returns:
+        np.ndarray: Prediction scores of shape (batch_size, num_classes).
+    """
+    return np.asarray(model.predict_on_batch(img_batch))
+
+
 def prediction_image(img_path, model, classes, top_k=10):
     """
     Predict the top classes for an image using a trained model.
@@ -87,103 +142,482 @@ def prediction_image(img_path, model, classes, top_k=10):
         list: List of tuples containing class names and their respective prediction scores.
     """
     # Load and preprocess the image
-    img = image.load_img(img_path, target_size=(150, 150))
-    img_tensor = image.img_to_array(img)
-    img_tensor = np.expand_dims(img_tensor, axis=0)
-    img_tensor /= 255.0
+    img_tensor = np.expand_dims(load_image_tensor(img_path), axis=0)
 
     # Predict and get the top k predictions
     predictions = model.predict(img_tensor)[0]
-    top_indices = np.argsort(predictions)[::-1][:top_k]
 
     # Create a list of top k class predictions with scores
-    ranked_classes = [(classes[i], predictions[i]) for i in top_indices]
-
-    return ranked_classes
+    return rank_prediction(predictions, classes, top_k)
 
 
-def predictions_all_entities(model):
+def list_evaluation_images(root_path=config.EVALUATION_IMAGES_PATH):
     """
-    Predict classes for all images in the specified directory and calculate statistics.
+    List the evaluation images grouped by entity folder.
 
     Args:
-        model (tf.keras.Model): Trained model for prediction.
+        root_path (str): Directory containing one folder per entity.
 
     Returns:
-        dict: Dictionary containing predictions and statistics for each entity.
+        dict: Dictionary mapping each entity name to a list of (filename, image path) tuples.
     """
-    # Dictionary to store predictions and statistics for each entity
-    predictions = {}
-    
-    root_path = config.EVALUATION_IMAGES_PATH
+    entity_files = {}
 
     for root_folder, _, files in os.walk(root_path):
         # Skip the parent folder itself
         if root_folder == root_path:
             continue
-        
+
         entity_name = os.path.basename(root_folder)
-        
-        # Dictionary to store predictions for the current entity
-        entity_predictions = {}
-        
-        # Lists to store scores, rankings, and score differences
-        scores = []
-        ranks = []
-        score_diffs = []
-
-        print(f"\n--- Start prediction for: {entity_name} ---")
-
-        for file in files:
-            img_path = os.path.join(root_folder, file)
-            
-            # Predict the image and get the top predictions
-            prediction = prediction_image(img_path, model, get_entity_list(), top_k=config.NUM_ENTITIES)
-            
-            # Get the score and ranking of the current entity in the predictions
-            score, rank = get_entity_score_and_ranking(prediction, entity_name)
-            
-            # Dictionary to store prediction information for the current image
-            prediction_info = {}
-
-            # Handle score and ranking information
-            if score:
-                score_pct = round(score * 100, 2)
-                prediction_info["score"] = score_pct
-                scores.append(score_pct)
-            else:
-                prediction_info["score"] = 0
-                scores.append(0)
-
-            if rank:
-                prediction_info["rank"] = rank
-                ranks.append(rank)
-            else:
-                prediction_info["rank"] = config.NUM_ENTITIES
-                ranks.append(config.NUM_ENTITIES)
-
-            # Handle best entity and score difference information
-            if rank and rank > 1:
-                best_entity, best_score = prediction[0]
-                diff_best_score_pct = round((best_score - score) * 100, 2)
-                prediction_info["best_entity"] = best_entity
-                prediction_info["best_score"] = round(best_score * 100, 2)
-                prediction_info["diff_with_best_score"] = diff_best_score_pct
-                score_diffs.append(diff_best_score_pct)
-            else:
-                score_diffs.append(0)
-
-            # Add the prediction information to the entity predictions dictionary
-            entity_predictions[file] = prediction_info
-
-        # Calculate and add statistics for the current entity
-        stats = calculate_statistics(scores, ranks, score_diffs)
-        stats.update(entity_predictions)
+        entity_files[entity_name] = [(file, os.path.join(root_folder, file)) for file in files]
+
+    return entity_files
+
+
+def build_prediction_info(prediction, entity_name):
+    """
+    Build the prediction information of an image for its true entity.
+
+    Args:
+        prediction (list): List of tuples with class names and scores, best first.
+        entity_name (str): The true entity of the image.
+
+    Returns:
+        tuple: Prediction information dict, score (%), rank and difference with the best score (%).
+    """
+    # Get the score and ranking of the current entity in the predictions
+    score, rank = get_entity_score_and_ranking(prediction, entity_name)
+
+    # Dictionary to store prediction information for the current image
+    prediction_info = {}
+
+    # Handle score and ranking information
+    score_pct = round(score * 100, 2) if score else 0
+    prediction_info["score"] = score_pct
+
+    prediction_info["rank"] = rank if rank else config.NUM_ENTITIES
+
+    # Handle best entity and score difference information
+    diff_best_score_pct = 0
+    if rank and rank > 1:
+        best_entity, best_score = prediction[0]
+        diff_best_score_pct = round((best_score - score) * 100, 2)
+        prediction_info["best_entity"] = best_entity
+        prediction_info["best_score"] = round(best_score * 100, 2)
+        prediction_info["diff_with_best_score"] = diff_best_score_pct
+
+    return prediction_info, score_pct, prediction_info["rank"], diff_best_score_pct
+
+
+def iter_evaluation_batches(samples, batch_size=config.EVALUATION_BATCH_SIZE, use_cache=config.EVALUATION_CACHE_ENABLED):
+    """
+    Yield batches of preprocessed evaluation images.
+
+    With the dataset shards enabled, only raw shards are read: they hold the same pixels as the
+    image files, while JPEG shards would change the scores.
+
+    Args:
+        samples (list): List of (entity name, filename, image path) tuples.
+        batch_size (int, optional): Number of images per batch. Defaults to config.EVALUATION_BATCH_SIZE.
+        use_cache (bool, optional): Whether to use the tensor cache. Defaults to config.EVALUATION_CACHE_ENABLED.
+
+    Returns:
+        iterator: Iterator of (batch samples, image tensors) tuples.
+    """
+    if config.DATASET_SHARDS_ENABLED:
+        # JPEG shards hold re-encoded pixels, their scores would be stored under the content hash of the original files
+        encoding = load_shard_index(get_shards_dir(config.EVALUATION_IMAGES_PATH))["encoding"]
+        shard_batches = get_shard_batches(samples, config.EVALUATION_IMAGES_PATH, batch_size) if encoding == "raw" else None
+        if shard_batches is not None:
+            return shard_batches
+        if encoding == "raw":
+            print("Dataset shards - Some images are not in the evaluation shards, reading the image files")
+        else:
+            print(f"Dataset shards - The evaluation shards are {encoding}-encoded, reading the original pixels instead")
+
+    if use_cache:
+        blob, slots, cache_stats = get_cached_image_arrays([img_path for _, _, img_path in samples])
+        print(f"Tensor cache - Hits: {cache_stats['hits']}, Misses: {cache_stats['misses']}, Evicted: {cache_stats['evicted']}")
+        return iter_cached_batches(samples, blob, slots, batch_size)
+    return iter_image_batches(samples, load_image_tensor, batch_size)
+
+
+def predict_score_matrices(models, samples, batch_size=config.EVALUATION_BATCH_SIZE, use_cache=config.EVALUATION_CACHE_ENABLED):
+    """
+    Predict the scores of every evaluation image with several models.
+
+    Each batch of images is decoded once and fed to every model.
+
+    Args:
+        models (dict): Dictionary mapping a model name (e.g. its version) to a trained model.
+        samples (list): List of (entity name, filename, image path) tuples.
+        batch_size (int, optional): Number of images per forward pass. Defaults to config.EVALUATION_BATCH_SIZE.
+        use_cache (bool, optional): Whether to use the tensor cache. Defaults to config.EVALUATION_CACHE_ENABLED.
+
+    Returns:
+        dict: Dictionary mapping each model name to its score matrix of shape (len(samples), num_classes).
+    """
+    score_matrices = {name: None for name in models}
+
+    predicted_count = 0
+    for batch, img_batch in iter_evaluation_batches(samples, batch_size, use_cache):
+        for name, model in models.items():
+            batch_scores = predict_batch(model, img_batch)
+            if score_matrices[name] is None:
+                score_matrices[name] = np.empty((len(samples), batch_scores.shape[1]), dtype=np.float32)
+            score_matrices[name][predicted_count:predicted_count + len(batch)] = batch_scores
+
+        predicted_count += len(batch)
+        print(f"Predicted {predicted_count}/{len(samples)} images")
+
+    for name in models:
+        if score_matrices[name] is None:
+            score_matrices[name] = np.empty((0, config.NUM_ENTITIES), dtype=np.float32)
+
+    return score_matrices
+
+
+def predict_score_matrices_incremental(models, samples, batch_size=config.EVALUATION_BATCH_SIZE, use_cache=config.EVALUATION_CACHE_ENABLED):
+    """
+    Predict the scores of every evaluation image, reusing the scores stored by previous evaluations.
+
+    Stored scores are keyed by model version and image content hash, so only new or changed
+    images are predicted. The scores of a version whose model file changed are predicted again.
+
+    Args:
+        models (dict): Dictionary mapping a model version to a trained model.
+        samples (list): List of (entity name, filename, image path) tuples.
+        batch_size (int, optional): Number of images per forward pass. Defaults to config.EVALUATION_BATCH_SIZE.
+        use_cache (bool, optional): Whether to use the tensor cache. Defaults to config.EVALUATION_CACHE_ENABLED.
+
+    Returns:
+        dict: Dictionary mapping each model version to its score matrix of shape (len(samples), num_classes).
+    """
+    connection = open_result_store()
+    try:
+        for version in models:
+            if invalidate_changed_model(connection, version):
+                print(f"Result store - The model {version} changed, its stored predictions were deleted")
+        content_hashes = get_content_hashes(connection, [img_path for _, _, img_path in samples])
+        stored_scores = {version: load_stored_scores(connection, version, content_hashes) for version in models}
+
+        # Predict the images missing for at least one version
+        missing_indices = [
+            i for i, content_hash in enumerate(content_hashes)
+            if any(content_hash not in stored_scores[version] for version in models)
+        ]
+        print(f"Result store - Stored: {len(samples) - len(missing_indices)}, To predict: {len(missing_indices)}")
+
+        new_scores = {}
+        if missing_indices:
+            missing_samples = [samples[i] for i in missing_indices]
+            missing_hashes = [content_hashes[i] for i in missing_indices]
+            new_scores = predict_score_matrices(models, missing_samples, batch_size, use_cache)
+            for version, score_matrix in new_scores.items():
+                save_scores(connection, version, missing_hashes, score_matrix)
+    finally:
+        connection.close()
+
+    score_matrices = {}
+    for version in models:
+        score_matrix = np.empty((len(samples), config.NUM_ENTITIES), dtype=np.float32)
+        for i, content_hash in enumerate(content_hashes):
+            if content_hash in stored_scores[version]:
+                score_matrix[i] = stored_scores[version][content_hash]
+        if missing_indices:
+            score_matrix[missing_indices] = new_scores[version]
+        score_matrices[version] = score_matrix
+
+    return score_matrices
+
+
+def build_prediction_infos(score_matrix, labels, classes):
+    """
+    Build the prediction information of each image from a score matrix.
+
+    Args:
+        score_matrix (np.ndarray): Prediction scores of shape (N, num_classes).
+        labels (np.ndarray): True class index of each image, -1 if unknown.
+        classes (list): List of class names.
+
+    Returns:
+        tuple: List of prediction information dicts, and arrays of scores (%), ranks and differences with the best score (%).
+    """
+    # Scaled and rounded in float64 like the Python floats of the per-image evaluation, float32 rounding gives 87.6500015258789
+    score_matrix = np.asarray(score_matrix, dtype=np.float64)
+
+    # Per-image true class scores, ranks and differences with the best score, all in %
+    true_scores = np.nan_to_num(true_class_scores(score_matrix, labels))
+    ranks = true_class_ranks(score_matrix, labels)
+    best_indices = np.argmax(score_matrix, axis=1)
+    best_scores = score_matrix.max(axis=1)
+
+    scores_pct = np.round(true_scores * 100, 2)
+    best_scores_pct = np.round(best_scores * 100, 2)
+    diffs_pct = np.where((labels >= 0) & (ranks > 1), np.round((best_scores - true_scores) * 100, 2), 0)
+
+    prediction_infos = []
+    for i in range(len(labels)):
+        prediction_info = {"score": float(scores_pct[i]), "rank": int(ranks[i])}
+        if labels[i] >= 0 and ranks[i] > 1:
+            prediction_info["best_entity"] = classes[best_indices[i]]
+            prediction_info["best_score"] = float(best_scores_pct[i])
+            prediction_info["diff_with_best_score"] = float(diffs_pct[i])
+        prediction_infos.append(prediction_info)
+
+    return prediction_infos, scores_pct, ranks, diffs_pct
+
+
+def build_entity_predictions(score_matrix, labels, samples, entity_names, classes):
+    """
+    Build the predictions and statistics of each entity from a score matrix.
+
+    Args:
+        score_matrix (np.ndarray): Prediction scores of shape (len(samples), num_classes).
+        labels (np.ndarray): True class index of each sample, -1 if unknown.
+        samples (list): List of (entity name, filename, image path) tuples, grouped by entity.
+        entity_names (list): Evaluated entities, in output order.
+        classes (list): List of class names.
+
+    Returns:
+        dict: Dictionary containing predictions and statistics for each entity.
+    """
+    prediction_infos, scores_pct, ranks, diffs_pct = build_prediction_infos(score_matrix, labels, classes)
+
+    predictions = {}
+    start = 0
+    for entity_name in entity_names:
+        # Samples of an entity are contiguous
+        end = start
+        while end < len(samples) and samples[end][0] == entity_name:
+            end += 1
+
+        stats = calculate_statistics_vectorized(scores_pct[start:end], ranks[start:end], diffs_pct[start:end])
+        for i in range(start, end):
+            stats[samples[i][1]] = prediction_infos[i]
+
         predictions[entity_name] = stats
+        start = end
 
     return predictions
 
-        
 
+def predictions_all_models(models, batch_size=config.EVALUATION_BATCH_SIZE, use_cache=config.EVALUATION_CACHE_ENABLED,
+                           use_store=config.EVALUATION_RESULTS_STORE_ENABLED):
+    """
+    Predict classes for all evaluation images with several models and calculate statistics.
+
+    Each batch of images is decoded once and fed to every model.
+
+    Args:
+        models (dict): Dictionary mapping a model name (e.g. its version) to a trained model.
+        batch_size (int, optional): Number of images per forward pass. Defaults to config.EVALUATION_BATCH_SIZE.
+        use_cache (bool, optional): Whether to use the tensor cache. Defaults to config.EVALUATION_CACHE_ENABLED.
+        use_store (bool, optional): Whether to reuse stored predictions. Defaults to config.EVALUATION_RESULTS_STORE_ENABLED.
+
+    Returns:
+        dict: Dictionary mapping each model name to its predictions and statistics for each entity.
+    """
+    predictions, _ = evaluate_all_models(models, batch_size, use_cache, use_store)
+    return predictions
+
+
+def evaluate_all_models(models, batch_size=config.EVALUATION_BATCH_SIZE, use_cache=config.EVALUATION_CACHE_ENABLED,
+                        use_store=config.EVALUATION_RESULTS_STORE_ENABLED):
+    """
+    Predict classes for all evaluation images with several models and calculate statistics and metrics.
+
+    Args:
+        models (dict): Dictionary mapping a model name (e.g. its version) to a trained model.
+        batch_size (int, optional): Number of images per forward pass. Defaults to config.EVALUATION_BATCH_SIZE.
+        use_cache (bool, optional): Whether to use the tensor cache. Defaults to config.EVALUATION_CACHE_ENABLED.
+        use_store (bool, optional): Whether to reuse stored predictions. Defaults to config.EVALUATION_RESULTS_STORE_ENABLED.
+
+    Returns:
+        tuple: Predictions and statistics for each entity, and global metrics (top-k accuracies,
+               score gap, confusion matrix), each as a dictionary keyed by model name.
+    """
+    classes = get_entity_list()
+    entity_files = list_evaluation_images(config.EVALUATION_IMAGES_PATH)
+
+    # Flatten the images of every entity so batches can span several entities
+    samples = [(entity_name, file, img_path) for entity_name, files in entity_files.items() for file, img_path in files]
+    labels = build_label_vector([entity_name for entity_name, _, _ in samples], classes)
+
+    if use_store:
+        score_matrices = predict_score_matrices_incremental(models, samples, batch_size, use_cache)
+    else:
+        score_matrices = predict_score_matrices(models, samples, batch_size, use_cache)
+
+    predictions = {}
+    metrics = {}
+    for name, score_matrix in score_matrices.items():
+        with timer("evaluate.stats"):
+            predictions[name] = build_entity_predictions(score_matrix, labels, samples, list(entity_files), classes)
+            metrics[name] = summarize_metrics(score_matrix, labels, classes)
+
+    return predictions, metrics
+
+
+def predictions_all_entities(model, batch_size=config.EVALUATION_BATCH_SIZE, use_cache=config.EVALUATION_CACHE_ENABLED, model_version=None):
+    """
+    Predict classes for all images in the specified directory and calculate statistics.
+
+    Images are decoded on a worker pool, collected into batches and each batch goes through
+    a single forward pass while the next batches are being decoded. With the tensor cache,
+    images decoded by a previous evaluation are read from the memory-mapped cache instead.
+    When the model version is given, only the images without stored predictions for that
+    version are predicted.
+
+    Args:
+        model (tf.keras.Model): Trained model for prediction.
+        batch_size (int, optional): Number of images per forward pass. Defaults to config.EVALUATION_BATCH_SIZE.
+        use_cache (bool, optional): Whether to use the tensor cache. Defaults to config.EVALUATION_CACHE_ENABLED.
+        model_version (str, optional): Version of the model, used as key of the result store. Defaults to None (no store).
+
+    Returns:
+        dict: Dictionary containing predictions and statistics for each entity.
+    """
+    use_store = model_version is not None and config.EVALUATION_RESULTS_STORE_ENABLED
+    name = model_version or "model"
+    return predictions_all_models({name: model}, batch_size, use_cache, use_store)[name]
+
+
+def load_model_versions(versions):
+    """
+    Load several versions of the model from the versions directory.
+
+    Args:
+        versions (list): List of model versions (e.g. ["v0.1", "v0.3"]).
+
+    Returns:
+        dict: Dictionary mapping each version to its loaded model.
+    """
+    return {version: tf.keras.models.load_model(f"{config.MODEL_VERSIONS_PATH}{version}.keras") for version in versions}
 
 
+def calculate_overall_statistics(entity_predictions):
+    """
+    Calculate the statistics of all the images of a predictions_all_entities result.
+
+    Args:
+        entity_predictions (dict): Predictions and statistics of each entity, as returned by predictions_all_entities.
+
+    Returns:
+        dict: Statistics over every image, with the same keys as the statistics of an entity.
+    """
+    all_scores = []
+    all_ranks = []
+    all_diffs = []
+
+    for details in entity_predictions.values():
+        # Per-image information is stored under the filename
+        for value in details.values():
+            if isinstance(value, dict):
+                all_scores.append(value["score"])
+                all_ranks.append(value["rank"])
+                all_diffs.append(value.get("diff_with_best_score", 0))
+
+    return calculate_statistics(all_scores, all_ranks, all_diffs)
+
+
+def compare_model_versions(versions, batch_size=config.EVALUATION_BATCH_SIZE, use_cache=config.EVALUATION_CACHE_ENABLED,
+                           use_store=config.EVALUATION_RESULTS_STORE_ENABLED):
+    """
+    Evaluate several model versions in a single pass and gather their statistics side by side.
+
+    Args:
+        versions (list): List of model versions (e.g. ["v0.1", "v0.3"]).
+        batch_size (int, optional): Number of images per forward pass. Defaults to config.EVALUATION_BATCH_SIZE.
+        use_cache (bool, optional): Whether to use the tensor cache. Defaults to config.EVALUATION_CACHE_ENABLED.
+        use_store (bool, optional): Whether to reuse stored predictions. Defaults to config.EVALUATION_RESULTS_STORE_ENABLED.
+
+    Returns:
+        dict: Result document with the overall statistics and metrics of each version, the statistics
+              of each version per entity, and the full predictions of each version.
+    """
+    predictions, metrics = evaluate_all_models(load_model_versions(versions), batch_size, use_cache, use_store)
+
+    overall = {}
+    entities = {}
+    for version, version_predictions in predictions.items():
+        for entity_name, details in version_predictions.items():
+            # Keep only the statistics, per-image information is stored under the filename
+            stats = {key: value for key, value in details.items() if not isinstance(value, dict)}
+            entities.setdefault(entity_name, {})[version] = stats
+
+        overall[version] = calculate_overall_statistics(version_predictions)
+
+    return {
+        "versions": list(versions),
+        "overall": overall,
+        "metrics": metrics,
+        "entities": entities,
+        "predictions": predictions,
+    }
+
+
+def compare_prediction_throughput(model, batch_size=config.EVALUATION_BATCH_SIZE, max_images=None):
+    """
+    Compare the throughput of the per-image prediction path with the batched and pipelined ones.
+
+    Args:
+        model (tf.keras.Model): Trained model for prediction.
+        batch_size (int, optional): Number of images per forward pass. Defaults to config.EVALUATION_BATCH_SIZE.
+        max_images (int, optional): Maximum number of evaluation images to use. Defaults to None (all).
+
+    Returns:
+        dict: Images count, elapsed seconds and images per second for each path, and the speedup.
+    """
+    classes = get_entity_list()
+    img_paths = [img_path for files in list_evaluation_images(config.EVALUATION_IMAGES_PATH).values() for _, img_path in files]
+    img_paths = img_paths[:max_images]
+
+    def throughput(elapsed):
+        return {
+            "images": len(img_paths),
+            "seconds": round(elapsed, 3),
+            "images_per_sec": round(len(img_paths) / elapsed, 2) if elapsed > 0 else None,
+        }
+
+    # Warm up both prediction calls so graph tracing and first-call costs are not timed
+    if img_paths:
+        prediction_image(img_paths[0], model, classes, top_k=config.NUM_ENTITIES)
+        predict_batch(model, np.stack([load_image_tensor(img_path) for img_path in img_paths[:batch_size]]))
+
+    # Per-image path: one forward pass and one entity list read per image
+    start_time = time.perf_counter()
+    for img_path in img_paths:
+        prediction_image(img_path, model, get_entity_list(), top_k=config.NUM_ENTITIES)
+    per_image = throughput(time.perf_counter() - start_time)
+
+    # Batched path: one forward pass per batch, images decoded on the main thread
+    start_time = time.perf_counter()
+    for start in range(0, len(img_paths), batch_size):
+        img_batch = np.stack([load_image_tensor(img_path) for img_path in img_paths[start:start + batch_size]])
+        for image_scores in predict_batch(model, img_batch):
+            rank_prediction(image_scores, classes, top_k=config.NUM_ENTITIES)
+    batched = throughput(time.perf_counter() - start_time)
+
+    # Pipelined path: one forward pass per batch, decoding overlapped on a worker pool
+    start_time = time.perf_counter()
+    samples = [(img_path,) for img_path in img_paths]
+    for _, img_batch in iter_image_batches(samples, load_image_tensor, batch_size):
+        for image_scores in predict_batch(model, img_batch):
+            rank_prediction(image_scores, classes, top_k=config.NUM_ENTITIES)
+    pipelined = throughput(time.perf_counter() - start_time)
+
+    def speedup(result):
+        if per_image["images_per_sec"] and result["images_per_sec"]:
+            return round(result["images_per_sec"] / per_image["images_per_sec"], 2)
+        return None
+
+    return {
+        "batch_size": batch_size,
+        "num_workers": config.EVALUATION_NUM_WORKERS,
+        "per_image": per_image,
+        "batched": batched,
+        "pipelined": pipelined,
+        "batched_speedup": speedup(batched),
+        "pipelined_speedup": speedup(pipelined),
+    }
@@ -34,6 +34,43 @@ def transform_format_data(data):
     
     return global_data, individual_data
 
+
+def transform_format_records(records):
+    """
+    Transform a stream of evaluation records into the global and individual data of the plots.
+
+    Args:
+        records (iterable): Image and entity records, e.g. from evaluate.streaming.read_records_jsonl.
+
+    Returns:
+        tuple: Global data (one record per entity) and individual data (one record per image).
+    """
+    global_data = []
+    individual_data = []
+
+    for record in records:
+        if record['type'] == 'entity':
+            global_data.append({
+                'entity': record['entity'],
+                'avg_score': float(record['avg_score']) if record['avg_score'] is not None else 0.0,
+                'best_score': float(record['best_score']) if record['best_score'] is not None else 0.0,
+                'worst_score': float(record['worst_score']) if record['worst_score'] is not None else 0.0,
+                'avg_rank': float(record['avg_rank']) if record['avg_rank'] is not None else 0.0,
+                'best_rank': int(record['best_rank']) if record['best_rank'] is not None else 0,
+                'worst_rank': int(record['worst_rank']) if record['worst_rank'] is not None else 0,
+                'avg_diff_with_best_score': float(record['avg_diff_with_best_score']) if record['avg_diff_with_best_score'] is not None else 0.0,
+                'min_diff_with_best_score': float(record['min_diff_with_best_score']) if record['min_diff_with_best_score'] is not None else 0.0,
+                'max_diff_with_best_score': float(record['max_diff_with_best_score']) if record['max_diff_with_best_score'] is not None else 0.0,
+            })
+        elif record['type'] == 'image':
+            individual_data.append({
+                'entity': record['entity'],
+                'score': float(record['score']) if record['score'] is not None else 0.0,
+                'rank': int(record['rank']) if record['rank'] is not None else 0
+            })
+
+    return global_data, individual_data
+
     
 def make_bar_plot_avg_scores(global_df):
     # Define a color palette with 5 colors
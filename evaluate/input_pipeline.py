@@ -0,0 +1,46 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import config.config as config
+
+
+def iter_image_batches(samples, load_fn, batch_size=config.EVALUATION_BATCH_SIZE,
+                       num_workers=config.EVALUATION_NUM_WORKERS,
+                       prefetch_batches=config.EVALUATION_PREFETCH_BATCHES):
+    """
+    Decode and resize images on a worker pool and yield them as batches.
+
+    Up to `prefetch_batches` batches are decoded ahead of the one being consumed, so
+    decoding keeps running while the caller runs inference on the current batch.
+
+    Args:
+        samples (list): List of tuples whose last element is the image path.
+        load_fn (callable): Function loading an image path into a preprocessed tensor.
+        batch_size (int, optional): Number of images per batch. Defaults to config.EVALUATION_BATCH_SIZE.
+        num_workers (int, optional): Number of decoding threads. Defaults to config.EVALUATION_NUM_WORKERS.
+        prefetch_batches (int, optional): Number of batches decoded ahead. Defaults to config.EVALUATION_PREFETCH_BATCHES.
+
+    Yields:
+        tuple: The samples of the batch and their stacked image tensors.
+    """
+    batches = iter([samples[i:i + batch_size] for i in range(0, len(samples), batch_size)])
+
+    with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+        # Queue of batches whose decoding has already been submitted
+        pending = deque()
+
+        def submit_next_batch():
+            batch = next(batches, None)
+            if batch is not None:
+                pending.append((batch, [executor.submit(load_fn, sample[-1]) for sample in batch]))
+
+        for _ in range(max(0, prefetch_batches) + 1):
+            submit_next_batch()
+
+        while pending:
+            batch, futures = pending.popleft()
+            # Keep the queue full before waiting on the current batch
+            submit_next_batch()
+            yield batch, np.stack([future.result() for future in futures])
@@ -0,0 +1,168 @@
+import numpy as np
+
+import config.config as config
+
+
+def build_label_vector(entity_names, classes):
+    """
+    Build the vector of true class indices of the evaluated images.
+
+    Args:
+        entity_names (list): True entity name of each image.
+        classes (list): List of class names.
+
+    Returns:
+        np.ndarray: Class index of each image, or -1 if its entity is not a known class.
+    """
+    class_indices = {entity: i for i, entity in enumerate(classes)}
+    return np.array([class_indices.get(entity_name, -1) for entity_name in entity_names], dtype=np.int64)
+
+
+def true_class_scores(score_matrix, labels):
+    """
+    Get the score given to the true class of each image.
+
+    Args:
+        score_matrix (np.ndarray): Prediction scores of shape (N, num_classes).
+        labels (np.ndarray): True class index of each image, -1 if unknown.
+
+    Returns:
+        np.ndarray: Score of the true class of each image, NaN if unknown.
+    """
+    scores = np.full(len(labels), np.nan)
+    known = labels >= 0
+    scores[known] = score_matrix[np.flatnonzero(known), labels[known]]
+    return scores
+
+
+def true_class_ranks(score_matrix, labels):
+    """
+    Get the rank of the true class of each image (1 is the best).
+
+    Args:
+        score_matrix (np.ndarray): Prediction scores of shape (N, num_classes).
+        labels (np.ndarray): True class index of each image, -1 if unknown.
+
+    Returns:
+        np.ndarray: Rank of the true class of each image, config.NUM_ENTITIES if unknown.
+    """
+    scores = true_class_scores(score_matrix, labels)
+    ranks = np.full(len(labels), config.NUM_ENTITIES, dtype=np.int64)
+    known = labels >= 0
+    # The rank is one plus the number of classes scored strictly higher than the true class
+    ranks[known] = 1 + np.sum(score_matrix[known] > scores[known][:, None], axis=1)
+    return ranks
+
+
+def top_k_accuracy(score_matrix, labels, k):
+    """
+    Calculate the proportion of images whose true class is in the top k predictions.
+
+    Args:
+        score_matrix (np.ndarray): Prediction scores of shape (N, num_classes).
+        labels (np.ndarray): True class index of each image, -1 if unknown.
+        k (int): Number of top predictions to consider.
+
+    Returns:
+        float: Top-k accuracy in [0, 1], or None if there are no images.
+    """
+    if len(labels) == 0:
+        return None
+    return float(np.mean(true_class_ranks(score_matrix, labels) <= k))
+
+
+def score_gaps(score_matrix, labels):
+    """
+    Calculate the difference between the best score and the true class score of each image.
+
+    Args:
+        score_matrix (np.ndarray): Prediction scores of shape (N, num_classes).
+        labels (np.ndarray): True class index of each image, -1 if unknown.
+
+    Returns:
+        np.ndarray: Score gap of each image, 0 when the true class is the best one, NaN if unknown.
+    """
+    return score_matrix.max(axis=1) - true_class_scores(score_matrix, labels)
+
+
+def confusion_matrix(score_matrix, labels, num_classes):
+    """
+    Calculate the confusion matrix of the top-1 predictions.
+
+    Args:
+        score_matrix (np.ndarray): Prediction scores of shape (N, num_classes).
+        labels (np.ndarray): True class index of each image, -1 if unknown.
+        num_classes (int): Number of classes.
+
+    Returns:
+        np.ndarray: Matrix of shape (num_classes, num_classes) counting true class (rows) against predicted class (columns).
+    """
+    known = labels >= 0
+    predicted = np.argmax(score_matrix[known], axis=1)
+    counts = np.bincount(labels[known] * num_classes + predicted, minlength=num_classes * num_classes)
+    return counts.reshape(num_classes, num_classes)
+
+
+def calculate_statistics_vectorized(scores, ranks, differences):
+    """
+    Calculate statistics from arrays of prediction scores, rankings, and differences.
+
+    Produces the same fields as evaluate_model.calculate_statistics.
+
+    Args:
+        scores (np.ndarray): Array of scores (%).
+        ranks (np.ndarray): Array of rankings.
+        differences (np.ndarray): Array of score differences (%).
+
+    Returns:
+        dict: Dictionary containing calculated statistics.
+    """
+    if len(scores):
+        avg_score, best_score, worst_score = round(float(np.mean(scores)), 2), float(np.max(scores)), float(np.min(scores))
+    else:
+        avg_score = best_score = worst_score = None
+
+    if len(ranks):
+        avg_rank, best_rank, worst_rank = round(float(np.mean(ranks)), 2), int(np.min(ranks)), int(np.max(ranks))
+    else:
+        avg_rank = best_rank = worst_rank = config.NUM_ENTITIES
+
+    if len(differences):
+        avg_difference, min_difference, max_difference = round(float(np.mean(differences)), 2), float(np.min(differences)), float(np.max(differences))
+    else:
+        avg_difference = min_difference = max_difference = None
+
+    return {
+        "avg_score": avg_score,
+        "best_score": best_score,
+        "worst_score": worst_score,
+        "avg_rank": avg_rank,
+        "best_rank": best_rank,
+        "worst_rank": worst_rank,
+        "avg_diff_with_best_score": avg_difference,
+        "min_diff_with_best_score": min_difference,
+        "max_diff_with_best_score": max_difference,
+    }
+
+
+def summarize_metrics(score_matrix, labels, classes, top_k=(1, 5)):
+    """
+    Calculate the global metrics of an evaluation.
+
+    Args:
+        score_matrix (np.ndarray): Prediction scores of shape (N, num_classes).
+        labels (np.ndarray): True class index of each image, -1 if unknown.
+        classes (list): List of class names.
+        top_k (tuple, optional): Values of k for the top-k accuracies. Defaults to (1, 5).
+
+    Returns:
+        dict: Top-k accuracies, average score gap (%) and confusion matrix (as nested lists).
+    """
+    gaps = score_gaps(score_matrix, labels)
+    known_gaps = gaps[~np.isnan(gaps)]
+
+    metrics = {f"top{k}_accuracy": top_k_accuracy(score_matrix, labels, k) for k in top_k}
+    metrics["avg_score_gap"] = round(float(np.mean(known_gaps)) * 100, 2) if len(known_gaps) else None
+    metrics["classes"] = list(classes)
+    metrics["confusion_matrix"] = confusion_matrix(score_matrix, labels, len(classes)).tolist()
+    return metrics
@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import hashlib
+import numpy as np
+
+import config.config as config
+from evaluate.tensor_cache import get_file_signature
+
+
+def open_result_store(db_path=config.EVALUATION_RESULTS_DB_PATH):
+    """
+    Open the SQLite store of per-image predictions, creating its tables if needed.
+
+    Args:
+        db_path (str): Path to the SQLite database.
+
+    Returns:
+        sqlite3.Connection: Connection to the result store.
+    """
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    connection = sqlite3.connect(db_path)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS files ("
+        "path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, content_hash TEXT)"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS predictions ("
+        "model_version TEXT, content_hash TEXT, scores BLOB, "
+        "PRIMARY KEY (model_version, content_hash))"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS models ("
+        "model_version TEXT PRIMARY KEY, size INTEGER, mtime INTEGER)"
+    )
+    return connection
+
+
+def hash_file_content(img_path):
+    """
+    Generate an MD5 hash of the content of a file.
+
+    Args:
+        img_path (str): Path to the file.
+
+    Returns:
+        str: The MD5 hash of the file content.
+    """
+    with open(img_path, 'rb') as file:
+        return hashlib.md5(file.read()).hexdigest()
+
+
+def get_content_hashes(connection, img_paths):
+    """
+    Get the content hash of each image, only re-hashing files whose size or modification time changed.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the result store.
+        img_paths (list): List of image paths.
+
+    Returns:
+        list: Content hash of each image.
+
+    Raises:
+        FileNotFoundError: If an image was deleted, its scores could not be matched with the other images.
+    """
+    known_files = {
+        path: (size, mtime, content_hash)
+        for path, size, mtime, content_hash in connection.execute("SELECT path, size, mtime, content_hash FROM files")
+    }
+
+    content_hashes = []
+    updated_files = []
+    for img_path in img_paths:
+        abs_path = os.path.abspath(img_path)
+        signature = get_file_signature(abs_path)
+        if signature is None:
+            raise FileNotFoundError(f"Image not found: {img_path}")
+        known = known_files.get(abs_path)
+
+        if known and known[0] == signature["size"] and known[1] == signature["mtime"]:
+            content_hashes.append(known[2])
+        else:
+            content_hash = hash_file_content(abs_path)
+            content_hashes.append(content_hash)
+            updated_files.append((abs_path, signature["size"], signature["mtime"], content_hash))
+
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", updated_files)
+
+    return content_hashes
+
+
+def get_model_file_path(model_version):
+    """
+    Get the path of the file of a model version stored in the result store.
+
+    Args:
+        model_version (str): Key of the model in the result store: its version, followed by its
+                             TFLite backend for the TFLite models (e.g. "v0.3" or "v0.3-tflite-int8").
+
+    Returns:
+        str: Path of the .keras or .tflite file.
+    """
+    version, tflite, quantization = model_version.partition("-tflite-")
+    if tflite:
+        return f"{config.MODEL_VERSIONS_PATH}{version}-{quantization}.tflite"
+    return f"{config.MODEL_VERSIONS_PATH}{model_version}.keras"
+
+
+def invalidate_changed_model(connection, model_version, model_path=None):
+    """
+    Delete the stored predictions of a model version whose file changed since they were stored.
+
+    A version re-saved under the same name (retrained, distilled, fine-tuned...) gets a new size or
+    modification time, so its previous predictions are not returned for the new model.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the result store.
+        model_version (str): Version of the model.
+        model_path (str, optional): Path of the model file. Defaults to None (see get_model_file_path).
+
+    Returns:
+        bool: Whether stored predictions were deleted.
+    """
+    signature = get_file_signature(model_path or get_model_file_path(model_version))
+    if signature is None:
+        # Models without a file cannot be checked, their predictions are keyed by name only
+        return False
+
+    known = connection.execute("SELECT size, mtime FROM models WHERE model_version = ?", (model_version,)).fetchone()
+    if known == (signature["size"], signature["mtime"]):
+        return False
+
+    # The predictions stored before the model signature was recorded cannot be trusted either
+    clear_model_version(connection, model_version)
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO models VALUES (?, ?, ?)", (model_version, signature["size"], signature["mtime"]))
+    return known is not None
+
+
+def load_stored_scores(connection, model_version, content_hashes):
+    """
+    Load the stored prediction scores of a model version for the given images.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the result store.
+        model_version (str): Version of the model.
+        content_hashes (list): Content hashes of the images.
+
+    Returns:
+        dict: Dictionary mapping each stored content hash to its prediction scores.
+    """
+    stored_scores = {}
+    for content_hash, scores in connection.execute(
+        "SELECT content_hash, scores FROM predictions WHERE model_version = ?", (model_version,)
+    ):
+        stored_scores[content_hash] = np.frombuffer(scores, dtype=np.float32)
+
+    wanted = set(content_hashes)
+    return {content_hash: scores for content_hash, scores in stored_scores.items() if content_hash in wanted}
+
+
+def save_scores(connection, model_version, content_hashes, score_matrix):
+    """
+    Store the prediction scores of a model version for the given images.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the result store.
+        model_version (str): Version of the model.
+        content_hashes (list): Content hashes of the images, aligned with the rows of `score_matrix`.
+        score_matrix (np.ndarray): Prediction scores of shape (len(content_hashes), num_classes).
+    """
+    rows = [
+        (model_version, content_hash, np.asarray(scores, dtype=np.float32).tobytes())
+        for content_hash, scores in zip(content_hashes, score_matrix)
+    ]
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)", rows)
+
+
+def clear_model_version(connection, model_version):
+    """
+    Delete the stored predictions of a model version, e.g. after it has been retrained.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the result store.
+        model_version (str): Version of the model.
+    """
+    with connection:
+        connection.execute("DELETE FROM predictions WHERE model_version = ?", (model_version,))
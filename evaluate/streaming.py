@@ -0,0 +1,117 @@
+import os
+import json
+import numpy as np
+
+import config.config as config
+from evaluate.evaluate_model import build_prediction_infos, iter_evaluation_batches, list_evaluation_images, predict_batch
+from evaluate.metrics import build_label_vector, calculate_statistics_vectorized
+from utils.file_utils import get_entity_list
+from utils.profiling import timer
+
+
+def build_entity_record(entity_name, scores, ranks, differences):
+    """
+    Build the summary record of an entity.
+
+    Args:
+        entity_name (str): Name of the entity.
+        scores (list): Scores (%) of the images of the entity.
+        ranks (list): Rankings of the images of the entity.
+        differences (list): Score differences (%) of the images of the entity.
+
+    Returns:
+        dict: Entity record with the same statistics as predictions_all_entities.
+    """
+    stats = calculate_statistics_vectorized(np.array(scores), np.array(ranks), np.array(differences))
+    return {"type": "entity", "entity": entity_name, **stats}
+
+
+def iter_prediction_records(model, batch_size=config.EVALUATION_BATCH_SIZE, use_cache=False):
+    """
+    Predict classes for all evaluation images and yield the results as they are computed.
+
+    Only the values of the entity being evaluated are kept in memory. Each image yields an
+    image record, and each entity yields a summary record once all its images are predicted.
+    Images are decoded by the prefetching worker pool: a cold tensor cache would decode every
+    image into memory before the first batch.
+
+    Args:
+        model (tf.keras.Model): Trained model for prediction.
+        batch_size (int, optional): Number of images per forward pass. Defaults to config.EVALUATION_BATCH_SIZE.
+        use_cache (bool, optional): Whether to use the tensor cache. Defaults to False.
+
+    Yields:
+        dict: Image records ({"type": "image", "entity", "file", "score", "rank", ...}) and
+              entity records ({"type": "entity", "entity", "avg_score", ...}).
+    """
+    classes = get_entity_list()
+    entity_files = list_evaluation_images(config.EVALUATION_IMAGES_PATH)
+    samples = [(entity_name, file, img_path) for entity_name, files in entity_files.items() for file, img_path in files]
+
+    entity_names = iter(entity_files)
+    current_entity = next(entity_names, None)
+    scores, ranks, differences = [], [], []
+
+    for batch, img_batch in iter_evaluation_batches(samples, batch_size, use_cache):
+        batch_scores = predict_batch(model, img_batch)
+        with timer("evaluate.stats"):
+            labels = build_label_vector([entity_name for entity_name, _, _ in batch], classes)
+            prediction_infos, scores_pct, ranks_batch, diffs_pct = build_prediction_infos(batch_scores, labels, classes)
+
+        for i, (entity_name, file, _) in enumerate(batch):
+            # Samples of an entity are contiguous, close the entities that are done
+            while entity_name != current_entity:
+                yield build_entity_record(current_entity, scores, ranks, differences)
+                scores, ranks, differences = [], [], []
+                current_entity = next(entity_names, None)
+
+            yield {"type": "image", "entity": entity_name, "file": file, **prediction_infos[i]}
+            scores.append(scores_pct[i])
+            ranks.append(ranks_batch[i])
+            differences.append(diffs_pct[i])
+
+    # Close the last entity and the entities without images
+    while current_entity is not None:
+        yield build_entity_record(current_entity, scores, ranks, differences)
+        scores, ranks, differences = [], [], []
+        current_entity = next(entity_names, None)
+
+
+def write_records_jsonl(records, file_path):
+    """
+    Write records to a JSON Lines file as they are produced.
+
+    Args:
+        records (iterable): Iterable of JSON-serializable dicts.
+        file_path (str): Path to the JSON Lines file.
+
+    Returns:
+        int: Number of records written.
+    """
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+
+    count = 0
+    with open(file_path, 'w') as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+            count += 1
+            # Make entity summaries visible to readers as soon as they are available
+            if record.get("type") == "entity":
+                file.flush()
+    return count
+
+
+def read_records_jsonl(file_path):
+    """
+    Read records from a JSON Lines file one at a time.
+
+    Args:
+        file_path (str): Path to the JSON Lines file.
+
+    Yields:
+        dict: The records of the file.
+    """
+    with open(file_path, 'r') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,237 @@
+import os
+import json
+import uuid
+import numpy as np
+from tensorflow.keras.preprocessing import image # type: ignore
+
+import config.config as config
+from evaluate.input_pipeline import iter_image_batches
+from utils.profiling import increment, timed, timer
+
+
+CACHE_INDEX_FILENAME = "index.json"
+
+
+@timed("evaluate.decode")
+def load_image_array(img_path):
+    """
+    Load an image from disk and resize it without rescaling.
+
+    Args:
+        img_path (str): Path to the image file.
+
+    Returns:
+        np.ndarray: uint8 image array of shape (150, 150, 3).
+    """
+    img = image.load_img(img_path, target_size=(150, 150))
+    return image.img_to_array(img, dtype="uint8")
+
+
+def get_file_signature(img_path):
+    """
+    Get the signature used to detect changes of an image file.
+
+    Args:
+        img_path (str): Path to the image file.
+
+    Returns:
+        dict: Size in bytes and modification time in nanoseconds of the file, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(img_path)
+    except FileNotFoundError:
+        return None
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def load_cache_index(cache_dir=config.EVALUATION_CACHE_PATH):
+    """
+    Load the index of the tensor cache.
+
+    Args:
+        cache_dir (str): Directory of the tensor cache.
+
+    Returns:
+        dict: Index with the blob filename and one entry (size, mtime, slot) per image path.
+    """
+    index_path = os.path.join(cache_dir, CACHE_INDEX_FILENAME)
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as file:
+            return json.load(file)
+    return {"blob": None, "entries": {}}
+
+
+def open_cache_blob(cache_dir, index):
+    """
+    Memory-map the tensor blob referenced by the cache index.
+
+    Args:
+        cache_dir (str): Directory of the tensor cache.
+        index (dict): Index of the tensor cache.
+
+    Returns:
+        np.ndarray: Read-only memory-mapped uint8 array of shape (N, 150, 150, 3), or None if there is no blob.
+    """
+    if not index["blob"]:
+        return None
+    blob_path = os.path.join(cache_dir, index["blob"])
+    if not os.path.exists(blob_path):
+        return None
+    return np.load(blob_path, mmap_mode='r')
+
+
+def write_cache(cache_dir, entries, old_blob, new_arrays):
+    """
+    Write a new tensor blob and its index.
+
+    The blob is written under a fresh name before the index is replaced, so a crash
+    never leaves an index pointing to rows of another blob.
+
+    Args:
+        cache_dir (str): Directory of the tensor cache.
+        entries (dict): Image path to entry, where `slot` is a row of `old_blob` or a key of `new_arrays`.
+        old_blob (np.ndarray): Memory-mapped previous blob, or None.
+        new_arrays (dict): Image path to freshly decoded uint8 array.
+
+    Returns:
+        dict: The new cache index.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    blob_filename = f"tensors-{uuid.uuid4().hex}.npy"
+    blob_path = os.path.join(cache_dir, blob_filename)
+
+    paths = list(entries)
+    shape = (len(paths), 150, 150, 3)
+    blob = np.lib.format.open_memmap(blob_path, mode='w+', dtype=np.uint8, shape=shape)
+
+    index = {"blob": blob_filename, "entries": {}}
+    for slot, img_path in enumerate(paths):
+        entry = entries[img_path]
+        if img_path in new_arrays:
+            blob[slot] = new_arrays[img_path]
+        else:
+            blob[slot] = old_blob[entry["slot"]]
+        index["entries"][img_path] = {"size": entry["size"], "mtime": entry["mtime"], "slot": slot}
+
+    blob.flush()
+    del blob
+
+    index_path = os.path.join(cache_dir, CACHE_INDEX_FILENAME)
+    with open(f"{index_path}.tmp", 'w') as file:
+        json.dump(index, file)
+    os.replace(f"{index_path}.tmp", index_path)
+
+    return index
+
+
+def remove_stale_blobs(cache_dir, index):
+    """
+    Remove the tensor blobs that are no longer referenced by the cache index.
+
+    Args:
+        cache_dir (str): Directory of the tensor cache.
+        index (dict): Index of the tensor cache.
+    """
+    for filename in os.listdir(cache_dir):
+        if filename.startswith("tensors-") and filename.endswith(".npy") and filename != index["blob"]:
+            os.remove(os.path.join(cache_dir, filename))
+
+
+def get_cached_image_arrays(img_paths, cache_dir=config.EVALUATION_CACHE_PATH):
+    """
+    Get the preprocessed arrays of images from the on-disk tensor cache.
+
+    Images whose size or modification time changed since they were cached, or that are not
+    cached yet, are decoded and the cache is rewritten. Entries of deleted files are dropped
+    and deleted files get the row -1.
+
+    Args:
+        img_paths (list): List of image paths.
+        cache_dir (str): Directory of the tensor cache.
+
+    Returns:
+        tuple: Memory-mapped uint8 array, array of row indices (one per image path, -1 for a deleted file)
+               and a dict of hit/miss counts.
+    """
+    index = load_cache_index(cache_dir)
+    old_blob = open_cache_blob(cache_dir, index)
+    if old_blob is None:
+        index = {"blob": None, "entries": {}}
+
+    requested = {os.path.abspath(img_path) for img_path in img_paths}
+    entries = {}
+    misses = []
+    evicted = 0
+
+    # Keep the valid entries of the requested images and of images cached by other runs
+    for img_path, entry in index["entries"].items():
+        signature = get_file_signature(img_path)
+        if signature and signature["size"] == entry["size"] and signature["mtime"] == entry["mtime"]:
+            entries[img_path] = entry
+        else:
+            evicted += 1
+
+    missing = 0
+    for img_path in requested:
+        if img_path not in entries:
+            signature = get_file_signature(img_path)
+            if signature is None:
+                # Deleted since the images were listed, it has nothing to decode
+                missing += 1
+                evicted += img_path not in index["entries"]
+                continue
+            entries[img_path] = dict(signature, slot=None)
+            misses.append(img_path)
+
+    hits = len(requested) - len(misses) - missing
+    stats = {"hits": hits, "misses": len(misses), "evicted": evicted}
+    increment("evaluate.cache_hits", hits)
+    increment("evaluate.cache_misses", len(misses))
+
+    if not entries:
+        return np.empty((0, 150, 150, 3), dtype=np.uint8), np.full(len(img_paths), -1, dtype=np.int64), stats
+
+    if misses or evicted or old_blob is None:
+        # Decode the missing images on the evaluation worker pool
+        new_arrays = {}
+        for batch, img_batch in iter_image_batches([(img_path,) for img_path in misses], load_image_array):
+            for (img_path,), img_array in zip(batch, img_batch):
+                new_arrays[img_path] = img_array
+
+        index = write_cache(cache_dir, entries, old_blob, new_arrays)
+        # Release the previous mapping before deleting its file
+        del old_blob
+        remove_stale_blobs(cache_dir, index)
+        blob = open_cache_blob(cache_dir, index)
+    else:
+        blob = old_blob
+
+    slots = np.array([index["entries"].get(os.path.abspath(img_path), {"slot": -1})["slot"] for img_path in img_paths], dtype=np.int64)
+
+    return blob, slots, stats
+
+
+def iter_cached_batches(samples, blob, slots, batch_size=config.EVALUATION_BATCH_SIZE):
+    """
+    Yield batches of cached image tensors scaled to [0, 1].
+
+    Args:
+        samples (list): List of samples, aligned with `slots`.
+        blob (np.ndarray): Memory-mapped uint8 array returned by get_cached_image_arrays.
+        slots (np.ndarray): Row of each sample in the blob.
+        batch_size (int, optional): Number of images per batch. Defaults to config.EVALUATION_BATCH_SIZE.
+
+    Yields:
+        tuple: The samples of the batch and their stacked float32 image tensors.
+
+    Raises:
+        FileNotFoundError: If the image of a sample was deleted, like the image files pipeline.
+    """
+    for start in range(0, len(samples), batch_size):
+        missing = np.flatnonzero(slots[start:start + batch_size] < 0)
+        if missing.size:
+            raise FileNotFoundError(f"Image not found: {samples[start + missing[0]][-1]}")
+        with timer("evaluate.cache_read"):
+            img_batch = blob[slots[start:start + batch_size]].astype(np.float32)
+            img_batch /= 255.0
+        yield samples[start:start + batch_size], img_batch
@@ -0,0 +1,172 @@
+import os
+import json
+import argparse
+import tempfile
+import tensorflow as tf
+from tensorflow.keras.models import Sequential # type: ignore
+from tensorflow.keras.layers import (Conv2D, Dense, Flatten, GlobalAveragePooling2D, Input, # type: ignore
+                                     MaxPooling2D, Resizing, SeparableConv2D)
+
+import config.config as config
+from utils.latency import measure_batch_latency
+
+
+# Options of the architecture variants, missing options take the defaults of build_architecture
+ARCHITECTURES = {
+    "baseline": {},
+    "gap": {"head": "gap"},
+    "separable": {"separable": True},
+    "separable-gap": {"separable": True, "head": "gap"},
+    "separable-gap-128": {"separable": True, "head": "gap", "input_size": 128},
+    "mobile": {"separable": True, "head": "gap", "input_size": 128, "width_multiplier": 0.5, "dense_units": 256},
+}
+
+
+def build_architecture(input_size=150, width_multiplier=1.0, separable=False, head="flatten", dense_units=512):
+    """
+    Build the CNN of the entity classifier.
+
+    The model always takes 150x150 images, like every preprocessing of the project, and
+    resizes them first when `input_size` is different.
+
+    Args:
+        input_size (int, optional): Resolution the convolutions run at. Defaults to 150.
+        width_multiplier (float, optional): Factor applied to the number of filters and units. Defaults to 1.0.
+        separable (bool, optional): Whether the blocks after the first use depthwise-separable convolutions. Defaults to False.
+        head (str, optional): "flatten" (Flatten then Dense) or "gap" (global average pooling then Dense). Defaults to "flatten".
+        dense_units (int, optional): Units of the hidden Dense layer, 0 for none. Defaults to 512.
+
+    Returns:
+        tf.keras.Model: The uncompiled model.
+    """
+    def width(units):
+        return max(1, int(units * width_multiplier))
+
+    layers = [Input((150, 150, 3))]
+    if input_size != 150:
+        layers.append(Resizing(input_size, input_size, interpolation='nearest'))
+
+    for i, filters in enumerate((32, 64, 128, 128)):
+        conv = SeparableConv2D if separable and i > 0 else Conv2D
+        layers += [conv(width(filters), (3, 3), activation='relu'), MaxPooling2D((2, 2))]
+
+    layers.append(GlobalAveragePooling2D() if head == "gap" else Flatten())
+    if dense_units:
+        layers.append(Dense(width(dense_units), activation='relu'))
+    layers.append(Dense(config.NUM_ENTITIES, activation='softmax'))
+
+    return Sequential(layers)
+
+
+def get_architecture_options(architecture=config.MODEL_ARCHITECTURE):
+    """
+    Get the options of an architecture variant.
+
+    Args:
+        architecture (str or dict, optional): Name of a variant of ARCHITECTURES, or options. Defaults to config.MODEL_ARCHITECTURE.
+
+    Returns:
+        dict: Options of build_architecture.
+    """
+    if isinstance(architecture, dict):
+        return architecture
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture '{architecture}', expected one of: {', '.join(ARCHITECTURES)}")
+    return ARCHITECTURES[architecture]
+
+
+def count_flops(model):
+    """
+    Count the floating point operations of a forward pass of one image.
+
+    Convolutions and Dense layers are counted as 2 operations per multiply-add,
+    resizing, pooling and activations are ignored.
+
+    Args:
+        model (tf.keras.Model): Built Sequential model.
+
+    Returns:
+        int: Number of FLOPs per image.
+    """
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, SeparableConv2D):
+            kernel_h, kernel_w = layer.kernel_size
+            channels_in = layer.input.shape[-1]
+            _, height, width, channels_out = layer.output.shape
+            # Depthwise then pointwise convolution
+            flops += 2 * height * width * channels_in * (kernel_h * kernel_w + channels_out)
+        elif isinstance(layer, Conv2D):
+            kernel_h, kernel_w = layer.kernel_size
+            channels_in = layer.input.shape[-1]
+            _, height, width, channels_out = layer.output.shape
+            flops += 2 * height * width * channels_out * kernel_h * kernel_w * channels_in
+        elif isinstance(layer, Dense):
+            flops += 2 * layer.input.shape[-1] * layer.units
+    return int(flops)
+
+
+def get_saved_size(model):
+    """
+    Get the on-disk size of a model saved in the .keras format, without optimizer state.
+
+    Args:
+        model (tf.keras.Model): Model to measure.
+
+    Returns:
+        int: Size of the .keras file, in bytes.
+    """
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        model_path = os.path.join(temporary_dir, "model.keras")
+        model.save(model_path, include_optimizer=False)
+        return os.path.getsize(model_path)
+
+
+def report_architectures(architectures=tuple(ARCHITECTURES), batch_sizes=(1, 8, 32), runs=20):
+    """
+    Report the size and the CPU cost of architecture variants.
+
+    Args:
+        architectures (iterable, optional): Names of the variants of ARCHITECTURES. Defaults to all of them.
+        batch_sizes (tuple, optional): Batch sizes of the latency measurements. Defaults to (1, 8, 32).
+        runs (int, optional): Number of timed forward passes per batch size. Defaults to 20.
+
+    Returns:
+        dict: Dictionary mapping each variant to its options, params, FLOPs per image, size in bytes
+              and median latency (ms) per batch and per image for each batch size.
+    """
+    report = {}
+    for architecture in architectures:
+        options = get_architecture_options(architecture)
+        model = build_architecture(**options)
+
+        latencies = {}
+        for batch_size in batch_sizes:
+            latency = measure_batch_latency(model, batch_size, runs)
+            latencies[batch_size] = {"batch_ms": round(latency, 3), "image_ms": round(latency / batch_size, 3)}
+
+        report[architecture] = {
+            "options": options,
+            "params": model.count_params(),
+            "flops": count_flops(model),
+            "size_bytes": get_saved_size(model),
+            "latency": latencies,
+        }
+        print(f"{architecture:<20} params: {report[architecture]['params']:>10,}  MFLOPs: {report[architecture]['flops'] / 1e6:>8.1f}  "
+              f"size: {report[architecture]['size_bytes'] / 1e6:>6.2f} MB  "
+              + "  ".join(f"bs{batch_size}: {latency['image_ms']:.2f} ms/img" for batch_size, latency in latencies.items()))
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report the params, FLOPs, size and CPU latency of the architecture variants.")
+    parser.add_argument("--architectures", nargs="+", default=list(ARCHITECTURES), choices=list(ARCHITECTURES))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--output", help="Path of the JSON report.")
+    args = parser.parse_args()
+
+    report = report_architectures(args.architectures, tuple(args.batch_sizes))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
@@ -0,0 +1,238 @@
+import os
+import math
+import tensorflow as tf
+
+import config.config as config
+
+
+# Extensions read by flow_from_directory that tf.io.decode_image can decode
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+# Same augmentation as the ImageDataGenerator of model/model.py
+AUGMENTATION = {
+    "rotation_range": 40, # Degrees
+    "width_shift_range": 0.2, # Fraction of the width
+    "height_shift_range": 0.2, # Fraction of the height
+    "shear_range": 0.2, # Degrees, as in ImageDataGenerator
+    "zoom_range": 0.2,
+    "horizontal_flip": True,
+}
+
+
+def scale_augmentation(strength, augmentation=AUGMENTATION):
+    """
+    Scale the augmentation ranges, 0 disabling the augmentation and 1 keeping it unchanged.
+
+    Args:
+        strength (float): Factor applied to the rotation, shift, shear and zoom ranges.
+        augmentation (dict, optional): Augmentation ranges. Defaults to AUGMENTATION.
+
+    Returns:
+        dict: The scaled augmentation ranges.
+    """
+    scaled = {name: value * strength for name, value in augmentation.items() if name != "horizontal_flip"}
+    scaled["horizontal_flip"] = augmentation["horizontal_flip"] and strength > 0
+    return scaled
+
+
+def list_image_files(directory):
+    """
+    List the images of a split directory and their class index, in the order of flow_from_directory.
+
+    Args:
+        directory (str): Directory with one subdirectory per class.
+
+    Returns:
+        tuple: List of image paths, list of class indices and list of class names.
+    """
+    class_names = sorted(entry for entry in os.listdir(directory) if os.path.isdir(os.path.join(directory, entry)))
+
+    img_paths, labels = [], []
+    for class_index, class_name in enumerate(class_names):
+        class_dir = os.path.join(directory, class_name)
+        for file in sorted(os.listdir(class_dir)):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                img_paths.append(os.path.join(class_dir, file))
+                labels.append(class_index)
+
+    return img_paths, labels, class_names
+
+
+def decode_and_resize(img_path, label, image_size, num_classes):
+    """
+    Read, decode and resize an image, and one-hot encode its label.
+
+    Args:
+        img_path (tf.Tensor): Path of the image.
+        label (tf.Tensor): Class index of the image.
+        image_size (tuple): Height and width of the resized image.
+        num_classes (int): Number of classes.
+
+    Returns:
+        tuple: uint8 image tensor of shape (height, width, 3) and one-hot label.
+    """
+    img = tf.io.decode_image(tf.io.read_file(img_path), channels=3, expand_animations=False)
+    # Nearest neighbor, like load_img and flow_from_directory
+    img = tf.image.resize(img, image_size, method='nearest')
+    img = tf.cast(img, tf.uint8)
+    img.set_shape((*image_size, 3))
+    return img, tf.one_hot(label, num_classes)
+
+
+def random_transforms(batch_size, height, width, augmentation=AUGMENTATION):
+    """
+    Draw one random affine transform per image, like ImageDataGenerator.get_random_transform.
+
+    Args:
+        batch_size (tf.Tensor): Number of images.
+        height (int): Height of the images.
+        width (int): Width of the images.
+        augmentation (dict, optional): Augmentation ranges. Defaults to AUGMENTATION.
+
+    Returns:
+        tf.Tensor: Transforms of shape (batch_size, 8), mapping output to input coordinates.
+    """
+    def uniform(limit):
+        return tf.random.uniform((batch_size,), -limit, limit)
+
+    theta = uniform(math.radians(augmentation["rotation_range"]))
+    shear = uniform(math.radians(augmentation["shear_range"]))
+    tx = uniform(augmentation["height_shift_range"]) * height
+    ty = uniform(augmentation["width_shift_range"]) * width
+    zx = 1.0 + uniform(augmentation["zoom_range"])
+    zy = 1.0 + uniform(augmentation["zoom_range"])
+
+    # Rotation x shear x zoom, in the (row, column) coordinates of ImageDataGenerator
+    a00 = tf.cos(theta) * zx
+    a01 = (-tf.sin(theta) * tf.cos(shear) + tf.cos(theta) * -tf.sin(shear)) * zy
+    a10 = tf.sin(theta) * zx
+    a11 = (-tf.sin(theta) * tf.sin(shear) + tf.cos(theta) * tf.cos(shear)) * zy
+
+    # Apply the transform around the center of the image, the shift is rotated as well
+    center_row, center_col = (height - 1) / 2, (width - 1) / 2
+    row_offset = center_row - a00 * center_row - a01 * center_col + tf.cos(theta) * tx - tf.sin(theta) * ty
+    col_offset = center_col - a10 * center_row - a11 * center_col + tf.sin(theta) * tx + tf.cos(theta) * ty
+
+    # ImageProjectiveTransform works in (x, y) = (column, row) coordinates
+    zeros = tf.zeros((batch_size,))
+    return tf.stack([a11, a10, col_offset, a01, a00, row_offset, zeros, zeros], axis=1)
+
+
+def augment_batch(img_batch, augmentation=AUGMENTATION):
+    """
+    Randomly rotate, shift, shear, zoom and flip a batch of images.
+
+    Args:
+        img_batch (tf.Tensor): float32 images of shape (batch, height, width, 3).
+        augmentation (dict, optional): Augmentation ranges. Defaults to AUGMENTATION.
+
+    Returns:
+        tf.Tensor: The augmented images, with the borders filled by the nearest pixels.
+    """
+    shape = tf.shape(img_batch)
+    height, width = img_batch.shape[1], img_batch.shape[2]
+
+    img_batch = tf.raw_ops.ImageProjectiveTransformV3(
+        images=img_batch,
+        transforms=random_transforms(shape[0], height, width, augmentation),
+        output_shape=tf.stack([height, width]),
+        fill_value=0.0,
+        interpolation='NEAREST',
+        fill_mode='NEAREST')
+
+    if augmentation["horizontal_flip"]:
+        flip = tf.random.uniform((shape[0], 1, 1, 1)) < 0.5
+        img_batch = tf.where(flip, tf.reverse(img_batch, axis=[2]), img_batch)
+
+    return img_batch
+
+
+def build_image_dataset(directory, batch_size=config.BATCH_SIZE, image_size=(150, 150), augment=False,
+                        shuffle=True, cache=config.TRAINING_CACHE_ENABLED, seed=None, augmentation=AUGMENTATION,
+                        num_shards=1, shard_index=0):
+    """
+    Build a native tf.data pipeline of the images of a split directory.
+
+    Images are decoded and resized by parallel map calls and cached once as uint8,
+    so the following epochs only shuffle, batch, augment and prefetch in the TF runtime.
+
+    Args:
+        directory (str): Directory with one subdirectory per class.
+        batch_size (int, optional): Number of images per batch. Defaults to config.BATCH_SIZE.
+        image_size (tuple, optional): Height and width of the images. Defaults to (150, 150).
+        augment (bool, optional): Whether to apply the random augmentation. Defaults to False.
+        shuffle (bool, optional): Whether to reshuffle the images at each epoch. Defaults to True.
+        cache (bool or str, optional): True caches in memory, a path caches to files, False disables the cache.
+                                       Defaults to config.TRAINING_CACHE_ENABLED.
+        seed (int, optional): Seed of the shuffle. Defaults to None.
+        augmentation (dict, optional): Augmentation ranges. Defaults to AUGMENTATION.
+        num_shards (int, optional): Number of disjoint shards the images are split into, one per worker. Defaults to 1.
+        shard_index (int, optional): Index of the shard read by this pipeline. Defaults to 0.
+
+    Returns:
+        tuple: Repeated tf.data.Dataset of (images, one-hot labels) and the number of images of the shard.
+    """
+    img_paths, labels, _ = list_image_files(directory)
+    img_paths, labels = img_paths[shard_index::num_shards], labels[shard_index::num_shards]
+    num_classes = config.NUM_ENTITIES
+
+    dataset = tf.data.Dataset.from_tensor_slices((img_paths, labels))
+    dataset = dataset.map(lambda img_path, label: decode_and_resize(img_path, label, image_size, num_classes),
+                          num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    return batch_image_dataset(dataset, len(img_paths), batch_size, augment, shuffle, cache, seed, augmentation), len(img_paths)
+
+
+def batch_image_dataset(dataset, num_images, batch_size=config.BATCH_SIZE, augment=False, shuffle=True,
+                        cache=config.TRAINING_CACHE_ENABLED, seed=None, augmentation=AUGMENTATION):
+    """
+    Cache, shuffle, repeat, batch, rescale, augment and prefetch a dataset of uint8 images.
+
+    Args:
+        dataset (tf.data.Dataset): Dataset of (uint8 image, one-hot label).
+        num_images (int): Number of images of the dataset, used as shuffle buffer.
+        batch_size (int, optional): Number of images per batch. Defaults to config.BATCH_SIZE.
+        augment (bool, optional): Whether to apply the random augmentation. Defaults to False.
+        shuffle (bool, optional): Whether to reshuffle the images at each epoch. Defaults to True.
+        cache (bool or str, optional): True caches in memory, a path caches to files, False disables the cache.
+                                       Defaults to config.TRAINING_CACHE_ENABLED.
+        seed (int, optional): Seed of the shuffle. Defaults to None.
+        augmentation (dict, optional): Augmentation ranges. Defaults to AUGMENTATION.
+
+    Returns:
+        tf.data.Dataset: Repeated dataset of (float32 images, one-hot labels) batches.
+    """
+    if cache:
+        dataset = dataset.cache(cache if isinstance(cache, str) else "")
+    if shuffle:
+        dataset = dataset.shuffle(max(1, num_images), seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.repeat().batch(batch_size)
+    dataset = dataset.map(lambda img_batch, label_batch: (tf.cast(img_batch, tf.float32) / 255.0, label_batch),
+                          num_parallel_calls=tf.data.AUTOTUNE)
+    if augment:
+        dataset = dataset.map(lambda img_batch, label_batch: (augment_batch(img_batch, augmentation), label_batch),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def build_training_datasets(batch_size=config.BATCH_SIZE, image_size=(150, 150), augmentation=AUGMENTATION,
+                            num_shards=1, shard_index=0):
+    """
+    Build the augmented training dataset and the validation dataset.
+
+    Args:
+        batch_size (int, optional): Number of images per batch. Defaults to config.BATCH_SIZE.
+        image_size (tuple, optional): Height and width of the images. Defaults to (150, 150).
+        augmentation (dict, optional): Augmentation ranges of the training images. Defaults to AUGMENTATION.
+        num_shards (int, optional): Number of disjoint shards of each split, one per worker. Defaults to 1.
+        shard_index (int, optional): Index of the shard read by this worker. Defaults to 0.
+
+    Returns:
+        tuple: Training dataset, validation dataset, number of training images and number of validation images (of the shard).
+    """
+    train_ds, num_train = build_image_dataset(config.TRAIN_IMAGES_PATH, batch_size, image_size, augment=True, augmentation=augmentation,
+                                              num_shards=num_shards, shard_index=shard_index)
+    validation_ds, num_validation = build_image_dataset(config.VALIDATION_IMAGES_PATH, batch_size, image_size, shuffle=False,
+                                                        num_shards=num_shards, shard_index=shard_index)
+    return train_ds, validation_ds, num_train, num_validation
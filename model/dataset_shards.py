@@ -0,0 +1,353 @@
+import os
+import json
+import hashlib
+import argparse
+import tempfile
+import numpy as np
+import tensorflow as tf
+
+import config.config as config
+from evaluate.input_pipeline import iter_image_batches
+from evaluate.tensor_cache import load_image_array
+from model.data_pipeline import AUGMENTATION, IMAGE_EXTENSIONS, batch_image_dataset
+
+
+SHARD_INDEX_FILENAME = "index.json"
+SHARD_IMAGE_SIZE = (150, 150)
+
+
+def get_shards_dir(split_dir):
+    """
+    Get the shard directory of a split directory (e.g. images/shards/train/ for images/entities/train/).
+
+    Args:
+        split_dir (str): Directory with one subdirectory per entity.
+
+    Returns:
+        str: Directory of the shards of the split.
+    """
+    return os.path.join(config.DATASET_SHARDS_PATH, os.path.basename(os.path.normpath(split_dir)))
+
+
+def list_entity_images(entity_dir):
+    """
+    List the images of an entity directory, sorted by filename.
+
+    Args:
+        entity_dir (str): Directory of the entity.
+
+    Returns:
+        list: Filenames of the images.
+    """
+    return sorted(file for file in os.listdir(entity_dir) if file.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def get_directory_signature(entity_dir):
+    """
+    Get the signature used to detect changes of an entity directory.
+
+    Args:
+        entity_dir (str): Directory of the entity.
+
+    Returns:
+        str: SHA-1 of the filenames, sizes and modification times of the images.
+    """
+    digest = hashlib.sha1()
+    for file in list_entity_images(entity_dir):
+        stat = os.stat(os.path.join(entity_dir, file))
+        digest.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def load_shard_index(shards_dir):
+    """
+    Load the index of the shards of a split.
+
+    Args:
+        shards_dir (str): Directory of the shards of the split.
+
+    Returns:
+        dict: Index with the image size, the encoding and one entry (signature, shard, files) per entity.
+    """
+    index_path = os.path.join(shards_dir, SHARD_INDEX_FILENAME)
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as file:
+            return json.load(file)
+    return {"image_size": list(SHARD_IMAGE_SIZE), "encoding": config.DATASET_SHARDS_ENCODING, "entities": {}}
+
+
+def save_shard_index(shards_dir, index):
+    """
+    Atomically replace the index of the shards of a split.
+
+    The index is written to a temporary file of its own, so concurrent writers never share it.
+
+    Args:
+        shards_dir (str): Directory of the shards of the split.
+        index (dict): Index of the shards.
+    """
+    with tempfile.NamedTemporaryFile('w', dir=shards_dir, prefix=f"{SHARD_INDEX_FILENAME}.", suffix=".tmp", delete=False) as file:
+        json.dump(index, file)
+    os.replace(file.name, os.path.join(shards_dir, SHARD_INDEX_FILENAME))
+
+
+def encode_example(img_array, encoding=config.DATASET_SHARDS_ENCODING):
+    """
+    Serialize a resized image as a tf.train.Example.
+
+    Args:
+        img_array (np.ndarray): uint8 image array of shape (150, 150, 3).
+        encoding (str, optional): "jpeg" or "raw". Defaults to config.DATASET_SHARDS_ENCODING.
+
+    Returns:
+        bytes: The serialized example.
+    """
+    if encoding == "jpeg":
+        data = tf.io.encode_jpeg(img_array, quality=config.DATASET_SHARDS_JPEG_QUALITY).numpy()
+    else:
+        data = img_array.tobytes()
+
+    feature = {"image": tf.train.Feature(bytes_list=tf.train.BytesList(value=[data]))}
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+
+
+def decode_example(serialized, encoding=config.DATASET_SHARDS_ENCODING, image_size=SHARD_IMAGE_SIZE):
+    """
+    Parse a serialized example back into a uint8 image tensor.
+
+    Args:
+        serialized (tf.Tensor): The serialized example.
+        encoding (str, optional): "jpeg" or "raw". Defaults to config.DATASET_SHARDS_ENCODING.
+        image_size (tuple, optional): Height and width of the images. Defaults to SHARD_IMAGE_SIZE.
+
+    Returns:
+        tf.Tensor: uint8 image tensor of shape (height, width, 3).
+    """
+    data = tf.io.parse_single_example(serialized, {"image": tf.io.FixedLenFeature([], tf.string)})["image"]
+    if encoding == "jpeg":
+        img = tf.io.decode_jpeg(data, channels=3)
+    else:
+        img = tf.reshape(tf.io.decode_raw(data, tf.uint8), (*image_size, 3))
+    img.set_shape((*image_size, 3))
+    return img
+
+
+def write_entity_shard(entity_dir, shard_path, files, encoding=config.DATASET_SHARDS_ENCODING):
+    """
+    Resize the images of an entity and write them to a TFRecord shard, in the order of `files`.
+
+    Args:
+        entity_dir (str): Directory of the entity.
+        shard_path (str): Path of the shard, replaced atomically.
+        files (list): Filenames of the images.
+        encoding (str, optional): "jpeg" or "raw". Defaults to config.DATASET_SHARDS_ENCODING.
+    """
+    samples = [(file, os.path.join(entity_dir, file)) for file in files]
+    with tf.io.TFRecordWriter(f"{shard_path}.tmp") as writer:
+        for _, img_arrays in iter_image_batches(samples, load_image_array):
+            for img_array in img_arrays:
+                writer.write(encode_example(img_array, encoding))
+    os.replace(f"{shard_path}.tmp", shard_path)
+
+
+def compile_split(split_dir, encoding=None, force=False):
+    """
+    Compile the entities of a split directory into one shard of pre-resized images per entity.
+
+    Only the entities whose directory changed since the last compilation are rebuilt, and every
+    shard is re-encoded only when an encoding different from the one of the index is asked for.
+    The index is left untouched when nothing changed.
+
+    Args:
+        split_dir (str): Directory with one subdirectory per entity.
+        encoding (str, optional): "jpeg" or "raw". Defaults to None (the encoding of the existing shards,
+                                  config.DATASET_SHARDS_ENCODING for a new split).
+        force (bool, optional): Whether to rebuild every shard. Defaults to False.
+
+    Returns:
+        tuple: The shard index and the number of built, skipped and removed shards.
+    """
+    shards_dir = get_shards_dir(split_dir)
+    os.makedirs(shards_dir, exist_ok=True)
+
+    index_exists = os.path.exists(os.path.join(shards_dir, SHARD_INDEX_FILENAME))
+    index = load_shard_index(shards_dir)
+    encoding = encoding or index["encoding"]
+    reset = force or index["encoding"] != encoding or tuple(index["image_size"]) != SHARD_IMAGE_SIZE
+    if reset:
+        index = {"image_size": list(SHARD_IMAGE_SIZE), "encoding": encoding, "entities": {}}
+
+    stats = {"built": 0, "skipped": 0, "removed": 0}
+    entities = sorted(entry for entry in os.listdir(split_dir) if os.path.isdir(os.path.join(split_dir, entry)))
+
+    for entity in entities:
+        entity_dir = os.path.join(split_dir, entity)
+        signature = get_directory_signature(entity_dir)
+        entry = index["entities"].get(entity)
+        if entry and entry["signature"] == signature and os.path.exists(os.path.join(shards_dir, entry["shard"])):
+            stats["skipped"] += 1
+            continue
+
+        files = list_entity_images(entity_dir)
+        shard = f"{entity}.tfrecord"
+        write_entity_shard(entity_dir, os.path.join(shards_dir, shard), files, encoding)
+        index["entities"][entity] = {"signature": signature, "shard": shard, "files": files}
+        stats["built"] += 1
+
+        # Save after each entity so an interrupted compilation keeps its progress
+        save_shard_index(shards_dir, index)
+
+    for entity in set(index["entities"]) - set(entities):
+        shard_path = os.path.join(shards_dir, index["entities"].pop(entity)["shard"])
+        if os.path.exists(shard_path):
+            os.remove(shard_path)
+        stats["removed"] += 1
+
+    if reset or stats["removed"] or not index_exists:
+        save_shard_index(shards_dir, index)
+    return index, stats
+
+
+def build_shard_dataset(split_dir, batch_size=config.BATCH_SIZE, augment=False, shuffle=True,
+                        cache=config.TRAINING_CACHE_ENABLED, seed=None, augmentation=AUGMENTATION, num_shards=1, shard_index=0,
+                        compile=True):
+    """
+    Build a tf.data pipeline reading the shards of a split, compiling the changed entities first.
+
+    Trial and worker processes whose parent already compiled the split only read its index,
+    so they never write to the shard directory concurrently.
+
+    Args:
+        split_dir (str): Directory with one subdirectory per entity.
+        batch_size (int, optional): Number of images per batch. Defaults to config.BATCH_SIZE.
+        augment (bool, optional): Whether to apply the random augmentation. Defaults to False.
+        shuffle (bool, optional): Whether to reshuffle the images at each epoch. Defaults to True.
+        cache (bool or str, optional): True caches in memory, a path caches to files, False disables the cache.
+                                       Defaults to config.TRAINING_CACHE_ENABLED.
+        seed (int, optional): Seed of the shuffle. Defaults to None.
+        augmentation (dict, optional): Augmentation ranges. Defaults to AUGMENTATION.
+        num_shards (int, optional): Number of disjoint parts the images are split into, one per worker. Defaults to 1.
+        shard_index (int, optional): Index of the part read by this pipeline. Defaults to 0.
+        compile (bool, optional): Whether to compile the changed entities, or only read the index. Defaults to True.
+
+    Returns:
+        tuple: Repeated tf.data.Dataset of (images, one-hot labels) and the number of images of the part.
+    """
+    shards_dir = get_shards_dir(split_dir)
+    index = compile_split(split_dir)[0] if compile else load_shard_index(shards_dir)
+    encoding, image_size = index["encoding"], tuple(index["image_size"])
+
+    # Entities sorted by name, so labels match flow_from_directory and list_image_files
+    entities = sorted(index["entities"])
+    shard_paths = [os.path.join(shards_dir, index["entities"][entity]["shard"]) for entity in entities]
+    num_images = sum(len(index["entities"][entity]["files"]) for entity in entities)
+
+    dataset = tf.data.Dataset.from_tensor_slices((shard_paths, list(range(len(entities)))))
+    # The records are split between the workers in a deterministic order, so the parts do not overlap
+    dataset = dataset.interleave(
+        lambda shard_path, label: tf.data.TFRecordDataset(shard_path).map(lambda record: (record, label)),
+        num_parallel_calls=tf.data.AUTOTUNE, deterministic=num_shards > 1)
+    if num_shards > 1:
+        dataset = dataset.shard(num_shards, shard_index)
+        num_images = len(range(shard_index, num_images, num_shards))
+    dataset = dataset.map(
+        lambda record, label: (decode_example(record, encoding, image_size), tf.one_hot(label, config.NUM_ENTITIES)),
+        num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+
+    return batch_image_dataset(dataset, num_images, batch_size, augment, shuffle, cache, seed, augmentation), num_images
+
+
+def build_shard_training_datasets(batch_size=config.BATCH_SIZE, augmentation=AUGMENTATION, num_shards=1, shard_index=0,
+                                  compile=True):
+    """
+    Build the augmented training dataset and the validation dataset from the shards.
+
+    Args:
+        batch_size (int, optional): Number of images per batch. Defaults to config.BATCH_SIZE.
+        augmentation (dict, optional): Augmentation ranges of the training images. Defaults to AUGMENTATION.
+        num_shards (int, optional): Number of disjoint parts of each split, one per worker. Defaults to 1.
+        shard_index (int, optional): Index of the part read by this worker. Defaults to 0.
+        compile (bool, optional): Whether to compile the changed entities, or only read the indexes. Defaults to True.
+
+    Returns:
+        tuple: Training dataset, validation dataset, number of training images and number of validation images (of the part).
+    """
+    train_ds, num_train = build_shard_dataset(config.TRAIN_IMAGES_PATH, batch_size, augment=True, augmentation=augmentation,
+                                              num_shards=num_shards, shard_index=shard_index, compile=compile)
+    validation_ds, num_validation = build_shard_dataset(config.VALIDATION_IMAGES_PATH, batch_size, shuffle=False,
+                                                        num_shards=num_shards, shard_index=shard_index, compile=compile)
+    return train_ds, validation_ds, num_train, num_validation
+
+
+def load_entity_images(shards_dir, entry, encoding=config.DATASET_SHARDS_ENCODING, image_size=SHARD_IMAGE_SIZE):
+    """
+    Read all the images of an entity shard.
+
+    Args:
+        shards_dir (str): Directory of the shards of the split.
+        entry (dict): Index entry of the entity.
+        encoding (str, optional): "jpeg" or "raw". Defaults to config.DATASET_SHARDS_ENCODING.
+        image_size (tuple, optional): Height and width of the images. Defaults to SHARD_IMAGE_SIZE.
+
+    Returns:
+        np.ndarray: uint8 images of shape (files, height, width, 3), in the order of the entry files.
+    """
+    dataset = tf.data.TFRecordDataset(os.path.join(shards_dir, entry["shard"]))
+    dataset = dataset.map(lambda record: decode_example(record, encoding, image_size), num_parallel_calls=tf.data.AUTOTUNE)
+    return np.stack(list(dataset.as_numpy_iterator())) if entry["files"] else np.zeros((0, *image_size, 3), np.uint8)
+
+
+def get_shard_batches(samples, split_dir, batch_size=config.EVALUATION_BATCH_SIZE):
+    """
+    Get batches of preprocessed images read from the shards instead of the image files.
+
+    The changed entities are compiled first. Only the images of one entity are kept in memory.
+
+    Args:
+        samples (list): List of tuples whose last element is the image path, grouped by entity directory.
+        split_dir (str): Directory with one subdirectory per entity.
+        batch_size (int, optional): Number of images per batch. Defaults to config.EVALUATION_BATCH_SIZE.
+
+    Returns:
+        iterator: Iterator of (batch samples, image tensors) tuples, or None if an image is not in the shards.
+    """
+    index, _ = compile_split(split_dir)
+    shards_dir = get_shards_dir(split_dir)
+    encoding, image_size = index["encoding"], tuple(index["image_size"])
+
+    positions = {entity: {file: i for i, file in enumerate(entry["files"])} for entity, entry in index["entities"].items()}
+    keys = [(os.path.basename(os.path.dirname(sample[-1])), os.path.basename(sample[-1])) for sample in samples]
+    in_split = all(os.path.normpath(os.path.dirname(os.path.dirname(sample[-1]))) == os.path.normpath(split_dir) for sample in samples)
+    if not in_split or any(file not in positions.get(entity, {}) for entity, file in keys):
+        return None
+
+    def iter_batches():
+        current_entity, entity_images = None, None
+        batch, img_arrays = [], []
+        for sample, (entity, file) in zip(samples, keys):
+            if entity != current_entity:
+                current_entity = entity
+                entity_images = load_entity_images(shards_dir, index["entities"][entity], encoding, image_size)
+
+            batch.append(sample)
+            img_arrays.append(entity_images[positions[entity][file]])
+            if len(batch) == batch_size:
+                yield batch, np.stack(img_arrays).astype(np.float32) / 255.0
+                batch, img_arrays = [], []
+
+        if batch:
+            yield batch, np.stack(img_arrays).astype(np.float32) / 255.0
+
+    return iter_batches()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile the image splits into shards of pre-resized images.")
+    parser.add_argument("--splits", nargs="+", default=[config.TRAIN_IMAGES_PATH, config.VALIDATION_IMAGES_PATH, config.EVALUATION_IMAGES_PATH])
+    parser.add_argument("--encoding", choices=("jpeg", "raw"), help="Re-encode the shards. Defaults to their current encoding.")
+    parser.add_argument("--force", action="store_true", help="Rebuild every shard.")
+    args = parser.parse_args()
+
+    for split_dir in args.splits:
+        _, stats = compile_split(split_dir, args.encoding, args.force)
+        print(f"{split_dir} - Built: {stats['built']}, Skipped: {stats['skipped']}, Removed: {stats['removed']}")
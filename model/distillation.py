@@ -0,0 +1,202 @@
+import os
+import json
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import EarlyStopping # type: ignore
+
+import config.config as config
+from evaluate.evaluate_model import calculate_overall_statistics, predictions_all_entities
+from model.data_pipeline import (AUGMENTATION, batch_image_dataset, build_training_datasets, decode_and_resize,
+                                 list_image_files, scale_augmentation)
+from model.head_training import get_cached_features
+from model.model import build_model
+from utils.latency import measure_batch_latency
+
+
+def build_distillation_loss(temperature=config.DISTILLATION_TEMPERATURE, alpha=config.DISTILLATION_ALPHA):
+    """
+    Build the loss of the student, mixing the true labels and the softened outputs of the teacher.
+
+    The targets are the one-hot labels concatenated with the teacher logits. The models end
+    with a softmax, so the logarithm of their probabilities is used as logits.
+
+    Args:
+        temperature (float, optional): Temperature softening both distributions. Defaults to config.DISTILLATION_TEMPERATURE.
+        alpha (float, optional): Weight of the true labels, 1 - alpha going to the teacher. Defaults to config.DISTILLATION_ALPHA.
+
+    Returns:
+        tuple: The loss and the accuracy metric on the true labels.
+    """
+    num_classes = config.NUM_ENTITIES
+
+    def distillation_loss(y_true, y_pred):
+        labels, teacher_logits = y_true[:, :num_classes], y_true[:, num_classes:]
+        student_logits = tf.math.log(tf.clip_by_value(y_pred, 1e-7, 1.0))
+
+        hard_loss = tf.keras.losses.categorical_crossentropy(labels, y_pred)
+        # KL divergence between the softened distributions of the teacher and of the student
+        teacher_log_probs = tf.nn.log_softmax(teacher_logits / temperature)
+        student_log_probs = tf.nn.log_softmax(student_logits / temperature)
+        soft_loss = tf.reduce_sum(tf.exp(teacher_log_probs) * (teacher_log_probs - student_log_probs), axis=-1)
+        # Scaled by T² so the soft gradients keep the same magnitude whatever the temperature
+        return alpha * hard_loss + (1 - alpha) * soft_loss * temperature ** 2
+
+    def accuracy(y_true, y_pred):
+        return tf.keras.metrics.categorical_accuracy(y_true[:, :num_classes], y_pred)
+
+    return distillation_loss, accuracy
+
+
+def build_cached_teacher_dataset(teacher, teacher_version, split_dir, batch_size=config.BATCH_SIZE, augment=False, shuffle=False):
+    """
+    Build a dataset of the images of a split with the labels and the cached teacher logits as targets.
+
+    The teacher runs once over the images, its outputs are cached by get_cached_features.
+    When augmenting, the student sees augmented images while the teacher logits come from the original ones.
+
+    Args:
+        teacher (tf.keras.Model): Teacher model.
+        teacher_version (str): Version of the teacher (e.g. "v0.3").
+        split_dir (str): Directory with one subdirectory per entity.
+        batch_size (int, optional): Number of images per batch. Defaults to config.BATCH_SIZE.
+        augment (bool, optional): Whether to apply the random augmentation. Defaults to False.
+        shuffle (bool, optional): Whether to reshuffle the images at each epoch. Defaults to False.
+
+    Returns:
+        tuple: Repeated tf.data.Dataset of (images, labels and teacher logits) and the number of images.
+    """
+    img_paths, labels, _ = list_image_files(split_dir)
+    teacher_outputs, _ = get_cached_features(teacher, teacher_version, split_dir, name="teacher-outputs")
+    teacher_logits = np.log(np.clip(teacher_outputs, 1e-7, 1.0)).astype(np.float32)
+
+    def decode(img_path, label, logits):
+        img, one_hot = decode_and_resize(img_path, label, (150, 150), config.NUM_ENTITIES)
+        return img, tf.concat([one_hot, logits], axis=0)
+
+    dataset = tf.data.Dataset.from_tensor_slices((img_paths, labels, teacher_logits))
+    dataset = dataset.map(decode, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    return batch_image_dataset(dataset, len(img_paths), batch_size, augment, shuffle), len(img_paths)
+
+
+def add_online_teacher_logits(dataset, teacher):
+    """
+    Append the logits of the teacher, run on each (augmented) batch, to the labels of a dataset.
+
+    Args:
+        dataset (tf.data.Dataset): Dataset of (images, one-hot labels) batches.
+        teacher (tf.keras.Model): Teacher model.
+
+    Returns:
+        tf.data.Dataset: Dataset of (images, labels and teacher logits) batches.
+    """
+    def add_logits(img_batch, label_batch):
+        teacher_logits = tf.math.log(tf.clip_by_value(teacher(img_batch, training=False), 1e-7, 1.0))
+        return img_batch, tf.concat([label_batch, teacher_logits], axis=1)
+
+    return dataset.map(add_logits).prefetch(tf.data.AUTOTUNE)
+
+
+def distill(teacher_version, student_version, architecture=config.DISTILLATION_STUDENT_ARCHITECTURE,
+            epochs=config.TRAINING_EPOCHS, batch_size=config.BATCH_SIZE, temperature=config.DISTILLATION_TEMPERATURE,
+            alpha=config.DISTILLATION_ALPHA, cache_teacher=config.DISTILLATION_CACHE_TEACHER,
+            augment=config.DISTILLATION_AUGMENT, patience=config.TRAINING_EARLY_STOPPING_PATIENCE):
+    """
+    Train a compact student model on the softened outputs of a teacher model version.
+
+    The student and its history are written to config.MODEL_VERSIONS_PATH as
+    <student version>.keras and <student version>-history.json, compiled like build_model.
+
+    Args:
+        teacher_version (str): Version of the teacher in config.MODEL_VERSIONS_PATH (e.g. "v0.3").
+        student_version (str): Version of the student.
+        architecture (str or dict, optional): Architecture of the student. Defaults to config.DISTILLATION_STUDENT_ARCHITECTURE.
+        epochs (int, optional): Maximum number of epochs. Defaults to config.TRAINING_EPOCHS.
+        batch_size (int, optional): Number of images per batch. Defaults to config.BATCH_SIZE.
+        temperature (float, optional): Softening temperature. Defaults to config.DISTILLATION_TEMPERATURE.
+        alpha (float, optional): Weight of the true labels. Defaults to config.DISTILLATION_ALPHA.
+        cache_teacher (bool, optional): Whether to cache the teacher logits of the original images instead of
+                                        running the teacher on every augmented batch. Defaults to config.DISTILLATION_CACHE_TEACHER.
+        augment (bool, optional): Whether to augment the training images of the student. Defaults to config.DISTILLATION_AUGMENT.
+        patience (int, optional): Epochs without improvement before stopping. Defaults to config.TRAINING_EARLY_STOPPING_PATIENCE.
+
+    Returns:
+        tuple: The student model and its history (dict of metric values per epoch).
+    """
+    teacher = tf.keras.models.load_model(f"{config.MODEL_VERSIONS_PATH}{teacher_version}.keras")
+    if teacher.output_shape[-1] != config.NUM_ENTITIES:
+        raise ValueError(f"The teacher {teacher_version} predicts {teacher.output_shape[-1]} entities instead of {config.NUM_ENTITIES}")
+
+    if cache_teacher:
+        train_ds, num_train = build_cached_teacher_dataset(teacher, teacher_version, config.TRAIN_IMAGES_PATH, batch_size, augment, shuffle=True)
+        validation_ds, num_validation = build_cached_teacher_dataset(teacher, teacher_version, config.VALIDATION_IMAGES_PATH, batch_size)
+    else:
+        augmentation = AUGMENTATION if augment else scale_augmentation(0)
+        train_ds, validation_ds, num_train, num_validation = build_training_datasets(batch_size, augmentation=augmentation)
+        train_ds = add_online_teacher_logits(train_ds, teacher)
+        validation_ds = add_online_teacher_logits(validation_ds, teacher)
+
+    student = build_model(architecture=architecture)
+    loss, accuracy = build_distillation_loss(temperature, alpha)
+    student.compile(loss=loss, optimizer='adam', metrics=[accuracy])
+
+    history = student.fit(
+        train_ds,
+        steps_per_epoch=max(1, num_train // batch_size),
+        epochs=epochs,
+        validation_data=validation_ds,
+        validation_steps=max(1, num_validation // batch_size),
+        callbacks=[EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True)]
+    )
+    history = {key: [float(value) for value in values] for key, values in history.history.items()}
+
+    # Compile like build_model so the saved student loads without the distillation loss
+    student.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
+    os.makedirs(config.MODEL_VERSIONS_PATH, exist_ok=True)
+    student.save(f"{config.MODEL_VERSIONS_PATH}{student_version}.keras")
+    with open(f"{config.MODEL_VERSIONS_PATH}{student_version}-history.json", 'w') as file:
+        json.dump(history, file, indent=4)
+
+    return student, history
+
+
+def evaluate_distillation(teacher_version, student_version, batch_sizes=(1, config.EVALUATION_BATCH_SIZE)):
+    """
+    Compare the student with its teacher on the evaluation images and on CPU latency.
+
+    Args:
+        teacher_version (str): Version of the teacher (e.g. "v0.3").
+        student_version (str): Version of the student.
+        batch_sizes (tuple, optional): Batch sizes of the latency measurements. Defaults to (1, config.EVALUATION_BATCH_SIZE).
+
+    Returns:
+        dict: Dictionary mapping each version to its params, its overall predictions_all_entities statistics,
+              the statistics of each entity and its median latency per image (ms) for each batch size.
+    """
+    report = {}
+    for version in (teacher_version, student_version):
+        model = tf.keras.models.load_model(f"{config.MODEL_VERSIONS_PATH}{version}.keras")
+        predictions = predictions_all_entities(model, model_version=version)
+        report[version] = {
+            "params": model.count_params(),
+            "overall": calculate_overall_statistics(predictions),
+            "entities": {entity: {key: value for key, value in details.items() if not isinstance(value, dict)}
+                         for entity, details in predictions.items()},
+            "latency_ms_per_image": {batch_size: round(measure_batch_latency(model, batch_size) / batch_size, 3)
+                                     for batch_size in batch_sizes},
+        }
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Distill a model version into a compact student.")
+    parser.add_argument("--teacher", default=config.MODEL_LAST_VERSION)
+    parser.add_argument("--student", required=True)
+    parser.add_argument("--architecture", default=config.DISTILLATION_STUDENT_ARCHITECTURE)
+    parser.add_argument("--epochs", type=int, default=config.TRAINING_EPOCHS)
+    parser.add_argument("--online-teacher", action="store_true", help="Run the teacher on every augmented batch instead of caching its logits.")
+    args = parser.parse_args()
+
+    distill(args.teacher, args.student, args.architecture, args.epochs, cache_teacher=not args.online_teacher)
+    report = evaluate_distillation(args.teacher, args.student)
+    print(json.dumps({version: {key: value for key, value in result.items() if key != "entities"} for version, result in report.items()}, indent=4))
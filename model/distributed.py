@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import socket
+import argparse
+import functools
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import config.config as config
+from model.sweep import init_worker
+
+
+def get_free_ports(count):
+    """
+    Get free TCP ports of localhost for the workers of a local cluster.
+
+    Args:
+        count (int): Number of ports.
+
+    Returns:
+        list: Port numbers.
+    """
+    sockets = []
+    try:
+        # Every socket stays open until all ports are found, so they are distinct
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(("localhost", 0))
+            sockets.append(sock)
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def build_tf_config(hosts, task_index):
+    """
+    Build the TF_CONFIG of a worker of the cluster.
+
+    Args:
+        hosts (list): Addresses of the workers ("host:port"), the first one being the chief.
+        task_index (int): Index of the worker in `hosts`.
+
+    Returns:
+        dict: The TF_CONFIG read by MultiWorkerMirroredStrategy.
+    """
+    return {"cluster": {"worker": list(hosts)}, "task": {"type": "worker", "index": task_index}}
+
+
+def count_images(split_dir, use_shards=config.DATASET_SHARDS_ENABLED):
+    """
+    Count the images of a split, without reading them.
+
+    Args:
+        split_dir (str): Directory with one subdirectory per entity.
+        use_shards (bool, optional): Whether to count the images of the compiled shards. Defaults to config.DATASET_SHARDS_ENABLED.
+
+    Returns:
+        int: Number of images.
+    """
+    if use_shards:
+        from model.dataset_shards import get_shards_dir, load_shard_index
+        index = load_shard_index(get_shards_dir(split_dir))
+        return sum(len(entry["files"]) for entry in index["entities"].values())
+
+    from model.data_pipeline import list_image_files
+    return len(list_image_files(split_dir)[0])
+
+
+def train_worker(hosts, task_index, version=None, epochs=config.TRAINING_EPOCHS,
+                 batch_size_per_worker=config.DISTRIBUTED_BATCH_SIZE_PER_WORKER, architecture=config.MODEL_ARCHITECTURE,
+                 patience=None, use_shards=config.DATASET_SHARDS_ENABLED):
+    """
+    Run one worker of a data-parallel training.
+
+    Each worker reads its own part of the training and validation images, computes the gradients of
+    its batch and synchronizes them with the other workers (all-reduce), so the global batch is
+    `batch_size_per_worker` x workers. Every worker must be started with the same arguments.
+
+    Args:
+        hosts (list): Addresses of the workers ("host:port"), the first one being the chief.
+        task_index (int): Index of this worker in `hosts`.
+        version (str, optional): Version saved by the chief to config.MODEL_VERSIONS_PATH. Defaults to None (not saved).
+        epochs (int, optional): Number of epochs. Defaults to config.TRAINING_EPOCHS.
+        batch_size_per_worker (int, optional): Number of images per batch of each worker. Defaults to config.DISTRIBUTED_BATCH_SIZE_PER_WORKER.
+        architecture (str or dict, optional): Variant of model/architectures.py. Defaults to config.MODEL_ARCHITECTURE.
+        patience (int, optional): Epochs without improvement before stopping. Defaults to None (no early stopping).
+        use_shards (bool, optional): Whether to read the compiled dataset shards. Defaults to config.DATASET_SHARDS_ENABLED.
+
+    Returns:
+        dict: Index of the worker, number of workers, global batch size, steps per epoch, duration of each epoch (s) and history.
+    """
+    # Read by MultiWorkerMirroredStrategy when it is created
+    os.environ["TF_CONFIG"] = json.dumps(build_tf_config(hosts, task_index))
+
+    # TensorFlow is imported in the worker, after init_worker limited its threads
+    import tensorflow as tf
+    from model.data_pipeline import build_training_datasets
+    from model.dataset_shards import build_shard_training_datasets
+    from model.model import build_model
+
+    threads = int(os.environ.get("TF_NUM_INTRAOP_THREADS", 0))
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    except RuntimeError:
+        pass
+
+    communication = tf.distribute.experimental.CommunicationOptions(
+        implementation=tf.distribute.experimental.CommunicationImplementation.RING)
+    strategy = tf.distribute.MultiWorkerMirroredStrategy(communication_options=communication)
+    num_workers = len(hosts)
+    global_batch_size = batch_size_per_worker * num_workers
+
+    # The shards were compiled by launch_local, the workers only read them
+    build_datasets = functools.partial(build_shard_training_datasets, compile=False) if use_shards else build_training_datasets
+    datasets = {}
+
+    def dataset_fn(split):
+        def build(input_context):
+            # One input pipeline per worker, reading its own part of the images
+            if input_context.input_pipeline_id not in datasets:
+                datasets[input_context.input_pipeline_id] = build_datasets(
+                    input_context.get_per_replica_batch_size(global_batch_size),
+                    num_shards=input_context.num_input_pipelines, shard_index=input_context.input_pipeline_id)
+            return datasets[input_context.input_pipeline_id][split]
+        return build
+
+    train_ds = strategy.distribute_datasets_from_function(dataset_fn(0))
+    validation_ds = strategy.distribute_datasets_from_function(dataset_fn(1))
+
+    # Steps of the smallest part, so every worker runs the same number of steps
+    steps_per_epoch = max(1, count_images(config.TRAIN_IMAGES_PATH, use_shards) // num_workers // batch_size_per_worker)
+    validation_steps = max(1, count_images(config.VALIDATION_IMAGES_PATH, use_shards) // num_workers // batch_size_per_worker)
+
+    with strategy.scope():
+        model = build_model(architecture=architecture)
+        model.optimizer.build(model.trainable_variables)
+    loss_fn = tf.keras.losses.CategoricalCrossentropy(reduction=None)
+
+    # Custom loop instead of model.fit, whose first batch all-reduce fails with several workers
+    def step_outputs(labels, predictions):
+        loss = tf.nn.compute_average_loss(loss_fn(labels, predictions), global_batch_size=global_batch_size)
+        correct = tf.reduce_sum(tf.cast(tf.argmax(labels, axis=-1) == tf.argmax(predictions, axis=-1), tf.float32))
+        return loss, correct
+
+    @tf.function
+    def train_step(iterator):
+        def step(images, labels):
+            with tf.GradientTape() as tape:
+                loss, correct = step_outputs(labels, model(images, training=True))
+            # The optimizer sums the gradients of the workers
+            gradients = tape.gradient(loss, model.trainable_variables)
+            model.optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+            return loss, correct
+
+        loss, correct = strategy.run(step, args=next(iterator))
+        return strategy.reduce("SUM", loss, axis=None), strategy.reduce("SUM", correct, axis=None)
+
+    @tf.function
+    def validation_step(iterator):
+        def step(images, labels):
+            return step_outputs(labels, model(images, training=False))
+
+        loss, correct = strategy.run(step, args=next(iterator))
+        return strategy.reduce("SUM", loss, axis=None), strategy.reduce("SUM", correct, axis=None)
+
+    def run_epoch(step_fn, iterator, steps):
+        total_loss, total_correct = 0.0, 0.0
+        for _ in range(steps):
+            loss, correct = step_fn(iterator)
+            total_loss, total_correct = total_loss + float(loss), total_correct + float(correct)
+        return total_loss / steps, total_correct / (steps * global_batch_size)
+
+    train_iterator, validation_iterator = iter(train_ds), iter(validation_ds)
+    history = {"loss": [], "accuracy": [], "val_loss": [], "val_accuracy": []}
+    epoch_times, best_weights, best_epoch = [], None, 0
+
+    for epoch in range(epochs):
+        start_time = time.perf_counter()
+        loss, accuracy = run_epoch(train_step, train_iterator, steps_per_epoch)
+        epoch_times.append(time.perf_counter() - start_time)
+        val_loss, val_accuracy = run_epoch(validation_step, validation_iterator, validation_steps)
+
+        for key, value in zip(history, (loss, accuracy, val_loss, val_accuracy)):
+            history[key].append(value)
+        if task_index == 0:
+            print(f"Epoch {epoch + 1}/{epochs} - {epoch_times[-1]:.1f} s - loss: {loss:.4f} - accuracy: {accuracy:.4f} - "
+                  f"val_loss: {val_loss:.4f} - val_accuracy: {val_accuracy:.4f}")
+
+        # The losses are reduced over the workers, so they all stop at the same epoch
+        if val_loss <= min(history["val_loss"]):
+            best_weights, best_epoch = model.get_weights(), epoch
+        elif patience is not None and epoch - best_epoch >= patience:
+            break
+
+    # Keep the best weights when stopping early
+    if patience is not None:
+        model.set_weights(best_weights)
+
+    # Only the chief writes the model, the other workers hold the same weights
+    if version is not None and task_index == 0:
+        os.makedirs(config.MODEL_VERSIONS_PATH, exist_ok=True)
+        model.save(f"{config.MODEL_VERSIONS_PATH}{version}.keras")
+        with open(f"{config.MODEL_VERSIONS_PATH}{version}-history.json", 'w') as file:
+            json.dump(history, file, indent=4)
+
+    return {
+        "task_index": task_index,
+        "workers": num_workers,
+        "global_batch_size": global_batch_size,
+        "steps_per_epoch": steps_per_epoch,
+        "epoch_seconds": [round(seconds, 3) for seconds in epoch_times],
+        "history": history,
+    }
+
+
+def launch_local(num_workers=config.DISTRIBUTED_NUM_WORKERS, threads_per_worker=config.DISTRIBUTED_THREADS_PER_WORKER,
+                 config_overrides=None, **kwargs):
+    """
+    Launch a data-parallel training with `num_workers` processes on this machine.
+
+    Args:
+        num_workers (int, optional): Number of worker processes. Defaults to config.DISTRIBUTED_NUM_WORKERS.
+        threads_per_worker (int, optional): CPU threads of each worker. Defaults to config.DISTRIBUTED_THREADS_PER_WORKER.
+        config_overrides (dict, optional): Config attributes to override in the workers. Defaults to None.
+        **kwargs: Arguments of train_worker (version, epochs, batch_size_per_worker, architecture, patience, use_shards).
+
+    Returns:
+        list: Results of the workers, ordered by index.
+    """
+    hosts = [f"localhost:{port}" for port in get_free_ports(num_workers)]
+
+    if kwargs.get("use_shards", config.DATASET_SHARDS_ENABLED):
+        # Compile the changed entities once instead of in every worker
+        from model.dataset_shards import compile_split
+        compile_split(config.TRAIN_IMAGES_PATH)
+        compile_split(config.VALIDATION_IMAGES_PATH)
+
+    # Spawned processes start without TensorFlow, so the thread limits apply
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(num_workers, mp_context=context, initializer=init_worker,
+                             initargs=(threads_per_worker, config_overrides or {})) as executor:
+        futures = [executor.submit(train_worker, hosts, task_index, **kwargs) for task_index in range(num_workers)]
+        return [future.result() for future in futures]
+
+
+def benchmark_scaling(worker_counts=config.DISTRIBUTED_SCALING_WORKERS, epochs=config.DISTRIBUTED_SCALING_EPOCHS,
+                      threads_per_worker=config.DISTRIBUTED_THREADS_PER_WORKER,
+                      batch_size_per_worker=config.DISTRIBUTED_BATCH_SIZE_PER_WORKER, config_overrides=None, **kwargs):
+    """
+    Measure the training throughput and the scaling efficiency for several numbers of local workers.
+
+    The batch of each worker is fixed, so the global batch grows with the workers (weak scaling).
+    The efficiency is the throughput per worker relative to the smallest worker count, 1.0 being linear scaling.
+
+    Args:
+        worker_counts (list, optional): Numbers of workers. Defaults to config.DISTRIBUTED_SCALING_WORKERS.
+        epochs (int, optional): Epochs per worker count, the first one is not timed. Defaults to config.DISTRIBUTED_SCALING_EPOCHS.
+        threads_per_worker (int, optional): CPU threads of each worker. Defaults to config.DISTRIBUTED_THREADS_PER_WORKER.
+        batch_size_per_worker (int, optional): Number of images per batch of each worker. Defaults to config.DISTRIBUTED_BATCH_SIZE_PER_WORKER.
+        config_overrides (dict, optional): Config attributes to override in the workers. Defaults to None.
+        **kwargs: Other arguments of train_worker (architecture, use_shards).
+
+    Returns:
+        dict: Dictionary mapping each worker count to its global batch size, median epoch time (s),
+              throughput (images/s) and scaling efficiency.
+    """
+    report = {}
+    for num_workers in sorted(worker_counts):
+        results = launch_local(num_workers, threads_per_worker, config_overrides, epochs=epochs,
+                               batch_size_per_worker=batch_size_per_worker, **kwargs)
+        chief = results[0]
+        # The slowest worker sets the pace of the synchronous steps
+        epoch_seconds = [max(times) for times in zip(*(result["epoch_seconds"] for result in results))]
+        epoch_seconds = statistics.median(epoch_seconds[1:] or epoch_seconds)
+        throughput = chief["steps_per_epoch"] * chief["global_batch_size"] / epoch_seconds
+
+        base_workers, base = next(iter(report.items()), (num_workers, {"images_per_second": throughput}))
+        report[num_workers] = {
+            "global_batch_size": chief["global_batch_size"],
+            "epoch_seconds": round(epoch_seconds, 3),
+            "images_per_second": round(throughput, 1),
+            "efficiency": round((throughput / num_workers) / (base["images_per_second"] / base_workers), 3),
+        }
+        print(f"{num_workers:>3} workers - global batch: {chief['global_batch_size']:>5}, epoch: {epoch_seconds:>8.2f} s, "
+              f"{throughput:>8.1f} images/s, efficiency: {report[num_workers]['efficiency']:.2f}")
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Data-parallel training with several worker processes.")
+    parser.add_argument("--version", help="Version saved by the chief.")
+    parser.add_argument("--workers", type=int, default=config.DISTRIBUTED_NUM_WORKERS, help="Worker processes launched on this machine.")
+    parser.add_argument("--hosts", nargs="+", help="Addresses (host:port) of the workers of a multi-host cluster, the first one being the chief.")
+    parser.add_argument("--task-index", type=int, default=0, help="Index in --hosts of the worker run by this process.")
+    parser.add_argument("--epochs", type=int, default=config.TRAINING_EPOCHS)
+    parser.add_argument("--threads", type=int, default=config.DISTRIBUTED_THREADS_PER_WORKER, help="CPU threads per worker.")
+    parser.add_argument("--scaling", nargs="*", type=int, help="Benchmark the scaling efficiency for these worker counts.")
+    args = parser.parse_args()
+
+    if args.scaling is not None:
+        benchmark_scaling(args.scaling or config.DISTRIBUTED_SCALING_WORKERS, threads_per_worker=args.threads)
+    elif args.hosts:
+        init_worker(args.threads, {})
+        train_worker(args.hosts, args.task_index, args.version, args.epochs)
+    else:
+        launch_local(args.workers, args.threads, version=args.version, epochs=args.epochs)
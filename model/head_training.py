@@ -0,0 +1,215 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Dense, Flatten, GlobalAveragePooling2D # type: ignore
+from tensorflow.keras.callbacks import EarlyStopping # type: ignore
+
+import config.config as config
+from model.data_pipeline import decode_and_resize, list_image_files
+
+
+def split_model(model):
+    """
+    Split a trained model into its convolutional feature extractor and its dense head.
+
+    Args:
+        model (tf.keras.Model): Trained Sequential model ending with Flatten (or GlobalAveragePooling2D) and Dense layers.
+
+    Returns:
+        tuple: Feature extractor (tf.keras.Model up to the Flatten output) and the list of head layers.
+    """
+    flatten_index = next((i for i, layer in enumerate(model.layers) if isinstance(layer, (Flatten, GlobalAveragePooling2D))), None)
+    if flatten_index is None:
+        raise ValueError("The model has no Flatten or GlobalAveragePooling2D layer separating the convolutional stack from the head")
+
+    extractor = tf.keras.Model(model.inputs, model.layers[flatten_index].output)
+    return extractor, model.layers[flatten_index + 1:]
+
+
+def get_features_signature(img_paths, model_path):
+    """
+    Get the signature used to detect changes of the images or of the base model.
+
+    Args:
+        img_paths (list): Paths of the images.
+        model_path (str): Path of the base model.
+
+    Returns:
+        str: SHA-1 of the paths, sizes and modification times of the images and of the model.
+    """
+    digest = hashlib.sha1()
+    for path in [model_path, *img_paths]:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def extract_features(extractor, img_paths, batch_size=config.HEAD_TRAINING_BATCH_SIZE):
+    """
+    Run images through the feature extractor, in order and without augmentation.
+
+    Args:
+        extractor (tf.keras.Model): Feature extractor.
+        img_paths (list): Paths of the images.
+        batch_size (int, optional): Number of images per forward pass. Defaults to config.HEAD_TRAINING_BATCH_SIZE.
+
+    Returns:
+        np.ndarray: float32 features of shape (images, features).
+    """
+    image_size = tuple(extractor.input_shape[1:3])
+    dataset = tf.data.Dataset.from_tensor_slices(img_paths)
+    dataset = dataset.map(lambda img_path: decode_and_resize(img_path, 0, image_size, 1)[0], num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.batch(batch_size).map(lambda img_batch: tf.cast(img_batch, tf.float32) / 255.0).prefetch(tf.data.AUTOTUNE)
+    return extractor.predict(dataset, verbose=0)
+
+
+def get_cached_features(extractor, base_version, split_dir, batch_size=config.HEAD_TRAINING_BATCH_SIZE, name="features"):
+    """
+    Get the features and labels of a split, extracting them only if the images or the base model changed.
+
+    Features are stored as <split>-<name>.npy in config.FEATURE_CACHE_PATH/<base version>/
+    and memory-mapped when loaded.
+
+    Args:
+        extractor (tf.keras.Model): Feature extractor of the base model.
+        base_version (str): Version of the base model (e.g. "v0.3").
+        split_dir (str): Directory with one subdirectory per entity.
+        batch_size (int, optional): Number of images per forward pass. Defaults to config.HEAD_TRAINING_BATCH_SIZE.
+        name (str, optional): Name of the cached outputs, for several extractors of a version. Defaults to "features".
+
+    Returns:
+        tuple: Features (np.ndarray, memory-mapped) and one-hot labels.
+    """
+    img_paths, labels, _ = list_image_files(split_dir)
+    signature = get_features_signature(img_paths, f"{config.MODEL_VERSIONS_PATH}{base_version}.keras")
+
+    cache_dir = os.path.join(config.FEATURE_CACHE_PATH, base_version)
+    split = os.path.basename(os.path.normpath(split_dir))
+    features_path = os.path.join(cache_dir, f"{split}-{name}.npy")
+    meta_path = os.path.join(cache_dir, f"{split}-{name}.json")
+
+    meta = None
+    if os.path.exists(meta_path) and os.path.exists(features_path):
+        with open(meta_path, 'r') as file:
+            meta = json.load(file)
+
+    if meta is None or meta["signature"] != signature:
+        print(f"Feature cache - Extracting the {name} of {len(img_paths)} {split} images")
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(features_path, extract_features(extractor, img_paths, batch_size))
+        with open(meta_path, 'w') as file:
+            json.dump({"signature": signature, "images": len(img_paths)}, file)
+    else:
+        print(f"Feature cache - Using the cached {name} of {len(img_paths)} {split} images")
+
+    features = np.load(features_path, mmap_mode='r')
+    return features, tf.keras.utils.to_categorical(labels, config.NUM_ENTITIES)
+
+
+def build_head(head_layers, num_features, warm_start=True):
+    """
+    Build a trainable copy of the dense head, taking flattened features as input.
+
+    Args:
+        head_layers (list): Layers of the head of the base model.
+        num_features (int): Number of flattened features.
+        warm_start (bool, optional): Whether to start from the weights of the base model. Defaults to True.
+
+    Returns:
+        tf.keras.Model: The compiled head.
+    """
+    layers = []
+    for i, layer in enumerate(head_layers):
+        layer_config = layer.get_config()
+        # The last layer follows the current number of entities
+        if i == len(head_layers) - 1 and isinstance(layer, Dense):
+            layer_config["units"] = config.NUM_ENTITIES
+        layers.append(layer.__class__.from_config(layer_config))
+
+    head = tf.keras.Sequential([tf.keras.Input((num_features,)), *layers])
+    if warm_start:
+        for layer, base_layer in zip(layers, head_layers):
+            weights = base_layer.get_weights()
+            if [w.shape for w in weights] == [w.shape for w in layer.get_weights()]:
+                layer.set_weights(weights)
+
+    head.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
+    return head
+
+
+def attach_head(extractor, head):
+    """
+    Re-attach a trained head to the feature extractor into a full deployable model.
+
+    Args:
+        extractor (tf.keras.Model): Feature extractor of the base model.
+        head (tf.keras.Model): Trained head.
+
+    Returns:
+        tf.keras.Model: The compiled full model, taking images as input.
+    """
+    model = tf.keras.Sequential([tf.keras.Input(extractor.input_shape[1:]), *extractor.layers[1:], *head.layers])
+    model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
+    return model
+
+
+def train_head(base_version, version, epochs=config.HEAD_TRAINING_EPOCHS, batch_size=config.HEAD_TRAINING_BATCH_SIZE,
+               patience=config.TRAINING_EARLY_STOPPING_PATIENCE, warm_start=True):
+    """
+    Retrain only the dense head of a model version on cached convolutional features.
+
+    The convolutional stack of the base version is frozen: the training and validation images
+    are run through it once and their features cached, then only the head is trained on them.
+    Features are computed without augmentation. The full model and its history are written to
+    config.MODEL_VERSIONS_PATH as <version>.keras and <version>-history.json.
+
+    Args:
+        base_version (str): Version whose convolutional stack is reused (e.g. "v0.3").
+        version (str): Version of the retrained model.
+        epochs (int, optional): Maximum number of epochs. Defaults to config.HEAD_TRAINING_EPOCHS.
+        batch_size (int, optional): Number of feature vectors per batch. Defaults to config.HEAD_TRAINING_BATCH_SIZE.
+        patience (int, optional): Epochs without improvement before stopping. Defaults to config.TRAINING_EARLY_STOPPING_PATIENCE.
+        warm_start (bool, optional): Whether to start from the head weights of the base version. Defaults to True.
+
+    Returns:
+        tuple: The full model and the history of the head training (dict of metric values per epoch).
+    """
+    base_model = tf.keras.models.load_model(f"{config.MODEL_VERSIONS_PATH}{base_version}.keras")
+    extractor, head_layers = split_model(base_model)
+
+    train_features, train_labels = get_cached_features(extractor, base_version, config.TRAIN_IMAGES_PATH, batch_size)
+    validation_features, validation_labels = get_cached_features(extractor, base_version, config.VALIDATION_IMAGES_PATH, batch_size)
+
+    head = build_head(head_layers, train_features.shape[1], warm_start)
+    history = head.fit(
+        train_features,
+        train_labels,
+        batch_size=batch_size,
+        epochs=epochs,
+        validation_data=(validation_features, validation_labels),
+        callbacks=[EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True)]
+    )
+
+    model = attach_head(extractor, head)
+    history = {key: [float(value) for value in values] for key, values in history.history.items()}
+
+    os.makedirs(config.MODEL_VERSIONS_PATH, exist_ok=True)
+    model.save(f"{config.MODEL_VERSIONS_PATH}{version}.keras")
+    with open(f"{config.MODEL_VERSIONS_PATH}{version}-history.json", 'w') as file:
+        json.dump(history, file, indent=4)
+
+    return model, history
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Retrain the dense head of a model version on cached features.")
+    parser.add_argument("--base-version", default=config.MODEL_LAST_VERSION)
+    parser.add_argument("--version", required=True)
+    parser.add_argument("--epochs", type=int, default=config.HEAD_TRAINING_EPOCHS)
+    parser.add_argument("--cold-start", action="store_true", help="Reinitialize the head instead of starting from the base weights.")
+    args = parser.parse_args()
+
+    train_head(args.base_version, args.version, args.epochs, warm_start=not args.cold_start)
@@ -1,128 +1,318 @@
+import os
+import json
+import shutil
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras.preprocessing.image import ImageDataGenerator # type: ignore
-from tensorflow.keras.models import Sequential # type: ignore
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense # type: ignore
+from tensorflow.keras.callbacks import Callback, EarlyStopping # type: ignore
 import matplotlib.pyplot as plt
 
 import config.config as config
+from model.architectures import build_architecture, get_architecture_options
+from model.data_pipeline import build_training_datasets
+from model.dataset_shards import build_shard_training_datasets
 
 
-# Calcul du nombre d'étapes par epoch et de la validation_steps
-steps_per_epoch = (config.TRAIN_IMAGES_PER_ENTITIES * config.NUM_ENTITIES) // config.BATCH_SIZE
-validation_steps = (config.VALIDATION_IMAGES_PER_ENTITIES * config.NUM_ENTITIES) // config.BATCH_SIZE
-
-# Générer les données avec augmentation
-train_datagen = ImageDataGenerator(
-    rescale=1. / 255,
-    rotation_range=40,
-    width_shift_range=0.2,
-    height_shift_range=0.2,
-    shear_range=0.2,
-    zoom_range=0.2,
-    horizontal_flip=True,
-    fill_mode='nearest')
-
-validation_datagen = ImageDataGenerator(rescale=1. / 255)
-
-# Génération des flux de données pour l'entraînement et la validation
-train_generator = train_datagen.flow_from_directory(
-    config.TRAIN_IMAGES_PATH,
-    target_size=(150, 150),
-    batch_size=config.BATCH_SIZE,
-    class_mode='categorical')
-
-validation_generator = validation_datagen.flow_from_directory(
-    config.VALIDATION_IMAGES_PATH,
-    target_size=(150, 150),
-    batch_size=config.BATCH_SIZE,
-    class_mode='categorical')
-
-# Modèle CNN
-model = Sequential([
-    Conv2D(32, (3, 3), activation='relu', input_shape=(150, 150, 3)),
-    MaxPooling2D((2, 2)),
-    Conv2D(64, (3, 3), activation='relu'),
-    MaxPooling2D((2, 2)),
-    Conv2D(128, (3, 3), activation='relu'),
-    MaxPooling2D((2, 2)),
-    Conv2D(128, (3, 3), activation='relu'),
-    MaxPooling2D((2, 2)),
-    Flatten(),
-    Dense(512, activation='relu'),
-    Dense(config.NUM_ENTITIES, activation='softmax')
-])
-
-# Compilation du modèle
-model.compile(loss='categorical_crossentropy',
-              optimizer='adam',
-              metrics=['accuracy'])
-
-
-# Fonction génératrice pour train
-def train_gen():
-    while True:
-        x, y = next(train_generator)
-        yield x, y
-
-
-# Fonction génératrice pour validation
-def val_gen():
-    while True:
-        x, y = next(validation_generator)
-        yield x, y
-
-
-# Création des datasets
-train_ds = tf.data.Dataset.from_generator(
-    train_gen,
-    output_types=(tf.float32, tf.float32),
-    output_shapes=((None, 150, 150, 3), (None, config.NUM_ENTITIES))
-)
-
-validation_ds = tf.data.Dataset.from_generator(
-    val_gen,
-    output_types=(tf.float32, tf.float32),
-    output_shapes=((None, 150, 150, 3), (None, config.NUM_ENTITIES))
-)
-
-# Utilisation de la méthode .repeat() avec les objets tf.data.Dataset
-train_ds = train_ds.repeat()
-validation_ds = validation_ds.repeat()
-
-# Entraînement du modèle avec les objets tf.data.Dataset
-history = model.fit(
-    train_ds,
-    steps_per_epoch=steps_per_epoch,
-    epochs=30,
-    validation_data=validation_ds,
-    validation_steps=validation_steps
-)
-
-# Enregistrer le modèle
-model.save(f"./models/{config.MODEL_LAST_VERSION}.keras")
-
-"""
-evaluation
-"""
-
-# Afficher les courbes de précision et de perte
-acc = history.history['accuracy']
-val_acc = history.history['val_accuracy']
-loss = history.history['loss']
-val_loss = history.history['val_loss']
-
-epochs = range(len(acc))
-
-plt.plot(epochs, acc, 'bo', label='Training accuracy')
-plt.plot(epochs, val_acc, 'b', label='Validation accuracy')
-plt.title('Training and validation accuracy')
-plt.legend()
-
-plt.figure()
-
-plt.plot(epochs, loss, 'bo', label='Training loss')
-plt.plot(epochs, val_loss, 'b', label='Validation loss')
-plt.title('Training and validation loss')
-plt.legend()
-
-plt.show()
+def build_generators():
+    """
+    Build the Keras generators of the training and validation images.
+
+    Returns:
+        tuple: Training and validation DirectoryIterator.
+    """
+    # Générer les données avec augmentation
+    train_datagen = ImageDataGenerator(
+        rescale=1. / 255,
+        rotation_range=40,
+        width_shift_range=0.2,
+        height_shift_range=0.2,
+        shear_range=0.2,
+        zoom_range=0.2,
+        horizontal_flip=True,
+        fill_mode='nearest')
+
+    validation_datagen = ImageDataGenerator(rescale=1. / 255)
+
+    # Génération des flux de données pour l'entraînement et la validation
+    train_generator = train_datagen.flow_from_directory(
+        config.TRAIN_IMAGES_PATH,
+        target_size=(150, 150),
+        batch_size=config.BATCH_SIZE,
+        class_mode='categorical')
+
+    validation_generator = validation_datagen.flow_from_directory(
+        config.VALIDATION_IMAGES_PATH,
+        target_size=(150, 150),
+        batch_size=config.BATCH_SIZE,
+        class_mode='categorical')
+
+    return train_generator, validation_generator
+
+
+def build_datasets(train_generator, validation_generator):
+    """
+    Wrap the Keras generators into repeated tf.data datasets.
+
+    Args:
+        train_generator (DirectoryIterator): Generator of the training images.
+        validation_generator (DirectoryIterator): Generator of the validation images.
+
+    Returns:
+        tuple: Training and validation tf.data.Dataset.
+    """
+    # Fonction génératrice pour train
+    def train_gen():
+        while True:
+            x, y = next(train_generator)
+            yield x, y
+
+    # Fonction génératrice pour validation
+    def val_gen():
+        while True:
+            x, y = next(validation_generator)
+            yield x, y
+
+    # Création des datasets
+    train_ds = tf.data.Dataset.from_generator(
+        train_gen,
+        output_types=(tf.float32, tf.float32),
+        output_shapes=((None, 150, 150, 3), (None, config.NUM_ENTITIES))
+    )
+
+    validation_ds = tf.data.Dataset.from_generator(
+        val_gen,
+        output_types=(tf.float32, tf.float32),
+        output_shapes=((None, 150, 150, 3), (None, config.NUM_ENTITIES))
+    )
+
+    # Utilisation de la méthode .repeat() avec les objets tf.data.Dataset
+    return train_ds.repeat(), validation_ds.repeat()
+
+
+def build_model(width_multiplier=None, learning_rate=0.001, architecture=config.MODEL_ARCHITECTURE):
+    """
+    Build and compile the CNN.
+
+    Args:
+        width_multiplier (float, optional): Factor applied to the number of filters and units,
+                                            overriding the one of the architecture. Defaults to None.
+        learning_rate (float, optional): Learning rate of Adam. Defaults to 0.001.
+        architecture (str or dict, optional): Variant of model/architectures.py, or its options.
+                                              Defaults to config.MODEL_ARCHITECTURE.
+
+    Returns:
+        tf.keras.Model: The compiled model.
+    """
+    options = dict(get_architecture_options(architecture))
+    if width_multiplier is not None:
+        options["width_multiplier"] = width_multiplier
+
+    # Modèle CNN
+    model = build_architecture(**options)
+
+    # Compilation du modèle
+    model.compile(loss='categorical_crossentropy',
+                  optimizer=tf.keras.optimizers.Adam(learning_rate),
+                  metrics=['accuracy'])
+
+    return model
+
+
+def plot_history(history):
+    """
+    Plot the accuracy and loss curves of a training.
+
+    Args:
+        history (dict): Metric values per epoch, as returned by train().
+    """
+    # Afficher les courbes de précision et de perte
+    acc = history['accuracy']
+    val_acc = history['val_accuracy']
+    loss = history['loss']
+    val_loss = history['val_loss']
+
+    epochs = range(len(acc))
+
+    plt.plot(epochs, acc, 'bo', label='Training accuracy')
+    plt.plot(epochs, val_acc, 'b', label='Validation accuracy')
+    plt.title('Training and validation accuracy')
+    plt.legend()
+
+    plt.figure()
+
+    plt.plot(epochs, loss, 'bo', label='Training loss')
+    plt.plot(epochs, val_loss, 'b', label='Validation loss')
+    plt.title('Training and validation loss')
+    plt.legend()
+
+    plt.show()
+
+
+class TrainingCheckpoint(Callback):
+    """
+    Save the model, its optimizer state and the history every few epochs, and the best weights.
+
+    Files are written next to each other in the checkpoint directory and replaced atomically,
+    so a crash during a save leaves the previous checkpoint usable.
+    """
+
+    def __init__(self, checkpoint_dir, history, every=1, monitor='val_loss'):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.history = history
+        self.every = every
+        self.monitor = monitor
+        values = history.get(monitor)
+        self.best = min(values) if values else None
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+
+        current = (logs or {}).get(self.monitor)
+        if current is not None and (self.best is None or current < self.best):
+            self.best = current
+            self.model.save_weights(os.path.join(self.checkpoint_dir, "best.weights.h5"))
+
+        if (epoch + 1) % self.every == 0:
+            self.save(epoch + 1)
+
+    def save(self, completed_epochs):
+        """
+        Save the model and the training state after a number of completed epochs.
+
+        Args:
+            completed_epochs (int): Number of epochs completed.
+        """
+        model_path = os.path.join(self.checkpoint_dir, "last.keras")
+        self.model.save(model_path.replace(".keras", ".tmp.keras"))
+        os.replace(model_path.replace(".keras", ".tmp.keras"), model_path)
+
+        state_path = os.path.join(self.checkpoint_dir, "state.json")
+        with open(f"{state_path}.tmp", 'w') as file:
+            json.dump({"epoch": completed_epochs, "history": self.history}, file)
+        os.replace(f"{state_path}.tmp", state_path)
+
+
+class ResumableEarlyStopping(EarlyStopping):
+    """
+    EarlyStopping on a minimized metric that keeps the best value and the patience
+    already spent before a training was resumed.
+    """
+
+    def __init__(self, history, **kwargs):
+        super().__init__(mode='min', **kwargs)
+        self.previous_history = history
+
+    def on_train_begin(self, logs=None):
+        super().on_train_begin(logs)
+        values = self.previous_history.get(self.monitor)
+        if values:
+            self.best_epoch = int(np.argmin(values))
+            self.best = values[self.best_epoch]
+            self.wait = len(values) - 1 - self.best_epoch
+
+
+def load_checkpoint(checkpoint_dir):
+    """
+    Load the last checkpoint of a training.
+
+    Args:
+        checkpoint_dir (str): Checkpoint directory of the training.
+
+    Returns:
+        tuple: The model and the training state ({"epoch", "history"}), or (None, None) without checkpoint.
+    """
+    model_path = os.path.join(checkpoint_dir, "last.keras")
+    state_path = os.path.join(checkpoint_dir, "state.json")
+    if not (os.path.exists(model_path) and os.path.exists(state_path)):
+        return None, None
+
+    with open(state_path, 'r') as file:
+        state = json.load(file)
+    return tf.keras.models.load_model(model_path), state
+
+
+def train(version=config.MODEL_LAST_VERSION, epochs=config.TRAINING_EPOCHS, batch_size=config.BATCH_SIZE,
+          patience=config.TRAINING_EARLY_STOPPING_PATIENCE, checkpoint_every=config.TRAINING_CHECKPOINT_EVERY,
+          resume=True, build_fn=build_model, use_shards=config.DATASET_SHARDS_ENABLED):
+    """
+    Train a model version, resuming from its last checkpoint if there is one.
+
+    The training stops early when the validation loss has not improved for `patience` epochs.
+    The best weights are kept, and the model and its history are written to
+    config.MODEL_VERSIONS_PATH as <version>.keras and <version>-history.json.
+
+    Args:
+        version (str, optional): Version of the trained model. Defaults to config.MODEL_LAST_VERSION.
+        epochs (int, optional): Maximum number of epochs. Defaults to config.TRAINING_EPOCHS.
+        batch_size (int, optional): Number of images per batch. Defaults to config.BATCH_SIZE.
+        patience (int, optional): Epochs without improvement before stopping. Defaults to config.TRAINING_EARLY_STOPPING_PATIENCE.
+        checkpoint_every (int, optional): Epochs between checkpoints. Defaults to config.TRAINING_CHECKPOINT_EVERY.
+        resume (bool, optional): Whether to resume from the last checkpoint. Defaults to True.
+        build_fn (callable, optional): Function building a compiled model. Defaults to build_model.
+        use_shards (bool, optional): Whether to read the compiled dataset shards. Defaults to config.DATASET_SHARDS_ENABLED.
+
+    Returns:
+        tuple: The trained model and its history (dict of metric values per epoch).
+    """
+    checkpoint_dir = os.path.join(config.TRAINING_CHECKPOINTS_PATH, version)
+
+    # Pipeline tf.data natif (décodage, augmentation et prefetch en parallèle)
+    if use_shards:
+        train_ds, validation_ds, num_train, num_validation = build_shard_training_datasets(batch_size)
+    else:
+        train_ds, validation_ds, num_train, num_validation = build_training_datasets(batch_size)
+
+    # Calcul du nombre d'étapes par epoch et de la validation_steps
+    steps_per_epoch = max(1, num_train // batch_size)
+    validation_steps = max(1, num_validation // batch_size)
+
+    model, state = load_checkpoint(checkpoint_dir) if resume else (None, None)
+    if model is None:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        model = build_fn()
+        state = {"epoch": 0, "history": {}}
+    else:
+        print(f"Resuming the training of {version} after epoch {state['epoch']}")
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    history = state["history"]
+    callbacks = [
+        TrainingCheckpoint(checkpoint_dir, history, checkpoint_every),
+        ResumableEarlyStopping(history, monitor='val_loss', patience=patience, verbose=1),
+    ]
+
+    # Entraînement du modèle avec les objets tf.data.Dataset
+    model.fit(
+        train_ds,
+        steps_per_epoch=steps_per_epoch,
+        epochs=epochs,
+        initial_epoch=state["epoch"],
+        validation_data=validation_ds,
+        validation_steps=validation_steps,
+        callbacks=callbacks
+    )
+
+    # Garder les meilleurs poids
+    best_weights_path = os.path.join(checkpoint_dir, "best.weights.h5")
+    if os.path.exists(best_weights_path):
+        model.load_weights(best_weights_path)
+
+    # Enregistrer le modèle et l'historique
+    os.makedirs(config.MODEL_VERSIONS_PATH, exist_ok=True)
+    model.save(f"{config.MODEL_VERSIONS_PATH}{version}.keras")
+    with open(f"{config.MODEL_VERSIONS_PATH}{version}-history.json", 'w') as file:
+        json.dump(history, file, indent=4)
+
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    return model, history
+
+
+def main():
+    _, history = train()
+    plot_history(history)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import os
+import csv
+import time
+import random
+import argparse
+import itertools
+import statistics
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import config.config as config
+
+
+# Columns of the results table, after the hyperparameters
+RESULT_COLUMNS = ["status", "epochs", "best_val_accuracy", "best_val_loss", "seconds", "error"]
+
+
+def build_trials(search_space=config.SWEEP_SEARCH_SPACE, max_trials=None, seed=0):
+    """
+    Build the hyperparameter combinations of a grid search.
+
+    Args:
+        search_space (dict): Dictionary mapping each hyperparameter to its candidate values.
+        max_trials (int, optional): Number of combinations randomly sampled from the grid. Defaults to None (full grid).
+        seed (int, optional): Seed of the sampling. Defaults to 0.
+
+    Returns:
+        list: Dictionaries of hyperparameters, one per trial.
+    """
+    names = list(search_space)
+    trials = [dict(zip(names, values)) for values in itertools.product(*search_space.values())]
+    if max_trials is not None and max_trials < len(trials):
+        trials = random.Random(seed).sample(trials, max_trials)
+    return trials
+
+
+def init_worker(threads_per_trial, config_overrides):
+    """
+    Limit the threads of a trial process before TensorFlow starts, and apply the config overrides.
+
+    Args:
+        threads_per_trial (int): Number of CPU threads of the trial.
+        config_overrides (dict): Config attributes to override in the process (e.g. NUM_ENTITIES).
+    """
+    for variable in ("OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+        os.environ[variable] = str(threads_per_trial)
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+    for name, value in config_overrides.items():
+        setattr(config, name, value)
+
+
+def should_prune(trial_id, epoch, value, reports, warmup_epochs=config.SWEEP_PRUNING_WARMUP_EPOCHS,
+                 min_trials=config.SWEEP_PRUNING_MIN_TRIALS):
+    """
+    Median pruning: stop a trial whose validation loss is worse than the median of the other trials at the same epoch.
+
+    Args:
+        trial_id (int): Index of the trial.
+        epoch (int): Index of the epoch.
+        value (float): Validation loss of the trial at this epoch.
+        reports (dict): Shared dictionary mapping (trial index, epoch) to the validation loss.
+        warmup_epochs (int, optional): Epochs run before a trial can be pruned. Defaults to config.SWEEP_PRUNING_WARMUP_EPOCHS.
+        min_trials (int, optional): Other trials needed at this epoch to prune. Defaults to config.SWEEP_PRUNING_MIN_TRIALS.
+
+    Returns:
+        bool: True if the trial should stop.
+    """
+    if epoch + 1 < warmup_epochs:
+        return False
+    others = [loss for (other_id, other_epoch), loss in reports.items() if other_epoch == epoch and other_id != trial_id]
+    return len(others) >= min_trials and value > statistics.median(others)
+
+
+def run_trial(trial_id, params, epochs, reports):
+    """
+    Train a model with a set of hyperparameters, reporting the validation loss after each epoch.
+
+    Args:
+        trial_id (int): Index of the trial.
+        params (dict): Hyperparameters (batch_size, learning_rate, augmentation_strength, width_multiplier, architecture).
+        epochs (int): Maximum number of epochs.
+        reports (dict): Shared dictionary mapping (trial index, epoch) to the validation loss.
+
+    Returns:
+        dict: The hyperparameters, the status (completed or pruned), the epochs run, the best validation metrics, the wall-clock time and no error.
+    """
+    # TensorFlow is imported in the worker, after init_worker limited its threads
+    import tensorflow as tf
+    from model.data_pipeline import build_training_datasets, scale_augmentation
+    from model.dataset_shards import build_shard_training_datasets
+    from model.model import build_model
+
+    threads = int(os.environ.get("TF_NUM_INTRAOP_THREADS", 0))
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    except RuntimeError:
+        # Already set by the first trial of this worker process
+        pass
+
+    start_time = time.perf_counter()
+    batch_size = params.get("batch_size", config.BATCH_SIZE)
+    augmentation = scale_augmentation(params.get("augmentation_strength", 1.0))
+
+    if config.DATASET_SHARDS_ENABLED:
+        # The shards were compiled by run_sweep, the trials only read them
+        train_ds, validation_ds, num_train, num_validation = build_shard_training_datasets(batch_size, augmentation, compile=False)
+    else:
+        train_ds, validation_ds, num_train, num_validation = build_training_datasets(batch_size, augmentation=augmentation)
+    model = build_model(params.get("width_multiplier"), params.get("learning_rate", 0.001),
+                        params.get("architecture", config.MODEL_ARCHITECTURE))
+
+    class PruningCallback(tf.keras.callbacks.Callback):
+        def __init__(self):
+            super().__init__()
+            self.pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            value = float(logs["val_loss"])
+            reports[(trial_id, epoch)] = value
+            if should_prune(trial_id, epoch, value, reports):
+                self.pruned = True
+                self.model.stop_training = True
+
+    pruning = PruningCallback()
+
+    history = model.fit(
+        train_ds,
+        steps_per_epoch=max(1, num_train // batch_size),
+        epochs=epochs,
+        validation_data=validation_ds,
+        validation_steps=max(1, num_validation // batch_size),
+        callbacks=[pruning],
+        verbose=0
+    ).history
+
+    return {
+        **params,
+        "status": "pruned" if pruning.pruned else "completed",
+        "epochs": len(history["val_loss"]),
+        "best_val_accuracy": round(max(history["val_accuracy"]), 4),
+        "best_val_loss": round(min(history["val_loss"]), 4),
+        "seconds": round(time.perf_counter() - start_time, 2),
+        "error": None,
+    }
+
+
+def sort_key(result):
+    """
+    Get the sort key of a trial result: best validation loss first, failed trials last.
+
+    Args:
+        result (dict): Result of a trial.
+
+    Returns:
+        tuple: Whether the trial has no validation loss, and its validation loss.
+    """
+    return result["best_val_loss"] is None, result["best_val_loss"] or 0
+
+
+def write_results(results, output_path):
+    """
+    Write the results of the trials to a CSV table.
+
+    Args:
+        results (list): Results of the trials.
+        output_path (str): Path of the CSV file.
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    columns = [name for name in results[0] if name not in RESULT_COLUMNS] + RESULT_COLUMNS
+    with open(output_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def print_results(results):
+    """
+    Print the results of the trials as a table, best validation loss first.
+
+    Args:
+        results (list): Results of the trials.
+    """
+    columns = [name for name in results[0] if name not in RESULT_COLUMNS] + RESULT_COLUMNS
+    print(" ".join(f"{name:>20}" for name in columns))
+    for result in sorted(results, key=sort_key):
+        print(" ".join(f"{str(result[name]):>20}" for name in columns))
+
+
+def run_sweep(search_space=config.SWEEP_SEARCH_SPACE, epochs=config.SWEEP_EPOCHS, max_workers=config.SWEEP_MAX_WORKERS,
+              threads_per_trial=config.SWEEP_THREADS_PER_TRIAL, max_trials=None, output_path=None, config_overrides=None):
+    """
+    Run the trials of a hyperparameter sweep in a bounded pool of processes.
+
+    Each process trains one trial at a time with `threads_per_trial` CPU threads, so
+    `max_workers` x `threads_per_trial` should not exceed the number of cores.
+
+    Args:
+        search_space (dict, optional): Candidate values of each hyperparameter. Defaults to config.SWEEP_SEARCH_SPACE.
+        epochs (int, optional): Maximum number of epochs per trial. Defaults to config.SWEEP_EPOCHS.
+        max_workers (int, optional): Number of trials run in parallel. Defaults to config.SWEEP_MAX_WORKERS.
+        threads_per_trial (int, optional): CPU threads of each trial. Defaults to config.SWEEP_THREADS_PER_TRIAL.
+        max_trials (int, optional): Number of combinations sampled from the grid. Defaults to None (full grid).
+        output_path (str, optional): Path of the CSV results. Defaults to None (config.SWEEP_RESULTS_PATH/<date>.csv).
+        config_overrides (dict, optional): Config attributes to override in the trial processes. Defaults to None.
+
+    Returns:
+        list: Results of the trials, best validation loss first and failed trials last.
+    """
+    trials = build_trials(search_space, max_trials)
+    output_path = output_path or os.path.join(config.SWEEP_RESULTS_PATH, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv")
+
+    if config.DATASET_SHARDS_ENABLED:
+        # Compile the changed entities once instead of in every trial
+        from model.dataset_shards import compile_split
+        compile_split(config.TRAIN_IMAGES_PATH)
+        compile_split(config.VALIDATION_IMAGES_PATH)
+
+    # Spawned processes start without TensorFlow, so the thread limits apply
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with context.Manager() as manager:
+        reports = manager.dict()
+        with ProcessPoolExecutor(max_workers, mp_context=context, initializer=init_worker,
+                                 initargs=(threads_per_trial, config_overrides or {})) as executor:
+            futures = {executor.submit(run_trial, trial_id, params, epochs, reports): params for trial_id, params in enumerate(trials)}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # A diverging or killed trial must not lose the results of the others
+                    result = {**futures[future], "status": "failed", "epochs": None, "best_val_accuracy": None,
+                              "best_val_loss": None, "seconds": None, "error": f"{type(e).__name__}: {e}"}
+                results.append(result)
+                print(f"Trial {len(results)}/{len(trials)} {result['status']} - {futures[future]} - "
+                      f"val_loss: {result['best_val_loss']}, val_accuracy: {result['best_val_accuracy']}, {result['seconds']} s"
+                      + (f" - {result['error']}" if result["error"] else ""))
+
+    results.sort(key=sort_key)
+    write_results(results, output_path)
+    print(f"Sweep results saved to {output_path}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a parallel hyperparameter sweep.")
+    parser.add_argument("--epochs", type=int, default=config.SWEEP_EPOCHS)
+    parser.add_argument("--workers", type=int, default=config.SWEEP_MAX_WORKERS)
+    parser.add_argument("--threads", type=int, default=config.SWEEP_THREADS_PER_TRIAL, help="CPU threads per trial.")
+    parser.add_argument("--max-trials", type=int, help="Number of combinations sampled from the grid.")
+    parser.add_argument("--output", help="Path of the CSV results.")
+    args = parser.parse_args()
+
+    print_results(run_sweep(epochs=args.epochs, max_workers=args.workers, threads_per_trial=args.threads,
+                            max_trials=args.max_trials, output_path=args.output))
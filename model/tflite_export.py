@@ -0,0 +1,102 @@
+import os
+import random
+import numpy as np
+import tensorflow as tf
+
+import config.config as config
+from evaluate.backends import get_model_path, load_inference_model
+from evaluate.evaluate_model import evaluate_all_models, load_image_tensor
+from utils.latency import measure_batch_latency
+
+
+def sample_calibration_images(num_images=config.TFLITE_CALIBRATION_IMAGES, root_path=config.VALIDATION_IMAGES_PATH):
+    """
+    Randomly sample validation images to calibrate the int8 quantization.
+
+    Args:
+        num_images (int, optional): Number of images to sample. Defaults to config.TFLITE_CALIBRATION_IMAGES.
+        root_path (str, optional): Directory containing one folder per entity. Defaults to config.VALIDATION_IMAGES_PATH.
+
+    Returns:
+        list: Paths of the sampled images.
+    """
+    img_paths = [os.path.join(root_folder, file) for root_folder, _, files in os.walk(root_path) for file in files]
+    return random.sample(img_paths, min(num_images, len(img_paths)))
+
+
+def export_tflite(version, quantization, num_calibration_images=config.TFLITE_CALIBRATION_IMAGES):
+    """
+    Convert a Keras model version to a quantized TFLite model.
+
+    Args:
+        version (str): Version of the model (e.g. "v0.3").
+        quantization (str): "dynamic" for dynamic-range quantization of the weights, or "int8" for
+                            full integer quantization calibrated on validation images.
+        num_calibration_images (int, optional): Number of calibration images. Defaults to config.TFLITE_CALIBRATION_IMAGES.
+
+    Returns:
+        str: Path of the exported .tflite file.
+    """
+    model = tf.keras.models.load_model(get_model_path(version, "keras"))
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == "int8":
+        calibration_paths = sample_calibration_images(num_calibration_images)
+
+        def representative_dataset():
+            for img_path in calibration_paths:
+                yield [np.expand_dims(load_image_tensor(img_path), axis=0)]
+
+        # Integer-only kernels, the float input and output are (de)quantized inside the model
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantization != "dynamic":
+        raise ValueError(f"Unknown quantization '{quantization}', expected 'dynamic' or 'int8'")
+
+    tflite_model = converter.convert()
+
+    tflite_path = get_model_path(version, f"tflite-{quantization}")
+    with open(tflite_path, 'wb') as file:
+        file.write(tflite_model)
+    print(f"Exported {quantization} TFLite model: {tflite_path}")
+
+    return tflite_path
+
+
+def report_tflite_export(version, backends=("tflite-dynamic", "tflite-int8"), batch_size=config.EVALUATION_BATCH_SIZE):
+    """
+    Compare the exported TFLite models of a version with its Keras model.
+
+    Every backend is evaluated in the same pass over the evaluation images.
+
+    Args:
+        version (str): Version of the model (e.g. "v0.3").
+        backends (tuple, optional): TFLite backends to compare. Defaults to ("tflite-dynamic", "tflite-int8").
+        batch_size (int, optional): Batch size of the latency measurement. Defaults to config.EVALUATION_BATCH_SIZE.
+
+    Returns:
+        dict: For each backend, its size, top-1/top-5 accuracies, latency per batch, and the
+              accuracy delta and size/latency gains against the Keras model.
+    """
+    models = {backend: load_inference_model(version, backend) for backend in ("keras",) + tuple(backends)}
+    _, metrics = evaluate_all_models(models, use_store=False)
+
+    report = {}
+    for backend, model in models.items():
+        report[backend] = {
+            "size_bytes": os.path.getsize(get_model_path(version, backend)),
+            "top1_accuracy": metrics[backend]["top1_accuracy"],
+            "top5_accuracy": metrics[backend]["top5_accuracy"],
+            "latency_ms_per_batch": round(measure_batch_latency(model, batch_size), 2),
+        }
+
+    keras_report = report["keras"]
+    for backend in backends:
+        backend_report = report[backend]
+        if keras_report["top1_accuracy"] is not None and backend_report["top1_accuracy"] is not None:
+            backend_report["top1_accuracy_delta"] = round(backend_report["top1_accuracy"] - keras_report["top1_accuracy"], 4)
+        backend_report["size_gain"] = round(keras_report["size_bytes"] / backend_report["size_bytes"], 2)
+        backend_report["latency_gain"] = round(keras_report["latency_ms_per_batch"] / backend_report["latency_ms_per_batch"], 2)
+
+    return report
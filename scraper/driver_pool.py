@@ -0,0 +1,104 @@
+import threading
+import contextlib
+
+
+class DriverPool:
+    """
+    Bounded pool of reusable WebDriver sessions.
+
+    Browsers are started on demand by `driver_factory`, up to `size`, and handed back to
+    the pool after each use instead of being quit. Any object with the methods of a
+    Selenium WebDriver used by the scraper (get, execute_script, page_source, quit...)
+    can be returned by the factory, such as a fake driver serving local pages.
+    """
+
+    def __init__(self, size, driver_factory):
+        self.size = size
+        self.driver_factory = driver_factory
+        self.idle = []
+        self.num_drivers = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Take an idle driver, start a new one if the pool is not full, or wait for one to be released.
+
+        Returns:
+            tuple: The driver and whether it was just started.
+        """
+        with self.condition:
+            while not self.idle and self.num_drivers >= self.size:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop(), False
+            # Reserve the slot, the browser starts outside of the lock
+            self.num_drivers += 1
+
+        try:
+            return self.driver_factory(), True
+        except BaseException:
+            with self.condition:
+                self.num_drivers -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, driver, broken=False):
+        """
+        Hand a driver back to the pool, or quit it if its state cannot be trusted anymore.
+
+        Args:
+            driver (WebDriver): Driver taken with acquire.
+            broken (bool, optional): Whether the driver failed and must be replaced. Defaults to False.
+        """
+        if broken:
+            self.quit(driver)
+        with self.condition:
+            if broken:
+                self.num_drivers -= 1
+            else:
+                self.idle.append(driver)
+            self.condition.notify()
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Context manager lending a driver, which is replaced if the block raises.
+
+        Yields:
+            tuple: The driver and whether it was just started.
+        """
+        driver, started = self.acquire()
+        try:
+            yield driver, started
+        except BaseException:
+            self.release(driver, broken=True)
+            raise
+        self.release(driver)
+
+    def quit(self, driver):
+        """
+        Quit a driver, ignoring the errors of a browser that already crashed.
+
+        Args:
+            driver (WebDriver): Driver to quit.
+        """
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Failed to quit a browser: {e}")
+
+    def close(self):
+        """
+        Quit every idle driver.
+        """
+        with self.condition:
+            drivers, self.idle = self.idle, []
+            self.num_drivers -= len(drivers)
+        for driver in drivers:
+            self.quit(driver)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
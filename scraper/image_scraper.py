@@ -2,8 +2,10 @@ import os
 import time
 import base64
 import requests
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from urllib.parse import urljoin
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
@@ -11,11 +13,51 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
 import config.config as config
+from scraper.driver_pool import DriverPool
 from utils.file_utils import adjust_max_files, delete_last_files, get_next_filename
-from utils.image_utils import is_valid_image
+from utils.dedup_index import add_image, compute_dhash, find_duplicate, hash_content, open_dedup_index, sync_dedup_index
+from utils.image_utils import download_image, is_excluded_url, sniff_image_type
+from utils.profiling import increment, timer
 from utils.url_utils import hash_url, load_url_filename_mapping, save_url_filename_mapping
 
 
+# The entities scraped concurrently share the URL-Filename mapping file of their split
+MAPPING_LOCK = threading.Lock()
+
+# Records the sources of the images already in the page and of those added or lazily loaded afterwards
+OBSERVE_IMAGES_SCRIPT = """
+if (!window.__imageSources) {
+    window.__imageSources = [];
+    const seen = new Set();
+    const add = (img) => {
+        const src = img.getAttribute('src') || img.getAttribute('data-src');
+        if (src && !seen.has(src)) {
+            seen.add(src);
+            window.__imageSources.push(src);
+        }
+    };
+    document.querySelectorAll('img').forEach(add);
+    new MutationObserver((mutations) => {
+        for (const mutation of mutations) {
+            if (mutation.type === 'attributes') {
+                if (mutation.target.tagName === 'IMG') add(mutation.target);
+                continue;
+            }
+            for (const node of mutation.addedNodes) {
+                if (node.tagName === 'IMG') add(node);
+                else if (node.querySelectorAll) node.querySelectorAll('img').forEach(add);
+            }
+        }
+    }).observe(document, {childList: true, subtree: true, attributes: true, attributeFilter: ['src', 'data-src']});
+}
+"""
+
+# Returns the sources recorded since the last call
+TAKE_IMAGE_SOURCES_SCRIPT = "const sources = window.__imageSources || []; window.__imageSources = []; return sources;"
+
+PAGE_STATE_SCRIPT = "return [document.body.scrollHeight, (window.__imageSources || []).length];"
+
+
 def setup_chrome_options():
     """
     Setup and return Chrome options for headless browsing.
@@ -34,6 +76,16 @@ def setup_chrome_options():
     return chrome_options
 
 
+def create_chrome_driver():
+    """
+    Start a headless Chrome browser.
+
+    Returns:
+        WebDriver: Selenium WebDriver instance.
+    """
+    return webdriver.Chrome(options=setup_chrome_options())
+
+
 def handle_accept_button(driver, max_attempts=5):
     """
     Handle the acceptance of cookies or other pop-ups on the webpage.
@@ -58,96 +110,291 @@ def handle_accept_button(driver, max_attempts=5):
                 break
 
 
-def scroll_and_collect_images(driver, max_images):
+def wait_for_new_content(driver, last_height, timeout=config.SCRAPER_SCROLL_TIMEOUT, poll_interval=config.SCRAPER_POLL_INTERVAL):
     """
-    Scroll the webpage and collect image elements.
+    Wait until the page grows or new image sources are observed, at most `timeout` seconds.
 
     Args:
-        driver (WebDriver): Selenium WebDriver instance.
-        max_images (int): Maximum number of images to collect.
+        driver (WebDriver): Selenium WebDriver instance, with the image observer installed.
+        last_height (int): Height of the page before the scroll.
+        timeout (float, optional): Maximum wait, in seconds. Defaults to config.SCRAPER_SCROLL_TIMEOUT.
+        poll_interval (float, optional): Time between two checks, in seconds. Defaults to config.SCRAPER_POLL_INTERVAL.
 
     Returns:
-        list: Collected image elements.
+        tuple: New height of the page and number of new image sources waiting to be read.
     """
-    img_count = 0
-    scroll_attempts = 0
+    deadline = time.perf_counter() + timeout
+    while True:
+        height, pending = driver.execute_script(PAGE_STATE_SCRIPT)
+        if height != last_height or pending or time.perf_counter() >= deadline:
+            return height, pending
+        time.sleep(poll_interval)
+
+
+def scroll_and_collect_images(driver, max_scroll_attempts=config.SCRAPER_MAX_SCROLL_ATTEMPTS):
+    """
+    Scroll the webpage and yield the image sources as soon as they are added to the page.
+
+    A MutationObserver installed in the page records the sources of the new images, so each
+    scroll only transfers the new ones instead of the whole page source. The generator scrolls
+    again only when the previous sources have been consumed, and stops when the page has not
+    grown after `max_scroll_attempts` scrolls.
+
+    Args:
+        driver (WebDriver): Selenium WebDriver instance, on the results page.
+        max_scroll_attempts (int, optional): Scrolls without new content before stopping. Defaults to config.SCRAPER_MAX_SCROLL_ATTEMPTS.
+
+    Yields:
+        str: Image source URL (or data URI), in order of appearance.
+    """
+    driver.execute_script(OBSERVE_IMAGES_SCRIPT)
     last_height = driver.execute_script("return document.body.scrollHeight")
+    scroll_attempts = 0
+    skipped = 0
+
+    while True:
+        with timer("scraper.parse"):
+            img_srcs = driver.execute_script(TAKE_IMAGE_SOURCES_SCRIPT)
+
+        # Skip the first three images
+        num_skipped = min(3 - skipped, len(img_srcs))
+        skipped += num_skipped
+        yield from img_srcs[num_skipped:]
 
-    while img_count < max_images and scroll_attempts < 3:
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
+        if scroll_attempts >= max_scroll_attempts:
+            return
 
-        new_height = driver.execute_script("return document.body.scrollHeight")
-        if new_height == last_height:
-            scroll_attempts += 1
-        else:
-            scroll_attempts = 0
+        with timer("scraper.scroll"):
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            new_height, pending = wait_for_new_content(driver, last_height)
+
+        scroll_attempts = 0 if new_height != last_height or pending else scroll_attempts + 1
         last_height = new_height
 
-        time.sleep(2)
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        images = soup.find_all('img')
 
-        img_count = len(images) - 3  # Skip the first three images
-        if img_count >= max_images:
-            break
+def create_session(pool_size=config.SCRAPER_MAX_IN_FLIGHT):
+    """
+    Create an HTTP session keeping up to `pool_size` connections open per host.
+
+    Args:
+        pool_size (int, optional): Number of pooled connections per host. Defaults to config.SCRAPER_MAX_IN_FLIGHT.
+
+    Returns:
+        requests.Session: The session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_image(img_src, session, timeout=(config.SCRAPER_CONNECT_TIMEOUT, config.SCRAPER_READ_TIMEOUT)):
+    """
+    Validate and download the image of a source URL with a single request.
+
+    Args:
+        img_src (str): Image source URL, or base64 data URI.
+        session (requests.Session): Session whose pooled connections are reused.
+        timeout (tuple, optional): Connect and read timeouts, in seconds.
+                                   Defaults to (config.SCRAPER_CONNECT_TIMEOUT, config.SCRAPER_READ_TIMEOUT).
+
+    Returns:
+        dict: The result of download_image, with the extension of the saved file (None if not requested).
+    """
+    if is_excluded_url(img_src):
+        return {"data": None, "type": None, "reason": "excluded", "bytes_read": 0, "content_length": None, "requested": False}
+
+    if img_src.startswith('data:image'):
+        img_data = base64.b64decode(img_src.split(',')[1])
+        valid = sniff_image_type(img_data[:12]) is not None
+        return {"data": img_data if valid else None, "type": img_src.split(';')[0].split('/')[-1],
+                "reason": "ok" if valid else "signature", "bytes_read": 0, "content_length": None, "requested": False}
+
+    if img_src.startswith('/'):
+        img_src = urljoin('https://www.google.com', img_src)
+    with timer("scraper.download"):
+        result = download_image(img_src, session, timeout)
+    # Saved with the .jpeg extension as before, the decoders detect the format from the content
+    result["type"] = 'jpeg'
+    result["requested"] = True
+    return result
+
+
+def record_fetch_stats(result, stats):
+    """
+    Add the result of a fetch to the download statistics.
+
+    The savings are measured against the previous HEAD request followed by a full GET
+    of every URL whose content-type was an image.
+
+    Args:
+        result (dict): Result of fetch_image.
+        stats (dict): Statistics updated in place (requests, bytes_downloaded, round_trips_saved, bytes_saved, rejected).
+    """
+    rejected = stats.setdefault("rejected", {})
+    if result["reason"] != "ok":
+        rejected[result["reason"]] = rejected.get(result["reason"], 0) + 1
+    if not result["requested"]:
+        return
 
-    return images
+    # The HEAD request already rejected the wrong statuses and content-types, the other URLs were downloaded
+    round_trips_saved = 0 if result["reason"] in ("status", "content-type") else 1
+    bytes_saved = 0
+    if round_trips_saved and result["data"] is None and result["content_length"] is not None:
+        bytes_saved = max(0, result["content_length"] - result["bytes_read"])
 
+    for name, value in (("requests", 1), ("bytes_downloaded", result["bytes_read"]),
+                        ("round_trips_saved", round_trips_saved), ("bytes_saved", bytes_saved)):
+        stats[name] = stats.get(name, 0) + value
+        increment(f"scraper.{name}", value)
 
-def process_image(img_src, entity_dir, entity, url_filename_mapping, img_count, max_images):
+
+def save_image(img_data, img_type, img_hash, entity_dir, entity, url_filename_mapping, dedup_index=None, stats=None):
     """
-    Process and save the image from the given source URL.
+    Save a downloaded image under the next filename of the entity and record it in the mapping.
+
+    With a dedup index, the image is first checked against all the stored images, so the same picture
+    served from another URL, or resized and recompressed, is not saved twice nor in another split.
 
     Args:
-        img_src (str): Image source URL.
+        img_data (bytes): Image data.
+        img_type (str): Extension of the image.
+        img_hash (str): Hash of the image source URL.
         entity_dir (str): Directory to save the image.
         entity (str): Entity string.
         url_filename_mapping (dict): URL to filename mapping.
-        url_filename_mapping_file (str): Path to the URL-Filename mapping file.
-        img_count (int): Current image count.
+        dedup_index (sqlite3.Connection, optional): Connection to the dedup index. Defaults to None (no check).
+        stats (dict, optional): Download statistics, whose rejected duplicates are counted. Defaults to None.
+
+    Returns:
+        str: Path of the saved image, or None if the image is too small or a duplicate.
+    """
+    if len(img_data) < config.MIN_IMAGE_SIZE_THRESHOLD:
+        return None
+
+    if dedup_index is not None:
+        with timer("scraper.dedup"):
+            content_hash, dhash = hash_content(img_data), compute_dhash(img_data)
+            duplicate = find_duplicate(dedup_index, content_hash, dhash)
+        if duplicate is not None:
+            reason = "duplicate" if duplicate["exact"] else "near-duplicate"
+            if stats is not None:
+                rejected = stats.setdefault("rejected", {})
+                rejected[reason] = rejected.get(reason, 0) + 1
+            increment(f"scraper.{reason.replace('-', '_')}s")
+            print(f"Skipped {reason} - Hash: {img_hash}, Same as: {duplicate['path']} (distance {duplicate['distance']})")
+            return None
+
+    with timer("scraper.write"):
+        filename = get_next_filename(entity_dir, entity, img_type)
+        with open(filename, 'wb') as img_file:
+            img_file.write(img_data)
+    increment("scraper.images_saved")
+    url_filename_mapping[os.path.basename(filename)] = img_hash
+    if dedup_index is not None:
+        add_image(dedup_index, filename, content_hash, dhash, entity=entity)
+    print(f"Downloaded - Hash: {img_hash}, Filename: {filename}")
+    return filename
+
+
+def download_images(img_srcs, entity_dir, entity, url_filename_mapping, max_images, session=None,
+                    max_in_flight=config.SCRAPER_MAX_IN_FLIGHT, timeout=(config.SCRAPER_CONNECT_TIMEOUT, config.SCRAPER_READ_TIMEOUT),
+                    stats=None, dedup_index=None):
+    """
+    Download images concurrently until `max_images` are saved.
+
+    At most `max_in_flight` downloads run at once, in a thread pool sharing the connections of one session.
+    Images are saved by the calling thread in the order the downloads finish, so the filenames and the
+    mapping stay consistent, and the downloads still running when `max_images` is reached are discarded.
+
+    Args:
+        img_srcs (iterable): Image source URLs, in order of preference.
+        entity_dir (str): Directory to save the images.
+        entity (str): Entity string.
+        url_filename_mapping (dict): URL to filename mapping, updated with the saved images.
         max_images (int): Maximum number of images to save.
+        session (requests.Session, optional): Session to reuse. Defaults to None (a session is created and closed).
+        max_in_flight (int, optional): Maximum number of concurrent downloads. Defaults to config.SCRAPER_MAX_IN_FLIGHT.
+        timeout (tuple, optional): Connect and read timeouts, in seconds.
+                                   Defaults to (config.SCRAPER_CONNECT_TIMEOUT, config.SCRAPER_READ_TIMEOUT).
+        stats (dict, optional): Download statistics updated in place, see record_fetch_stats. Defaults to None.
+        dedup_index (sqlite3.Connection, optional): Connection to the dedup index checked before saving. Defaults to None.
 
     Returns:
-        int: Updated image count.
+        int: Number of saved images.
     """
-    img_hash = hash_url(img_src)
-    if img_hash not in url_filename_mapping.values():
-        try:
-            if img_src.startswith('data:image'):
-                img_type = img_src.split(';')[0].split('/')[-1]
-                base64_data = img_src.split(',')[1]
-                img_data = base64.b64decode(base64_data)
-                if len(img_data) >= config.MIN_IMAGE_SIZE_THRESHOLD:
-                    filename = get_next_filename(entity_dir, entity, img_type)
-                    with open(filename, 'wb') as img_file:
-                        img_file.write(img_data)
-                    img_count += 1
-                    url_filename_mapping[os.path.basename(filename)] = img_hash
-                    print(f"Downloaded - Hash: {img_hash}, Filename: {filename}")
-            else:
-                if img_src.startswith('/'):
-                    img_src = urljoin('https://www.google.com', img_src)
-                response = requests.get(img_src, stream=True)
-                if response.status_code == 200:
-                    img_data = response.content
-                    if len(img_data) >= config.MIN_IMAGE_SIZE_THRESHOLD:
-                        filename = get_next_filename(entity_dir, entity, 'jpeg')
-                        with open(filename, 'wb') as img_file:
-                            img_file.write(img_data)
+    stats = {} if stats is None else stats
+    owns_session = session is None
+    session = session or create_session(max_in_flight)
+    known_hashes = set(url_filename_mapping.values())
+    candidates = iter(img_srcs)
+    in_flight = {}
+    img_count = 0
+
+    executor = ThreadPoolExecutor(max_in_flight)
+    try:
+        while img_count < max_images:
+            # Keep the pool full with the next candidates not downloaded yet
+            for img_src in candidates:
+                img_hash = hash_url(img_src)
+                if img_hash in known_hashes:
+                    print(f"Already downloaded - Hash: {img_hash}")
+                    continue
+                known_hashes.add(img_hash)
+                in_flight[executor.submit(fetch_image, img_src, session, timeout)] = (img_src, img_hash)
+                # The candidates may come from a page still loading, so finished downloads are saved first
+                if len(in_flight) >= max_in_flight or any(future.done() for future in in_flight):
+                    break
+
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                img_src, img_hash = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Failed to download image {img_src}: {e}")
+                    continue
+                record_fetch_stats(result, stats)
+                if result["data"] is not None and img_count < max_images:
+                    if save_image(result["data"], result["type"], img_hash, entity_dir, entity, url_filename_mapping,
+                                  dedup_index, stats):
                         img_count += 1
-                        url_filename_mapping[os.path.basename(filename)] = img_hash
-                        print(f"Downloaded - Hash: {img_hash}, Filename: {filename}")
-            if img_count >= max_images:
-                return img_count
-        except Exception as e:
-            print(f"Failed to download image {img_src}: {e}")
-    else:
-        print(f"Already downloaded - Hash: {img_hash}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if owns_session:
+            session.close()
+
     return img_count
 
 
-def scrape_images(entity, max_images, save_dir=config.TRAIN_IMAGES_PATH):
+def iter_image_sources(driver, entity, handle_consent=True):
+    """
+    Search the images of an entity on Google Images and yield their source URLs as the page loads them.
+
+    Args:
+        driver (WebDriver): Selenium WebDriver instance.
+        entity (str): Entity string to search for images.
+        handle_consent (bool, optional): Whether to accept the cookies, only needed once per browser. Defaults to True.
+
+    Yields:
+        str: Image source URL (or data URI), in order of appearance.
+    """
+    url = f"https://www.google.com/search?q={entity} animal&tbm=isch"
+    with timer("scraper.page_load"):
+        driver.get(url)
+
+    if handle_consent:
+        handle_accept_button(driver)
+
+    yield from scroll_and_collect_images(driver)
+
+
+def scrape_images(entity, max_images, save_dir=config.TRAIN_IMAGES_PATH, driver_pool=None, dedup=config.DEDUP_ENABLED,
+                  sync_dedup=True):
     """
     Scrape images from Google Images based on the entity and save them to the specified directory.
 
@@ -155,41 +402,99 @@ def scrape_images(entity, max_images, save_dir=config.TRAIN_IMAGES_PATH):
         entity (str): Entity string to search for images.
         max_images (int): Maximum number of images to download.
         save_dir (str): Directory to save the downloaded images.
+        driver_pool (DriverPool, optional): Pool lending the browser. Defaults to None (a Chrome browser is started and quit).
+        dedup (bool, optional): Whether to skip the images already stored in any split. Defaults to config.DEDUP_ENABLED.
+        sync_dedup (bool, optional): Whether to index the stored images first. Defaults to True.
+
+    Returns:
+        int: Number of downloaded images.
     """
     entity_dir = os.path.join(save_dir, entity)
     os.makedirs(entity_dir, exist_ok=True)
     url_filename_mapping_file = os.path.join(save_dir, 'url_filename_mapping.json')
 
     # Load URL to Filename mapping for the specified entity
-    url_filename_mapping = load_url_filename_mapping(url_filename_mapping_file, entity)
-
-    chrome_options = setup_chrome_options()
-    driver = webdriver.Chrome(options=chrome_options)
-
-    url = f"https://www.google.com/search?q={entity} animal&tbm=isch"
-    driver.get(url)
-
-    handle_accept_button(driver)
+    with MAPPING_LOCK:
+        url_filename_mapping = load_url_filename_mapping(url_filename_mapping_file, entity)
 
     max_images = adjust_max_files(entity_dir, max_images)
     if max_images <= 0:
-        delete_last_files(entity_dir, entity, abs(max_images), url_filename_mapping_file)
-        return
+        with MAPPING_LOCK:
+            delete_last_files(entity_dir, entity, abs(max_images), url_filename_mapping_file)
+        return 0
+
+    # Each scraping thread has its own connection to the dedup index
+    dedup_index = open_dedup_index() if dedup else None
+    if dedup_index is not None and sync_dedup:
+        sync_dedup_index(dedup_index)
+
+    owns_pool = driver_pool is None
+    driver_pool = driver_pool or DriverPool(1, create_chrome_driver)
+    stats = {}
+    try:
+        # The sources are downloaded while the browser keeps scrolling, until max_images are saved
+        with driver_pool.session() as (driver, started):
+            img_srcs = iter_image_sources(driver, entity, handle_consent=started)
+            img_count = download_images(img_srcs, entity_dir, entity, url_filename_mapping, max_images, stats=stats,
+                                        dedup_index=dedup_index)
+    finally:
+        if owns_pool:
+            driver_pool.close()
+        if dedup_index is not None:
+            dedup_index.close()
+
+    with MAPPING_LOCK:
+        save_url_filename_mapping(url_filename_mapping_file, entity, url_filename_mapping)
+    print(f"Total images downloaded for {entity}: {img_count}")
+    print(f"Requests: {stats.get('requests', 0)}, Round trips saved: {stats.get('round_trips_saved', 0)}, "
+          f"Downloaded: {stats.get('bytes_downloaded', 0)} bytes, Saved: {stats.get('bytes_saved', 0)} bytes, Rejected: {stats.get('rejected', {})}")
+    return img_count
 
-    images = scroll_and_collect_images(driver, max_images)
 
-    img_count = 0
-    for i, img in enumerate(images):
-        if i < 3:
-            continue
-
-        img_src = img.get('src') or img.get('data-src')
-        if img_src and is_valid_image(img_src):
-            img_count = process_image(img_src, entity_dir, entity, url_filename_mapping, img_count, max_images)
-            if img_count >= max_images:
-                break
+def scrape_entities(entities, max_images, save_dir=config.TRAIN_IMAGES_PATH, num_browsers=config.SCRAPER_NUM_BROWSERS,
+                    driver_factory=None, dedup=config.DEDUP_ENABLED):
+    """
+    Scrape the images of several entities concurrently, with a bounded pool of reused browsers.
+
+    Each entity is scraped by one thread borrowing a browser from the pool. A browser whose
+    entity failed is quit and replaced, and the failure is reported without stopping the others.
 
-    save_url_filename_mapping(url_filename_mapping_file, entity, url_filename_mapping)
-    print(f"Total images downloaded: {img_count}")
+    Args:
+        entities (list): Entities to scrape.
+        max_images (int): Maximum number of images per entity.
+        save_dir (str, optional): Directory to save the downloaded images. Defaults to config.TRAIN_IMAGES_PATH.
+        num_browsers (int, optional): Maximum number of browsers, and of entities scraped at once. Defaults to config.SCRAPER_NUM_BROWSERS.
+        driver_factory (callable, optional): Function starting a driver. Defaults to None (create_chrome_driver).
+        dedup (bool, optional): Whether to skip the images already stored in any split. Defaults to config.DEDUP_ENABLED.
 
-    driver.quit()
+    Returns:
+        dict: Dictionary mapping each entity to its status ("ok" or "failed"), its number of
+              downloaded images, its duration in seconds and its error message.
+    """
+    if dedup:
+        # The stored images are indexed once, the entities then only add their own
+        dedup_index = open_dedup_index()
+        print(f"Dedup index synced: {sync_dedup_index(dedup_index)}")
+        dedup_index.close()
+
+    results = {}
+    with DriverPool(num_browsers, driver_factory or create_chrome_driver) as driver_pool:
+        def scrape(entity):
+            start_time = time.perf_counter()
+            try:
+                img_count = scrape_images(entity, max_images, save_dir, driver_pool, dedup, sync_dedup=False)
+                result = {"status": "ok", "images": img_count, "error": None}
+            except Exception as e:
+                result = {"status": "failed", "images": 0, "error": f"{type(e).__name__}: {e}"}
+            result["seconds"] = round(time.perf_counter() - start_time, 2)
+            return entity, result
+
+        with ThreadPoolExecutor(num_browsers) as executor:
+            futures = [executor.submit(scrape, entity) for entity in entities]
+            for future in as_completed(futures):
+                entity, result = future.result()
+                results[entity] = result
+                print(f"Finished scraping images for {entity} ({len(results)}/{len(entities)}) - {result['status']}, "
+                      f"{result['images']} images, {result['seconds']} s" + (f" - {result['error']}" if result["error"] else ""))
+
+    return {entity: results[entity] for entity in entities}
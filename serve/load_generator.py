@@ -0,0 +1,92 @@
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+import config.config as config
+
+
+def send_requests(url, img_bytes, num_requests, top_k):
+    """
+    Send prediction requests one after another over a single keep-alive connection.
+
+    Args:
+        url (str): Base URL of the prediction service.
+        img_bytes (bytes): Content of the image file to upload.
+        num_requests (int): Number of requests to send.
+        top_k (int): Number of top predictions to ask for.
+
+    Returns:
+        tuple: List of request latencies in ms, and number of failed requests.
+    """
+    latencies = []
+    errors = 0
+
+    with requests.Session() as session:
+        for _ in range(num_requests):
+            start_time = time.perf_counter()
+            try:
+                response = session.post(f"{url}/predict", params={"top_k": top_k}, data=img_bytes, timeout=30)
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+            except requests.RequestException:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+    return latencies, errors
+
+
+def run_load(url, img_path, concurrency, total_requests, top_k=config.SERVING_TOP_K):
+    """
+    Generate concurrent load on the prediction service and measure client-side latency and throughput.
+
+    Args:
+        url (str): Base URL of the prediction service.
+        img_path (str): Path to the image file to upload.
+        concurrency (int): Number of concurrent clients.
+        total_requests (int): Total number of requests to send.
+        top_k (int, optional): Number of top predictions to ask for. Defaults to config.SERVING_TOP_K.
+
+    Returns:
+        dict: Client-side counters and latency percentiles, and the server stats after the run.
+    """
+    with open(img_path, 'rb') as file:
+        img_bytes = file.read()
+
+    # Spread the requests over the clients
+    per_client = [total_requests // concurrency + (1 if i < total_requests % concurrency else 0) for i in range(concurrency)]
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda n: send_requests(url, img_bytes, n, top_k), per_client))
+    elapsed = time.perf_counter() - start_time
+
+    latencies = np.array([latency for client_latencies, _ in results for latency in client_latencies])
+    errors = sum(client_errors for _, client_errors in results)
+
+    return {
+        "concurrency": concurrency,
+        "requests": int(len(latencies)),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_per_sec": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+        "latency_p99_ms": round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+        "server_stats": requests.get(f"{url}/stats", timeout=10).json(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate load on the local prediction service.")
+    parser.add_argument("image", help="Image file to upload with every request.")
+    parser.add_argument("--url", default=f"http://{config.SERVING_HOST}:{config.SERVING_PORT}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=config.SERVING_TOP_K)
+    args = parser.parse_args()
+
+    print(json.dumps(run_load(args.url, args.image, args.concurrency, args.requests, args.top_k), indent=4))
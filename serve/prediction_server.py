@@ -0,0 +1,327 @@
+import io
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from tensorflow.keras.preprocessing import image # type: ignore
+
+import config.config as config
+from evaluate.backends import load_inference_model
+from evaluate.evaluate_model import predict_batch, rank_prediction
+from utils.file_utils import get_entity_list
+
+
+HTTP_STATUS_MESSAGES = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def create_server_state(model, classes, max_batch_size=config.SERVING_MAX_BATCH_SIZE, max_wait_ms=config.SERVING_MAX_WAIT_MS):
+    """
+    Create the shared state of the prediction service.
+
+    Args:
+        model (tf.keras.Model): Trained model for prediction.
+        classes (list): List of class names.
+        max_batch_size (int, optional): Maximum number of images per micro-batch. Defaults to config.SERVING_MAX_BATCH_SIZE.
+        max_wait_ms (float, optional): Maximum wait for a micro-batch to fill, in ms. Defaults to config.SERVING_MAX_WAIT_MS.
+
+    Returns:
+        dict: Server state with the model, the request queue and the counters.
+    """
+    return {
+        "model": model,
+        "classes": classes,
+        "max_batch_size": max_batch_size,
+        "max_wait_ms": max_wait_ms,
+        "queue": asyncio.Queue(),
+        "started_at": time.perf_counter(),
+        "requests": 0,
+        "errors": 0,
+        "batches": 0,
+        "batched_images": 0,
+        "latencies_ms": deque(maxlen=config.SERVING_LATENCY_WINDOW),
+    }
+
+
+def decode_image_bytes(img_bytes):
+    """
+    Decode uploaded image bytes and preprocess them for the model.
+
+    Args:
+        img_bytes (bytes): Content of the uploaded image file.
+
+    Returns:
+        np.ndarray: Image tensor of shape (150, 150, 3) scaled to [0, 1].
+    """
+    img = image.load_img(io.BytesIO(img_bytes), target_size=(150, 150))
+    img_tensor = image.img_to_array(img)
+    img_tensor /= 255.0
+    return img_tensor
+
+
+async def batching_loop(state):
+    """
+    Gather queued images into micro-batches and run one forward pass per micro-batch.
+
+    A micro-batch is closed when it reaches the maximum batch size or when the maximum
+    wait has elapsed since its first image was received.
+
+    Args:
+        state (dict): Server state.
+    """
+    loop = asyncio.get_running_loop()
+    queue = state["queue"]
+
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + state["max_wait_ms"] / 1000
+
+        while len(batch) < state["max_batch_size"]:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        try:
+            img_batch = np.stack([img_tensor for img_tensor, _ in batch])
+            # Run the model outside the event loop so requests keep being accepted
+            batch_scores = await loop.run_in_executor(None, predict_batch, state["model"], img_batch)
+
+            state["batches"] += 1
+            state["batched_images"] += len(batch)
+            for (_, future), image_scores in zip(batch, batch_scores):
+                if not future.done():
+                    future.set_result(image_scores)
+        except Exception as e:
+            # Only this micro-batch fails, the loop keeps serving the next requests
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+async def predict_image_tensor(state, img_tensor, top_k):
+    """
+    Predict the top entities of a decoded image through the micro-batching queue.
+
+    Args:
+        state (dict): Server state.
+        img_tensor (np.ndarray): Image tensor returned by decode_image_bytes.
+        top_k (int): Number of top predictions to return.
+
+    Returns:
+        list: List of dicts with the entity name and its score (%).
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    await state["queue"].put((img_tensor, future))
+    image_scores = await future
+
+    return [
+        {"entity": entity, "score": round(float(score) * 100, 2)}
+        for entity, score in rank_prediction(image_scores, state["classes"], top_k)
+    ]
+
+
+def get_stats(state):
+    """
+    Get the latency and throughput counters of the service.
+
+    Args:
+        state (dict): Server state.
+
+    Returns:
+        dict: Request, error and batch counts, average batch size, throughput and latency percentiles.
+    """
+    uptime = time.perf_counter() - state["started_at"]
+    latencies = np.array(state["latencies_ms"])
+
+    return {
+        "uptime_sec": round(uptime, 2),
+        "requests": state["requests"],
+        "errors": state["errors"],
+        "batches": state["batches"],
+        "avg_batch_size": round(state["batched_images"] / state["batches"], 2) if state["batches"] else None,
+        "throughput_per_sec": round(state["requests"] / uptime, 2) if uptime > 0 else None,
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+        "latency_p99_ms": round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+    }
+
+
+async def read_request(reader, max_body_bytes=config.SERVING_MAX_BODY_BYTES):
+    """
+    Read an HTTP/1.1 request from a connection.
+
+    Args:
+        reader (asyncio.StreamReader): Stream of the connection.
+        max_body_bytes (int, optional): Maximum size of the body. Defaults to config.SERVING_MAX_BODY_BYTES.
+
+    Returns:
+        tuple: Method, target, lowercase headers dict and body (None if it is larger than `max_body_bytes`,
+               it is left unread), or None if the connection was closed.
+
+    Raises:
+        ValueError: If the request line or the Content-Length header is malformed.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    content_length = int(headers.get("content-length", 0))
+    if content_length < 0:
+        raise ValueError(f"Negative Content-Length {content_length}")
+    if content_length > max_body_bytes:
+        return method, target, headers, None
+
+    body = await reader.readexactly(content_length)
+    return method, target, headers, body
+
+
+def write_response(writer, status, payload, keep_alive):
+    """
+    Write a JSON HTTP response to a connection.
+
+    Args:
+        writer (asyncio.StreamWriter): Stream of the connection.
+        status (int): HTTP status code.
+        payload (dict): JSON-serializable response body.
+        keep_alive (bool): Whether the connection stays open after the response.
+    """
+    body = json.dumps(payload).encode()
+    head = (
+        f"HTTP/1.1 {status} {HTTP_STATUS_MESSAGES[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+
+
+async def handle_connection(state, reader, writer):
+    """
+    Serve the requests of a client connection.
+
+    Routes:
+        POST /predict?top_k=K : body is the raw image file, returns the top K entities.
+        GET /stats : returns the latency and throughput counters.
+
+    Args:
+        state (dict): Server state.
+        reader (asyncio.StreamReader): Stream of the connection.
+        writer (asyncio.StreamWriter): Stream of the connection.
+    """
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except (ValueError, asyncio.IncompleteReadError):
+                write_response(writer, 400, {"error": "Malformed request"}, False)
+                break
+            if request is None:
+                break
+
+            method, target, headers, body = request
+            keep_alive = headers.get("connection", "").lower() != "close"
+            url = urlsplit(target)
+
+            if body is None:
+                # The body was not read, the connection cannot be reused
+                keep_alive = False
+                state["errors"] += 1
+                write_response(writer, 413, {"error": f"The body is larger than {config.SERVING_MAX_BODY_BYTES} bytes"}, keep_alive)
+            elif url.path == "/predict":
+                if method != "POST":
+                    write_response(writer, 405, {"error": "Use POST"}, keep_alive)
+                else:
+                    start_time = time.perf_counter()
+                    num_classes = len(state["classes"])
+                    try:
+                        top_k = int(parse_qs(url.query).get("top_k", [config.SERVING_TOP_K])[0])
+                    except ValueError:
+                        top_k = None
+                    if top_k is None or not 1 <= top_k <= num_classes:
+                        state["errors"] += 1
+                        write_response(writer, 400, {"error": f"top_k must be an integer between 1 and {num_classes}"}, keep_alive)
+                    else:
+                        try:
+                            img_tensor = await asyncio.get_running_loop().run_in_executor(None, decode_image_bytes, body)
+                        except Exception as e:
+                            # Only an invalid request is the fault of the client
+                            state["errors"] += 1
+                            write_response(writer, 400, {"error": f"Failed to decode image: {e}"}, keep_alive)
+                        else:
+                            try:
+                                predictions = await predict_image_tensor(state, img_tensor, top_k)
+                                write_response(writer, 200, {"predictions": predictions}, keep_alive)
+                                state["requests"] += 1
+                                state["latencies_ms"].append((time.perf_counter() - start_time) * 1000)
+                            except Exception as e:
+                                state["errors"] += 1
+                                write_response(writer, 500, {"error": f"Failed to predict image: {e}"}, keep_alive)
+            elif url.path == "/stats" and method == "GET":
+                write_response(writer, 200, get_stats(state), keep_alive)
+            else:
+                write_response(writer, 404, {"error": f"Unknown route {url.path}"}, keep_alive)
+
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def run_server(model, classes, host=config.SERVING_HOST, port=config.SERVING_PORT,
+                     max_batch_size=config.SERVING_MAX_BATCH_SIZE, max_wait_ms=config.SERVING_MAX_WAIT_MS):
+    """
+    Run the prediction service until it is cancelled.
+
+    Args:
+        model (tf.keras.Model): Trained model for prediction.
+        classes (list): List of class names.
+        host (str, optional): Host to listen on. Defaults to config.SERVING_HOST.
+        port (int, optional): Port to listen on. Defaults to config.SERVING_PORT.
+        max_batch_size (int, optional): Maximum number of images per micro-batch. Defaults to config.SERVING_MAX_BATCH_SIZE.
+        max_wait_ms (float, optional): Maximum wait for a micro-batch to fill, in ms. Defaults to config.SERVING_MAX_WAIT_MS.
+    """
+    state = create_server_state(model, classes, max_batch_size, max_wait_ms)
+    batcher = asyncio.create_task(batching_loop(state))
+
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(state, reader, writer), host, port)
+    print(f"Serving predictions on http://{host}:{port} (max batch size: {max_batch_size}, max wait: {max_wait_ms} ms)")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher.cancel()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve entity predictions of a model version over HTTP.")
+    parser.add_argument("--version", default=config.MODEL_LAST_VERSION, help="Model version to load from the versions directory.")
+    parser.add_argument("--backend", default=config.INFERENCE_BACKEND, help="Inference backend: keras, tflite-dynamic or tflite-int8.")
+    parser.add_argument("--host", default=config.SERVING_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVING_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=config.SERVING_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=config.SERVING_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    # Load the model version once for the whole lifetime of the service
+    model = load_inference_model(args.version, args.backend)
+    asyncio.run(run_server(model, get_entity_list(), args.host, args.port, args.max_batch_size, args.max_wait_ms))
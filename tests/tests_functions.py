@@ -1,22 +1,120 @@
+import io
 import os
 import json
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
 import pandas as pd
 import tensorflow as tf
+from PIL import Image
 
 import config.config as config
-from evaluate.evaluate_model import predictions_all_entities
-from evaluate.graphics import make_bar_plot_avg_difference_best_scores, make_bar_plot_avg_scores, make_box_plot_avg_rankings, make_box_plot_avg_score_percentage, transform_format_data
+from evaluate.evaluate_model import calculate_overall_statistics, compare_model_versions, compare_prediction_throughput, predictions_all_entities
+from evaluate.graphics import make_bar_plot_avg_difference_best_scores, make_bar_plot_avg_scores, make_box_plot_avg_rankings, make_box_plot_avg_score_percentage, transform_format_data, transform_format_records
+from evaluate.result_store import clear_model_version, open_result_store
+from evaluate.streaming import iter_prediction_records, read_records_jsonl, write_records_jsonl
 from utils.file_utils import get_entity_list, move_files
-from scraper.image_scraper import scrape_images
+from scraper.image_scraper import PAGE_STATE_SCRIPT, TAKE_IMAGE_SOURCES_SCRIPT, download_images, scrape_entities
 
 
 def _scrape_images_for_all_entities(max_images, save_dir):
     entities = get_entity_list()
 
-    for i, entity in enumerate(entities, start=1):
-        print(f"\n==========================\n\nScraping images for {entity}... ({i}/{config.NUM_ENTITIES})")
-        scrape_images(entity, max_images, save_dir)
-        print(f"Finished scraping images for {entity}")
+    # Entities are scraped concurrently by a pool of reused browsers
+    results = scrape_entities(entities, max_images, save_dir)
+    print(json.dumps(results, indent=4))
+
+
+class _ImageRequestHandler(BaseHTTPRequestHandler):
+    # The paths containing "bad" return an HTML page instead of an image
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if "bad" in self.path:
+            content_type, data = "text/html", b"<html>" + b"x" * config.MIN_IMAGE_SIZE_THRESHOLD
+        else:
+            buffer = io.BytesIO()
+            Image.fromarray(np.random.randint(0, 256, (150, 150, 3), dtype=np.uint8)).save(buffer, 'JPEG')
+            content_type, data = "image/jpeg", buffer.getvalue()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_image_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ImageRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def _download_images_from_local_server(num_images=30, max_images=10):
+    # Every third URL is not an image and must be rejected without being saved
+    server, base_url = _start_image_server()
+    img_srcs = [f"{base_url}{'bad' if i % 3 == 2 else 'ok'}{i}.jpg" for i in range(num_images)]
+    entity_dir = tempfile.mkdtemp()
+    try:
+        url_filename_mapping, stats = {}, {}
+        img_count = download_images(img_srcs, entity_dir, "test", url_filename_mapping, max_images, stats=stats)
+        num_files = len(os.listdir(entity_dir))
+    finally:
+        server.shutdown()
+        shutil.rmtree(entity_dir)
+
+    assert img_count == min(max_images, num_images - num_images // 3), f"{img_count} images saved"
+    assert num_files == len(url_filename_mapping) == img_count, "The saved files and the mapping differ"
+    print(json.dumps(stats, indent=4))
+
+
+class _FakeDriver:
+    # Results page listing local image URLs, the entity "broken" fails to load
+    base_url = None
+    num_running = 0
+
+    def __init__(self):
+        _FakeDriver.num_running += 1
+
+    def get(self, url):
+        entity = url.split("q=")[1].split(" ")[0]
+        if entity == "broken":
+            raise RuntimeError(f"Failed to load the page of {entity}")
+        self.pending = [f"{self.base_url}{entity}/ok{i}.jpg" for i in range(20)]
+
+    def execute_script(self, script):
+        if script == TAKE_IMAGE_SOURCES_SCRIPT:
+            img_srcs, self.pending = self.pending, []
+            return img_srcs
+        if script == PAGE_STATE_SCRIPT:
+            return [1000, len(self.pending)]
+        return 1000
+
+    def quit(self):
+        _FakeDriver.num_running -= 1
+
+
+def _scrape_entities_with_fake_drivers(max_images=5):
+    # A failing entity must not stop the others, and every browser must be quit at the end
+    server, _FakeDriver.base_url = _start_image_server()
+    save_dir = tempfile.mkdtemp()
+    try:
+        results = scrape_entities(["cat", "broken", "dog", "fox"], max_images, save_dir, num_browsers=2,
+                                  driver_factory=_FakeDriver, dedup=False)
+        num_files = {entity: len(os.listdir(os.path.join(save_dir, entity))) for entity in ("cat", "dog", "fox")}
+    finally:
+        server.shutdown()
+        shutil.rmtree(save_dir)
+
+    assert results["broken"]["status"] == "failed" and "RuntimeError" in results["broken"]["error"], results["broken"]
+    for entity, count in num_files.items():
+        assert results[entity]["status"] == "ok" and results[entity]["images"] == count == max_images, results[entity]
+    assert _FakeDriver.num_running == 0, f"{_FakeDriver.num_running} browsers were not quit"
+    print(json.dumps(results, indent=4))
 
 
 def _prediction_for_all_folders():
@@ -25,8 +123,56 @@ def _prediction_for_all_folders():
     # model = tf.keras.models.load_model('animal_classifier_models/v0.3.h5')
     # model = tf.keras.models.load_model('animal_classifier_models/v0.1.h5')
 
-    predictions = predictions_all_entities(model)
+    predictions = predictions_all_entities(model, model_version=config.MODEL_LAST_VERSION)
     print(json.dumps(predictions, indent=4))
+
+
+def _stream_prediction_for_all_folders():
+    model = tf.keras.models.load_model(f"{config.MODEL_VERSIONS_PATH}{config.MODEL_LAST_VERSION}.keras")
+
+    # Write each record as soon as it is computed instead of building one dict
+    file_path = f"{config.EVALUATION_RESULTS_PATH}{config.MODEL_LAST_VERSION}.jsonl"
+    count = write_records_jsonl(iter_prediction_records(model), file_path)
+    print(f"Wrote {count} records to {file_path}")
+
+
+def _prediction_for_all_versions(versions):
+    # Decode the evaluation images once and feed them to every version
+    comparison = compare_model_versions(versions)
+    print(json.dumps(comparison["overall"], indent=4))
+    print(json.dumps(comparison["entities"], indent=4))
+
+
+def _result_store_after_resave(version="result-store-check"):
+    # A version re-saved under the same name must not get the stored predictions of the previous model
+    model_path = f"{config.MODEL_VERSIONS_PATH}{version}.keras"
+    model = tf.keras.models.load_model(f"{config.MODEL_VERSIONS_PATH}{config.MODEL_LAST_VERSION}.keras")
+    model.save(model_path)
+    try:
+        first = calculate_overall_statistics(predictions_all_entities(model, model_version=version))
+
+        # Same architecture, new weights
+        resaved = tf.keras.models.clone_model(model)
+        resaved.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
+        resaved.save(model_path)
+        second = calculate_overall_statistics(predictions_all_entities(resaved, model_version=version))
+        fresh = calculate_overall_statistics(predictions_all_entities(resaved))
+    finally:
+        os.remove(model_path)
+        connection = open_result_store()
+        clear_model_version(connection, version)
+        connection.close()
+
+    assert second != first, "The stored predictions of the previous model were returned"
+    assert second == fresh, "The predictions of the re-saved model differ from a fresh evaluation"
+    print(json.dumps({"first": first, "resaved": second}, indent=4))
+
+
+def _compare_prediction_throughput():
+    model = tf.keras.models.load_model(f"{config.MODEL_VERSIONS_PATH}{config.MODEL_LAST_VERSION}.keras")
+
+    throughput = compare_prediction_throughput(model)
+    print(json.dumps(throughput, indent=4))
     
     
 def _move_20percents_files():
@@ -49,7 +195,7 @@ def _move_20percents_files():
 
 
 def _make_evaluation_graphics():
-    model = tf.keras.models.load_model(f"./models/{config.MODEL_LAST_VERSION}.keras")
+    model = tf.keras.models.load_model(f"{config.MODEL_VERSIONS_PATH}{config.MODEL_LAST_VERSION}.keras")
     predictions = predictions_all_entities(model)
     print(predictions)
     global_data, individual_data = transform_format_data(predictions)
@@ -62,10 +208,28 @@ def _make_evaluation_graphics():
     make_box_plot_avg_rankings(individual_df)
 
 
+def _make_evaluation_graphics_from_records(file_path):
+    global_data, individual_data = transform_format_records(read_records_jsonl(file_path))
+    global_df = pd.DataFrame(global_data)
+    individual_df = pd.DataFrame(individual_data)
+
+    make_bar_plot_avg_scores(global_df)
+    make_bar_plot_avg_difference_best_scores(global_df)
+    make_box_plot_avg_score_percentage(individual_df)
+    make_box_plot_avg_rankings(individual_df)
+
+
 def _main():
     # _scrape_images_for_all_entities(15, config.TRAIN_IMAGES_PATH)
     # _scrape_images_for_all_entities(15, config.EVALUATION_IMAGES_PATH)
+    # _download_images_from_local_server()
+    # _scrape_entities_with_fake_drivers()
     _prediction_for_all_folders()
+    # _stream_prediction_for_all_folders()
+    # _prediction_for_all_versions(["v0.1", "v0.3"])
+    # _compare_prediction_throughput()
+    # _result_store_after_resave()
     # _move_20percents_files()
     # _make_evaluation_graphics()
+    # _make_evaluation_graphics_from_records(f"{config.EVALUATION_RESULTS_PATH}{config.MODEL_LAST_VERSION}.jsonl")
     pass
\ No newline at end of file
@@ -0,0 +1,285 @@
+import io
+import os
+import sqlite3
+import hashlib
+from PIL import Image
+
+import config.config as config
+
+
+# The 64-bit dHash is split into 4 bands of 16 bits: two hashes at a Hamming distance of at most 3
+# have at least one identical band, so near duplicates are only searched among the images sharing a band
+NUM_BANDS = 4
+BAND_BITS = 64 // NUM_BANDS
+MAX_DISTANCE = NUM_BANDS - 1
+
+SPLIT_DIRS = (config.TRAIN_IMAGES_PATH, config.VALIDATION_IMAGES_PATH, config.EVALUATION_IMAGES_PATH)
+
+
+def open_dedup_index(db_path=config.DEDUP_INDEX_DB_PATH):
+    """
+    Open the SQLite dedup index of the stored images, creating its table if needed.
+
+    Args:
+        db_path (str): Path to the SQLite database.
+
+    Returns:
+        sqlite3.Connection: Connection to the dedup index.
+    """
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    # Several entities can be scraped concurrently, each with its own connection
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS images ("
+        "path TEXT PRIMARY KEY, split TEXT, entity TEXT, size INTEGER, mtime INTEGER, content_hash TEXT, dhash TEXT, "
+        + ", ".join(f"band{i} INTEGER" for i in range(NUM_BANDS)) + ")"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS images_content_hash ON images (content_hash)")
+    for i in range(NUM_BANDS):
+        connection.execute(f"CREATE INDEX IF NOT EXISTS images_band{i} ON images (band{i})")
+    return connection
+
+
+def hash_content(img_data):
+    """
+    Generate an MD5 hash of the content of an image.
+
+    Args:
+        img_data (bytes): Content of the image file.
+
+    Returns:
+        str: The MD5 hash of the content.
+    """
+    return hashlib.md5(img_data).hexdigest()
+
+
+def compute_dhash(img_data):
+    """
+    Compute the difference hash of an image: 64 bits comparing the brightness of neighbouring pixels of a 9x8 thumbnail.
+
+    Resized, recompressed or slightly edited copies of an image keep a dHash at a small Hamming distance.
+
+    Args:
+        img_data (bytes): Content of the image file.
+
+    Returns:
+        int: The 64-bit dHash, or None if the image cannot be decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(img_data)) as img:
+            pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            dhash = (dhash << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return dhash
+
+
+def get_bands(dhash):
+    """
+    Split a dHash into the bands used to look up near duplicates.
+
+    Args:
+        dhash (int): The 64-bit dHash.
+
+    Returns:
+        list: The NUM_BANDS bands, as integers of BAND_BITS bits.
+    """
+    mask = (1 << BAND_BITS) - 1
+    return [(dhash >> (i * BAND_BITS)) & mask for i in range(NUM_BANDS)]
+
+
+def check_max_distance(max_distance):
+    """
+    Check that near duplicates at a Hamming distance up to `max_distance` are all found by the band lookup.
+
+    Args:
+        max_distance (int): Maximum Hamming distance between near duplicates.
+
+    Raises:
+        ValueError: If `max_distance` is above MAX_DISTANCE, pairs sharing no band would be missed.
+    """
+    if max_distance > MAX_DISTANCE:
+        raise ValueError(f"The maximum distance is {max_distance}, the {NUM_BANDS} bands only find near duplicates "
+                         f"at a distance of at most {MAX_DISTANCE}")
+
+
+def find_duplicate(connection, content_hash, dhash, max_distance=config.DEDUP_MAX_DISTANCE, exclude_path=None):
+    """
+    Find a stored image identical or nearly identical to an image.
+
+    Exact copies are found through the index of the content hashes, near duplicates among the
+    images sharing a band of their dHash. Entries of deleted files are removed on the way.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the dedup index.
+        content_hash (str): Content hash of the image.
+        dhash (int): dHash of the image, or None to only look for exact copies.
+        max_distance (int, optional): Maximum Hamming distance between near duplicates, at most MAX_DISTANCE.
+                                      Defaults to config.DEDUP_MAX_DISTANCE.
+        exclude_path (str, optional): Path of the image itself, when it is already indexed. Defaults to None.
+
+    Returns:
+        dict: Path, split and entity of the duplicate, whether it is an exact copy and the Hamming distance of their dHash, or None.
+    """
+    check_max_distance(max_distance)
+    candidates = [
+        (path, split, entity, True, 0)
+        for path, split, entity in connection.execute(
+            "SELECT path, split, entity FROM images WHERE content_hash = ?", (content_hash,))
+    ]
+
+    if dhash is not None and max_distance >= 0:
+        bands = get_bands(dhash)
+        conditions = " OR ".join(f"band{i} = ?" for i in range(NUM_BANDS))
+        for path, split, entity, other_dhash in connection.execute(
+                f"SELECT path, split, entity, dhash FROM images WHERE dhash IS NOT NULL AND ({conditions})", bands):
+            distance = bin(dhash ^ int(other_dhash, 16)).count('1')
+            if distance <= max_distance:
+                candidates.append((path, split, entity, False, distance))
+
+    # Exact copies first, then the closest near duplicates
+    for path, split, entity, exact, distance in sorted(candidates, key=lambda candidate: (not candidate[3], candidate[4])):
+        if path == exclude_path:
+            continue
+        if not os.path.exists(path):
+            remove_image(connection, path)
+            continue
+        return {"path": path, "split": split, "entity": entity, "exact": exact, "distance": distance}
+    return None
+
+
+def add_image(connection, img_path, content_hash, dhash, split=None, entity=None):
+    """
+    Add or update a stored image in the dedup index.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the dedup index.
+        img_path (str): Path to the image file.
+        content_hash (str): Content hash of the image.
+        dhash (int): dHash of the image, or None if it cannot be decoded.
+        split (str, optional): Split of the image. Defaults to None (name of the split directory).
+        entity (str, optional): Entity of the image. Defaults to None (name of the entity directory).
+    """
+    abs_path = os.path.abspath(img_path)
+    entity_dir = os.path.dirname(abs_path)
+    split = split or os.path.basename(os.path.dirname(entity_dir))
+    entity = entity or os.path.basename(entity_dir)
+    stat = os.stat(abs_path)
+    bands = get_bands(dhash) if dhash is not None else [None] * NUM_BANDS
+
+    with connection:
+        connection.execute(
+            f"INSERT OR REPLACE INTO images VALUES ({', '.join('?' * (7 + NUM_BANDS))})",
+            (abs_path, split, entity, stat.st_size, stat.st_mtime_ns, content_hash,
+             f"{dhash:016x}" if dhash is not None else None, *bands)
+        )
+
+
+def remove_image(connection, img_path):
+    """
+    Remove an image from the dedup index.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the dedup index.
+        img_path (str): Path to the image file.
+    """
+    with connection:
+        connection.execute("DELETE FROM images WHERE path = ?", (os.path.abspath(img_path),))
+
+
+def sync_dedup_index(connection, split_dirs=SPLIT_DIRS):
+    """
+    Index the images of the splits, only hashing the files whose size or modification time changed.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the dedup index.
+        split_dirs (iterable, optional): Directories with one subdirectory per entity. Defaults to the train, validation and evaluation splits.
+
+    Returns:
+        dict: Number of images indexed, already up to date and removed because their file is gone.
+    """
+    known_files = {path: (size, mtime) for path, size, mtime in connection.execute("SELECT path, size, mtime FROM images")}
+    stats = {"indexed": 0, "unchanged": 0, "removed": 0}
+    found = set()
+
+    for split_dir in split_dirs:
+        if not os.path.isdir(split_dir):
+            continue
+        for entity in sorted(os.listdir(split_dir)):
+            entity_dir = os.path.join(split_dir, entity)
+            if not os.path.isdir(entity_dir):
+                continue
+            for filename in sorted(os.listdir(entity_dir)):
+                abs_path = os.path.abspath(os.path.join(entity_dir, filename))
+                found.add(abs_path)
+                stat = os.stat(abs_path)
+                if known_files.get(abs_path) == (stat.st_size, stat.st_mtime_ns):
+                    stats["unchanged"] += 1
+                    continue
+                with open(abs_path, 'rb') as file:
+                    img_data = file.read()
+                add_image(connection, abs_path, hash_content(img_data), compute_dhash(img_data))
+                stats["indexed"] += 1
+
+    # Only the images of the synced splits are checked for deletion
+    split_prefixes = tuple(os.path.join(os.path.abspath(split_dir), '') for split_dir in split_dirs)
+    for path in known_files:
+        if path.startswith(split_prefixes) and path not in found:
+            remove_image(connection, path)
+            stats["removed"] += 1
+
+    return stats
+
+
+def find_duplicate_groups(connection, max_distance=config.DEDUP_MAX_DISTANCE):
+    """
+    Find the pairs of indexed images that are identical or nearly identical, within and across splits.
+
+    Pairs across splits are leaks: the same picture is seen in training and used for validation or evaluation.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the dedup index.
+        max_distance (int, optional): Maximum Hamming distance between near duplicates, at most MAX_DISTANCE.
+                                      Defaults to config.DEDUP_MAX_DISTANCE.
+
+    Returns:
+        dict: "leaks" (pairs across splits) and "duplicates" (pairs within a split), each pair with the
+              paths, splits and entities of both images, whether they are exact copies and their distance.
+    """
+    check_max_distance(max_distance)
+    rows = list(connection.execute("SELECT path, split, entity, content_hash, dhash FROM images"))
+    groups = {"leaks": [], "duplicates": []}
+    seen_pairs = set()
+
+    for path, split, entity, content_hash, dhash in rows:
+        dhash = int(dhash, 16) if dhash is not None else None
+        candidates = [(other_path, True, 0) for (other_path,) in connection.execute(
+            "SELECT path FROM images WHERE content_hash = ? AND path != ?", (content_hash, path))]
+        if dhash is not None:
+            conditions = " OR ".join(f"band{i} = ?" for i in range(NUM_BANDS))
+            for other_path, other_dhash in connection.execute(
+                    f"SELECT path, dhash FROM images WHERE path != ? AND dhash IS NOT NULL AND ({conditions})", (path, *get_bands(dhash))):
+                distance = bin(dhash ^ int(other_dhash, 16)).count('1')
+                if distance <= max_distance:
+                    candidates.append((other_path, False, distance))
+
+        for other_path, exact, distance in candidates:
+            pair = tuple(sorted((path, other_path)))
+            if pair in seen_pairs:
+                continue
+            seen_pairs.add(pair)
+            other_split, other_entity = connection.execute(
+                "SELECT split, entity FROM images WHERE path = ?", (other_path,)).fetchone()
+            groups["leaks" if other_split != split else "duplicates"].append({
+                "paths": [path, other_path],
+                "splits": [split, other_split],
+                "entities": [entity, other_entity],
+                "exact": exact,
+                "distance": distance,
+            })
+
+    return groups
@@ -1,34 +1,102 @@
 import requests
 import base64
 
+import config.config as config
 
-def is_valid_image(url):
+
+# Leading bytes of the accepted image formats, with their extension
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+
+
+def is_excluded_url(url):
     """
-    Check if a URL points to a valid image.
+    Check if a URL contains keywords indicating non-image files (logos, icons, sprites).
 
     Args:
         url (str): URL of the image.
 
     Returns:
-        bool: True if the image is valid, False otherwise.
+        bool: True if the URL should not be downloaded.
     """
-    # Check if the URL contains certain keywords indicating non-image files
-    if 'logo' in url or 'icon' in url or 'sprite' in url:
-        return False
-    
-    # Check if the URL returns a valid image
-    try:
-        response = requests.head(url)
-        content_type = response.headers['content-type']
-        if 'image' in content_type:
-            return True
-        else:
-            return False
-    except:
-        # If an error occurs (e.g., URL is not reachable), consider it as an invalid image
-        return False
-    
-    
+    return 'logo' in url or 'icon' in url or 'sprite' in url
+
+
+def sniff_image_type(data):
+    """
+    Detect the format of an image from its first bytes.
+
+    Args:
+        data (bytes): First bytes of the file (at least 12).
+
+    Returns:
+        str: Extension of the format (jpeg, png, gif or webp), or None if it is not a supported image.
+    """
+    # WebP files are RIFF containers: "RIFF", the size on 4 bytes, then "WEBP"
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    for signature, img_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return img_type
+    return None
+
+
+def download_image(url, session=None, timeout=None, min_size=config.MIN_IMAGE_SIZE_THRESHOLD, chunk_size=65536):
+    """
+    Validate and download an image with a single streamed GET request.
+
+    The download stops as soon as the status, the content-type, the Content-Length or
+    the magic bytes of the first chunk show that the URL is not a usable image.
+
+    Args:
+        url (str): URL of the image.
+        session (requests.Session, optional): Session whose pooled connections are reused. Defaults to None.
+        timeout (float or tuple, optional): Connect and read timeouts, in seconds. Defaults to None.
+        min_size (int, optional): Minimum announced size, in bytes. Defaults to config.MIN_IMAGE_SIZE_THRESHOLD.
+        chunk_size (int, optional): Size of the chunks read from the response, in bytes. Defaults to 65536.
+
+    Returns:
+        dict: The image data and extension (None if rejected), the reason ("ok", "status", "content-type",
+              "too-small" or "signature"), the bytes read and the announced size (None if unknown).
+    """
+    result = {"data": None, "type": None, "reason": "ok", "bytes_read": 0, "content_length": None}
+    with (session or requests).get(url, stream=True, timeout=timeout) as response:
+        content_length = response.headers.get('content-length')
+        result["content_length"] = int(content_length) if content_length and content_length.isdigit() else None
+
+        if response.status_code != 200:
+            result["reason"] = "status"
+        elif 'image' not in response.headers.get('content-type', ''):
+            result["reason"] = "content-type"
+        elif result["content_length"] is not None and result["content_length"] < min_size:
+            result["reason"] = "too-small"
+        if result["reason"] != "ok":
+            return result
+
+        chunks = []
+        for chunk in response.iter_content(chunk_size):
+            chunks.append(chunk)
+            result["bytes_read"] += len(chunk)
+            # The signature is checked once the first 12 bytes arrived
+            if result["type"] is None and result["bytes_read"] >= 12:
+                result["type"] = sniff_image_type(b''.join(chunks)[:12])
+                if result["type"] is None:
+                    result["reason"] = "signature"
+                    return result
+
+    data = b''.join(chunks)
+    result["type"] = result["type"] or sniff_image_type(data)
+    if result["type"] is None:
+        result["reason"] = "signature"
+        return result
+    result["data"] = data
+    return result
+
+
 def save_base64_image(base64_data, filename):
     """
     Save a base64 encoded image data to a file.
@@ -0,0 +1,29 @@
+import time
+import numpy as np
+
+import config.config as config
+
+
+def measure_batch_latency(model, batch_size=config.EVALUATION_BATCH_SIZE, runs=20):
+    """
+    Measure the median latency of a forward pass over a batch of random images.
+
+    Args:
+        model (tf.keras.Model or TFLiteModel): Model exposing `predict_on_batch`.
+        batch_size (int, optional): Number of images per batch. Defaults to config.EVALUATION_BATCH_SIZE.
+        runs (int, optional): Number of timed forward passes. Defaults to 20.
+
+    Returns:
+        float: Median latency of a forward pass, in ms.
+    """
+    img_batch = np.random.rand(batch_size, 150, 150, 3).astype(np.float32)
+
+    # Warm up so graph tracing and tensor allocation are not timed
+    model.predict_on_batch(img_batch)
+
+    latencies = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        model.predict_on_batch(img_batch)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return float(np.median(latencies))
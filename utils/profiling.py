@@ -0,0 +1,191 @@
+import time
+import cProfile
+import functools
+import threading
+import contextlib
+
+import config.config as config
+
+
+# Shared state of the instrumentation, timings are [calls, total seconds, max seconds]
+_state = {"enabled": config.PROFILING_ENABLED, "started_at": time.perf_counter()}
+_timings = {}
+_counters = {}
+_lock = threading.Lock()
+
+# Reusable context manager returned by timer() when profiling is disabled
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def enable_profiling(enabled=True):
+    """
+    Enable or disable the stage timers and counters, and reset them.
+
+    Args:
+        enabled (bool, optional): Whether to record timings and counters. Defaults to True.
+    """
+    _state["enabled"] = enabled
+    reset_profiling()
+
+
+def is_profiling_enabled():
+    """
+    Check whether the stage timers and counters are recording.
+
+    Returns:
+        bool: True if profiling is enabled.
+    """
+    return _state["enabled"]
+
+
+def reset_profiling():
+    """
+    Clear the recorded timings and counters.
+    """
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+        _state["started_at"] = time.perf_counter()
+
+
+def record_timing(name, elapsed):
+    """
+    Record the duration of one execution of a stage.
+
+    Args:
+        name (str): Name of the stage (e.g. "scraper.download").
+        elapsed (float): Duration of the execution, in seconds.
+    """
+    with _lock:
+        timing = _timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+
+
+@contextlib.contextmanager
+def _timer(name):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start_time)
+
+
+def timer(name):
+    """
+    Context manager timing a stage. Does nothing when profiling is disabled.
+
+    Args:
+        name (str): Name of the stage (e.g. "scraper.download").
+
+    Returns:
+        contextlib.AbstractContextManager: The timing context manager.
+    """
+    if not _state["enabled"]:
+        return _NULL_TIMER
+    return _timer(name)
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as a stage.
+
+    Args:
+        name (str): Name of the stage (e.g. "evaluate.decode").
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state["enabled"]:
+                return function(*args, **kwargs)
+            with _timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name, value=1):
+    """
+    Increment a counter. Does nothing when profiling is disabled.
+
+    Args:
+        name (str): Name of the counter (e.g. "scraper.bytes_downloaded").
+        value (int, optional): Value to add. Defaults to 1.
+    """
+    if not _state["enabled"]:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get_profiling_summary():
+    """
+    Get the recorded timings and counters.
+
+    Returns:
+        dict: Wall time since the last reset, and the calls, total, mean and max time of each stage, and the counters.
+    """
+    with _lock:
+        stages = {
+            name: {
+                "calls": calls,
+                "total_sec": round(total, 4),
+                "mean_ms": round(total / calls * 1000, 3),
+                "max_ms": round(maximum * 1000, 3),
+            }
+            for name, (calls, total, maximum) in _timings.items()
+        }
+        counters = dict(_counters)
+
+    return {
+        "wall_time_sec": round(time.perf_counter() - _state["started_at"], 4),
+        "stages": stages,
+        "counters": counters,
+    }
+
+
+def print_profiling_summary():
+    """
+    Print the recorded timings and counters as a table, slowest stage first.
+    """
+    summary = get_profiling_summary()
+    wall_time = summary["wall_time_sec"]
+
+    print(f"\n--- Stage timings (wall time: {wall_time:.2f} s) ---")
+    print(f"{'stage':<32} {'calls':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10} {'% wall':>8}")
+    for name, stage in sorted(summary["stages"].items(), key=lambda item: item[1]["total_sec"], reverse=True):
+        # Stages may overlap (nested stages or worker threads), so percentages can exceed 100
+        share = stage["total_sec"] / wall_time * 100 if wall_time > 0 else 0
+        print(f"{name:<32} {stage['calls']:>8} {stage['total_sec']:>10.3f} {stage['mean_ms']:>10.2f} {stage['max_ms']:>10.2f} {share:>7.1f}%")
+
+    if summary["counters"]:
+        print("\n--- Counters ---")
+        for name, value in sorted(summary["counters"].items()):
+            print(f"{name:<32} {value:>12}")
+
+
+@contextlib.contextmanager
+def profile_run(output_path=config.PROFILING_CPROFILE_PATH):
+    """
+    Context manager dumping cProfile statistics of the enclosed code.
+
+    Args:
+        output_path (str, optional): Path of the .prof dump, readable with pstats or snakeviz.
+                                     Defaults to config.PROFILING_CPROFILE_PATH (None disables the dump).
+    """
+    if not output_path:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_path)
+        print(f"cProfile statistics saved to {output_path}")
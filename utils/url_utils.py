@@ -2,6 +2,8 @@ import os
 import json
 import hashlib
 
+from utils.profiling import timed
+
 
 def hash_url(url):
     """
@@ -16,6 +18,7 @@ def hash_url(url):
     return hashlib.md5(url.encode()).hexdigest()
 
 
+@timed("url_utils.json_load")
 def load_url_filename_mapping(file_path, entity_name=None):
     """
     Load URL-Filename mapping from a JSON file, optionally for a specific entity.
@@ -43,6 +46,7 @@ def load_url_filename_mapping(file_path, entity_name=None):
     return {}
 
 
+@timed("url_utils.json_save")
 def save_url_filename_mapping(file_path, entity_name, mapping):
     """
     Save URL-Filename mapping for an entity to a JSON file.